@@ -0,0 +1,120 @@
+import argparse
+import json
+import os
+import time
+
+import dask.array as da
+import xgboost as xgb
+import xgboost.dask
+from dask.distributed import Client, LocalCluster
+
+from benchmark_output_format import generate_dataset
+
+
+def get_params(tree_method, nthread):
+    """Booster parameters of default pipeline hyperparameters."""
+    return {
+        "objective": "reg:squarederror",
+        "max_depth": 3,
+        "eta": 0.3,
+        "gamma": 3,
+        "min_child_weight": 5,
+        "subsample": 0.8,
+        "tree_method": tree_method,
+        "nthread": nthread,
+    }
+
+
+def train_threads(data, n_workers, args):
+    """Single process, boosting with n_workers threads, as training script does on one instance."""
+    dtrain = xgb.DMatrix(data[:, 1:], label=data[:, 0], nthread=n_workers)
+    start = time.perf_counter()
+    xgb.train(get_params(args.tree_method, n_workers), dtrain, num_boost_round=args.rounds)
+    return time.perf_counter() - start
+
+
+def train_dask(data, n_workers, args):
+    """n_workers single-threaded workers, each holding its own row partition, as hosts of distributed training do."""
+    with LocalCluster(n_workers=n_workers, threads_per_worker=1, processes=True) as cluster, Client(cluster) as client:
+        X = da.from_array(data[:, 1:], chunks=(-(-len(data) // n_workers), -1)).persist()
+        y = da.from_array(data[:, 0], chunks=X.chunks[0]).persist()
+        dtrain = xgb.dask.DaskDMatrix(client, X, y)
+        start = time.perf_counter()
+        xgb.dask.train(client, get_params(args.tree_method, 1), dtrain, num_boost_round=args.rounds)
+        return time.perf_counter() - start
+
+
+methods = {
+    "threads": train_threads,
+    "dask": train_dask,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser("benchmark_distributed_training")
+    parser.add_argument(
+        "-n", "--rows",
+        type=int,
+        nargs="+",
+        dest="rows",
+        default=[1000000, 10000000],
+        help="Number of dataset rows to benchmark with."
+    )
+    parser.add_argument(
+        "-w", "--workers",
+        type=int,
+        dest="workers",
+        default=os.cpu_count(),
+        help="Maximum number of workers, throughput is measured for 1 up to this number of workers."
+    )
+    parser.add_argument(
+        "-r", "--rounds",
+        type=int,
+        dest="rounds",
+        default=20,
+        help="Number of boosting rounds."
+    )
+    parser.add_argument(
+        "--tree-method",
+        type=str,
+        dest="tree_method",
+        default="hist",
+        help="XGBoost tree method."
+    )
+    parser.add_argument(
+        "-o", "--output",
+        type=str,
+        dest="output",
+        default=None,
+        help="Optional path of JSON file to store results."
+    )
+    args = parser.parse_args()
+
+    report = {}
+    print(f"{'rows':>10} {'method':>8} {'workers':>8} {'time [s]':>10} {'rows/s per round':>17} {'speedup':>8}")
+    for n_rows in args.rows:
+        data = generate_dataset(n_rows).astype("float32")
+        results = {}
+        for name, method in methods.items():
+            results[name] = {}
+            for n_workers in range(1, args.workers + 1):
+                seconds = method(data, n_workers, args)
+                speedup = results[name][1]["seconds"] / seconds if n_workers > 1 else 1.0
+                results[name][n_workers] = {
+                    "seconds": seconds,
+                    "rows_per_second": n_rows * args.rounds / seconds,
+                    "speedup": speedup,
+                }
+                print(
+                    f"{n_rows:>10} {name:>8} {n_workers:>8} {seconds:>10.3f} "
+                    f"{n_rows * args.rounds / seconds:>17.0f} {speedup:>8.2f}"
+                )
+        report[n_rows] = results
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+import argparse
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+
+def generate_dataset(n_rows, seed=0):
+    """Generates data shaped like prepared abalone dataset: label, 7 scaled numeric and 3 one-hot columns."""
+    rng = np.random.default_rng(seed)
+    label = rng.integers(1, 30, size=(n_rows, 1)).astype(np.float64)
+    numeric = rng.standard_normal(size=(n_rows, 7))
+    onehot = np.eye(3)[rng.integers(0, 3, size=n_rows)]
+    return np.concatenate((label, numeric, onehot), axis=1)
+
+
+def write_csv(data, path):
+    pd.DataFrame(data).to_csv(path, header=False, index=False)
+
+
+def read_csv(path):
+    return pd.read_csv(path, header=None)
+
+
+def write_parquet(data, path):
+    table = pa.Table.from_arrays(
+        [pa.array(data[:, i]) for i in range(data.shape[1])],
+        names=[str(i) for i in range(data.shape[1])]
+    )
+    pq.write_table(table, path)
+
+
+def read_parquet(path):
+    return pd.read_parquet(path)
+
+
+formats = {
+    "csv": (write_csv, read_csv),
+    "parquet": (write_parquet, read_parquet),
+}
+
+
+def benchmark(data, output_dir, repeat):
+    results = {}
+    for name, (write, read) in formats.items():
+        path = os.path.join(output_dir, f"train.{name}")
+        write_times, read_times = [], []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            write(data, path)
+            write_times.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            read(path)
+            read_times.append(time.perf_counter() - start)
+
+        results[name] = {
+            "write_seconds": min(write_times),
+            "read_seconds": min(read_times),
+            "size_bytes": os.path.getsize(path),
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser("benchmark_output_format")
+    parser.add_argument(
+        "-n", "--rows",
+        type=int,
+        nargs="+",
+        dest="rows",
+        default=[100000, 1000000],
+        help="Number of dataset rows to benchmark with."
+    )
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        dest="repeat",
+        default=3,
+        help="Number of repetitions, best time is reported."
+    )
+    parser.add_argument(
+        "-o", "--output",
+        type=str,
+        dest="output",
+        default=None,
+        help="Optional path of JSON file to store results."
+    )
+    args = parser.parse_args()
+
+    report = {}
+    print(f"{'rows':>10} {'format':>8} {'write [s]':>10} {'read [s]':>10} {'size [MB]':>10}")
+    for n_rows in args.rows:
+        data = generate_dataset(n_rows)
+        with tempfile.TemporaryDirectory() as output_dir:
+            results = benchmark(data, output_dir, args.repeat)
+        for name, result in results.items():
+            print(
+                f"{n_rows:>10} {name:>8} {result['write_seconds']:>10.3f} "
+                f"{result['read_seconds']:>10.3f} {result['size_bytes'] / 2 ** 20:>10.2f}"
+            )
+        report[n_rows] = results
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+# Benchmarked functions are imported from data preparation script, the same way processing job imports shared modules
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "pipelines", "showcase"))
+import preprocess
+from common.features import FeatureTransformer, label_column, numeric_features
+from common.profiling import Profiler
+
+
+def generate_raw_dataset(n_rows, seed=0):
+    """Generates raw data shaped like abalone dataset: categorical sex, 7 numeric features and rings label."""
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({name: rng.random(n_rows) for name in numeric_features})
+    df.insert(0, "sex", np.array(["M", "F", "I"], dtype=object)[rng.integers(0, 3, size=n_rows)])
+    df[label_column] = rng.integers(1, 30, size=n_rows).astype(np.float64)
+    return df
+
+
+def get_transformer():
+    return FeatureTransformer(
+        {name: {"median": 0.5, "mean": 0.5, "scale": 0.29} for name in numeric_features},
+        {"sex": ["F", "I", "M"]}
+    )
+
+
+class NullWriter:
+    """Discards written rows, so that split is measured without cost of output format."""
+
+    def write(self, data):
+        pass
+
+    def close(self):
+        pass
+
+
+def open_writers(output_format, output_dir):
+    if output_format == "none":
+        return [NullWriter() for _ in range(3)]
+    return preprocess.open_split_writers(output_dir, output_format, "benchmark")
+
+
+def split_copy(df, y, transformer, writers, block_size, seed, stratify_bins):
+    """Previous in-memory split: transformed float64 copy of all rows is shuffled and split into copies."""
+    X = np.concatenate((y.reshape(len(y), 1), transformer.transform(df)), axis=1)
+    np.random.shuffle(X)
+    for writer, data in zip(writers, np.split(X, [int(0.7 * len(X)), int(0.85 * len(X))])):
+        writer.write(data)
+        writer.close()
+
+
+def split_index(dtype):
+    def split(df, y, transformer, writers, block_size, seed, stratify_bins):
+        """Shuffled index is split and rows are transformed and written block by block."""
+        strata = preprocess.get_label_strata(y, stratify_bins) if stratify_bins > 1 else None
+        splits = preprocess.split_indices(len(df), preprocess.get_split_rng(seed, 0), strata)
+        for writer, indices in zip(writers, splits):
+            preprocess.write_split(writer, transformer, df, y, indices, block_size, dtype, Profiler("benchmark"))
+    return split
+
+
+methods = {
+    "copy": split_copy,
+    "index": split_index("float64"),
+    "index-float32": split_index("float32"),
+}
+
+
+def run_method(name, n_rows, args, trace, queue):
+    """Runs method in fresh process, so that peak RSS of every method is measured separately."""
+    df = generate_raw_dataset(n_rows)
+    y = df.pop(label_column).to_numpy()
+    transformer = get_transformer()
+    with tempfile.TemporaryDirectory() as output_dir:
+        for split in ("train", "validation", "test"):
+            os.makedirs(os.path.join(output_dir, split))
+        writers = open_writers(args.format, output_dir)
+        if trace:
+            tracemalloc.start()
+        start = time.perf_counter()
+        methods[name](df, y, transformer, writers, args.block_size, args.seed, args.stratify_bins)
+        seconds = time.perf_counter() - start
+        # Peak of memory allocated on top of raw data, traced only in separate run as tracing slows down allocations
+        peak_bytes = tracemalloc.get_traced_memory()[1] if trace else None
+        tracemalloc.stop()
+
+    queue.put({
+        "seconds": seconds,
+        "peak_allocated_mb": peak_bytes / 2 ** 20 if trace else None,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    })
+
+
+def measure(name, n_rows, args, trace):
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    process = context.Process(target=run_method, args=(name, n_rows, args, trace, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser("benchmark_split")
+    parser.add_argument(
+        "-n", "--rows",
+        type=int,
+        nargs="+",
+        dest="rows",
+        default=[1000000, 10000000],
+        help="Number of dataset rows to benchmark with."
+    )
+    parser.add_argument(
+        "-f", "--format",
+        type=str,
+        dest="format",
+        default="none",
+        choices=["none"] + list(preprocess.split_writers),
+        help="Output format of splits, 'none' discards written rows to measure split alone."
+    )
+    parser.add_argument(
+        "--block-size",
+        type=int,
+        dest="block_size",
+        default=100000,
+        help="Number of rows transformed and written at once by index split."
+    )
+    parser.add_argument(
+        "--stratify-bins",
+        type=int,
+        dest="stratify_bins",
+        default=0,
+        help="Number of label quantile bins index split is stratified by."
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        dest="seed",
+        default=42,
+        help="Seed of index split."
+    )
+    parser.add_argument(
+        "-o", "--output",
+        type=str,
+        dest="output",
+        default=None,
+        help="Optional path of JSON file to store results."
+    )
+    args = parser.parse_args()
+
+    report = {}
+    print(f"{'rows':>10} {'method':>14} {'time [s]':>10} {'allocated [MB]':>15} {'peak RSS [MB]':>14}")
+    for n_rows in args.rows:
+        results = {}
+        for name in methods:
+            results[name] = measure(name, n_rows, args, trace=False)
+            results[name]["peak_allocated_mb"] = measure(name, n_rows, args, trace=True)["peak_allocated_mb"]
+            print(
+                f"{n_rows:>10} {name:>14} {results[name]['seconds']:>10.3f} "
+                f"{results[name]['peak_allocated_mb']:>15.1f} {results[name]['peak_rss_mb']:>14.1f}"
+            )
+        report[n_rows] = results
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=4)
+
+
+if __name__ == "__main__":
+    main()
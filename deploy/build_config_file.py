@@ -1,41 +1,121 @@
 import argparse
 import json
-import boto3
 import logging
 
+from model_registry import ModelRegistry, default_cache_dir, parse_metric_threshold
+
 logger = logging.getLogger(__name__)
-sagemaker_client = boto3.client("sagemaker")
 
 
-def get_approved_package(model_package_group_name):
-    respose_get_packages = sagemaker_client.list_model_packages(
-        ModelPackageGroupName=model_package_group_name,
-        ModelApprovalStatus="Approved",
-        SortBy="CreationTime",
-        SortOrder="Descending",
-        MaxResults=50
-    )
-    approved_packages = respose_get_packages["ModelPackageSummaryList"]
-    if len(approved_packages) == 0:
-        error_message = f"No approved ModelPackage found for ModelPackageGroup: {model_package_group_name}"
-        logger.error(error_message)
-        raise Exception(error_message)
-    
-    model_arn = approved_packages[0]["ModelPackageArn"]
-    logger.info(f"Latest approved model package: {model_arn}")
-    return model_arn
+deployment_modes = ["Single", "Weighted", "Shadow"]
+
+
+def get_target_from_load_test(load_test_report, instance_count=1, safety_factor=0.5):
+    """Calculates target invocations per instance per minute from throughput recorded by load_test.py.
+
+    Throughput is the highest load endpoint sustained during the test, so target leaves
+    headroom of safety factor for traffic arriving while new instances are starting.
+    """
+    with open(load_test_report, "r") as f:
+        summary = json.load(f)["summary"]
+    if summary["error_rate"] > 0.01:
+        logger.warning(f"Load test error rate is {summary['error_rate']:.2%}, throughput may be overestimated")
+
+    target = summary["throughput_rps"] * 60 / instance_count * safety_factor
+    if target < 1:
+        raise Exception(f"Load test throughput {summary['throughput_rps']} requests/s is too low to calculate target")
+    logger.info(f"Target invocations per instance calculated from load test: {int(target)}")
+    return int(target)
+
+def validate_autoscaling_params(params):
+    if params.get("EnableAutoScaling", "false") != "true":
+        return
+
+    try:
+        min_capacity = int(params["AutoScalingMinCapacity"])
+        max_capacity = int(params["AutoScalingMaxCapacity"])
+        instance_count = int(params["EndpointInstanceCount"])
+        target = float(params["AutoScalingTargetInvocationsPerInstance"])
+        cooldowns = [int(params["AutoScalingScaleInCooldown"]), int(params["AutoScalingScaleOutCooldown"])]
+    except KeyError as e:
+        raise Exception(f"Endpoint configuration with autoscaling enabled must include parameter {e}")
+    except ValueError as e:
+        raise Exception(f"Invalid autoscaling parameter value: {e}")
+
+    if not 1 <= min_capacity <= max_capacity:
+        raise Exception(f"Autoscaling capacity must satisfy 1 <= min ({min_capacity}) <= max ({max_capacity})")
+    if not min_capacity <= instance_count <= max_capacity:
+        raise Exception(f"EndpointInstanceCount ({instance_count}) must be within autoscaling capacity limits")
+    if target <= 0:
+        raise Exception("AutoScalingTargetInvocationsPerInstance must be positive")
+    if any(cooldown < 0 for cooldown in cooldowns):
+        raise Exception("Autoscaling cooldowns must not be negative")
 
-def adjust_config_file(args, model_package_arn, endpoint_config):
+def get_deployment_params(params, deployment_mode, candidate_model_package_arn=None, candidate_traffic_percentage=10,
+                          container_count=1):
+    """Returns variant weights and candidate model package parameters of deployment mode.
+
+    container_count is the highest number of containers of deployed model packages, as serverless
+    endpoints serve neither inference pipelines nor more than one variant.
+    """
+    if deployment_mode not in deployment_modes:
+        raise Exception(f"Unsupported deployment mode {deployment_mode}, supported: {deployment_modes}")
+    serverless = params.get("EndpointType", "Provisioned") == "Serverless"
+    if serverless and container_count > 1:
+        raise Exception(
+            f"Inference pipelines are not supported by serverless endpoints, model package has {container_count} "
+            "containers, set EndpointType to Provisioned"
+        )
+    if serverless and params.get("EnableAutoScaling", "false") == "true":
+        raise Exception("Autoscaling is not supported by serverless endpoints, set EnableAutoScaling to false")
+    if serverless and params.get("EnableDataCapture", "false") == "true":
+        logger.warning("Data capture is not supported by serverless endpoints and will not be enabled")
+
+    if deployment_mode == "Single":
+        return {"DeploymentMode": deployment_mode}
+
+    if serverless:
+        raise Exception(f"Deployment mode {deployment_mode} is not supported by serverless endpoints, use Single")
+    if candidate_model_package_arn is None:
+        raise Exception(f"Deployment mode {deployment_mode} requires candidate model package")
+    if not 0 <= candidate_traffic_percentage <= 100:
+        raise Exception(f"Candidate traffic percentage must be between 0 and 100, got {candidate_traffic_percentage}")
+
+    # Shadow variant receives copy of requests, so primary variant keeps serving all traffic
+    primary_weight = 100 if deployment_mode == "Shadow" else 100 - candidate_traffic_percentage
+    return {
+        "DeploymentMode": deployment_mode,
+        "CandidateModelPackageName": candidate_model_package_arn,
+        "PrimaryVariantWeight": str(primary_weight),
+        "CandidateVariantWeight": str(candidate_traffic_percentage)
+    }
+
+def adjust_config_file(args, model_package_arn, endpoint_config, candidate_model_package_arn=None, container_count=1):
     if not "Parameters" in endpoint_config:
         raise Exception("Endpoint configuration file must include parameters")
     if not "Tags" in endpoint_config:
         endpoint_config["Tags"] = {}
+
+    if args.load_test_report:
+        endpoint_config["Parameters"]["AutoScalingTargetInvocationsPerInstance"] = str(get_target_from_load_test(
+            args.load_test_report,
+            instance_count=args.load_test_instance_count,
+            safety_factor=args.target_safety_factor
+        ))
+    validate_autoscaling_params(endpoint_config["Parameters"])
     
     additional_params = {
         "DataCaptureUploadPath": f"s3://{args.datacapture_s3}/datacapture-{args.endpoint_name}",
         "EndpointName": args.endpoint_name,
         "ModelPackageName": model_package_arn,
-        "ModelExecutionRoleArn": args.model_execution_role
+        "ModelExecutionRoleArn": args.model_execution_role,
+        **get_deployment_params(
+            endpoint_config["Parameters"],
+            args.deployment_mode,
+            candidate_model_package_arn=candidate_model_package_arn,
+            candidate_traffic_percentage=args.candidate_traffic_percentage,
+            container_count=container_count
+        )
     }
 
     return {
@@ -93,6 +173,57 @@ def main():
         required=True,
         dest="model_package_group_name",
         help="Name of model package group name where model is registered."
+    ),
+    parser.add_argument(
+        "--load-test-report",
+        type=str,
+        dest="load_test_report",
+        default=None,
+        help="Location of load_test.py JSON report used to calculate autoscaling target invocations per instance."
+    ),
+    parser.add_argument(
+        "--load-test-instance-count",
+        type=int,
+        dest="load_test_instance_count",
+        default=1,
+        help="Number of endpoint instances during load test."
+    ),
+    parser.add_argument(
+        "--target-safety-factor",
+        type=float,
+        dest="target_safety_factor",
+        default=0.5,
+        help="Fraction of load test throughput per instance used as autoscaling target."
+    ),
+    parser.add_argument(
+        "--deployment-mode",
+        type=str,
+        dest="deployment_mode",
+        default="Single",
+        choices=deployment_modes,
+        help="Deploy latest approved model alone (Single), or as candidate variant next to previously approved model, receiving share of traffic (Weighted) or copy of traffic (Shadow)."
+    ),
+    parser.add_argument(
+        "--candidate-traffic-percentage",
+        type=int,
+        dest="candidate_traffic_percentage",
+        default=10,
+        help="Percentage of requests routed (Weighted) or copied (Shadow) to candidate variant."
+    ),
+    parser.add_argument(
+        "--metric-threshold",
+        type=parse_metric_threshold,
+        action="append",
+        dest="metric_thresholds",
+        default=[],
+        help="Registered model metric threshold approved model package must meet, e.g. 'mse<=7.0', can be repeated."
+    ),
+    parser.add_argument(
+        "--registry-cache-dir",
+        type=str,
+        dest="registry_cache_dir",
+        default=default_cache_dir,
+        help="Local directory where model package descriptions and metrics are cached."
     )
     args = parser.parse_args()
 
@@ -102,13 +233,27 @@ def main():
         level=args.log_level
     )
 
-    model_package_arn = get_approved_package(args.model_package_group_name)
+    registry = ModelRegistry(cache_dir=args.registry_cache_dir)
+    if args.deployment_mode == "Single":
+        model_package_arn, = registry.select_approved_packages(
+            args.model_package_group_name, metric_thresholds=args.metric_thresholds
+        )
+        candidate_model_package_arn = None
+    else:
+        # Newest approved model is candidate, previously approved model keeps serving as primary variant
+        candidate_model_package_arn, model_package_arn = registry.select_approved_packages(
+            args.model_package_group_name, count=2, metric_thresholds=args.metric_thresholds
+        )
 
     with open(args.import_endpoint_config, "r") as f:
         endpoint_config = adjust_config_file(
             args=args,
             model_package_arn=model_package_arn,
-            endpoint_config=json.load(f)
+            endpoint_config=json.load(f),
+            candidate_model_package_arn=candidate_model_package_arn,
+            container_count=max(
+                registry.get_container_count(arn) for arn in (model_package_arn, candidate_model_package_arn) if arn
+            )
         )
         endpoint_config_dump = json.dumps(endpoint_config, indent=4)
     logger.info(f"Adjusted endpoint configuration: {endpoint_config_dump}")
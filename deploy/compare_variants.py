@@ -0,0 +1,196 @@
+import argparse
+import datetime
+import json
+import logging
+import sys
+
+import boto3
+
+logger = logging.getLogger(__name__)
+
+# Statistics of endpoint variant metrics in AWS/SageMaker namespace, latency metrics in microseconds
+variant_metrics = [
+    ("invocations", "Invocations", "Sum"),
+    ("errors_4xx", "Invocation4XXErrors", "Sum"),
+    ("errors_5xx", "Invocation5XXErrors", "Sum"),
+    ("model_latency_avg", "ModelLatency", "Average"),
+    ("model_latency_p99", "ModelLatency", "p99"),
+    ("overhead_latency_avg", "OverheadLatency", "Average"),
+]
+
+
+def get_variant_metrics(cloudwatch_client, endpoint_name, variant_name, start_time, end_time):
+    """Returns metrics of endpoint variant aggregated over whole time window, latencies in milliseconds."""
+    period = int((end_time - start_time).total_seconds())
+    # Period of metric query must be multiple of 60 seconds
+    period = max(60, period - period % 60)
+    queries = [
+        {
+            "Id": key,
+            "MetricStat": {
+                "Metric": {
+                    "Namespace": "AWS/SageMaker",
+                    "MetricName": metric_name,
+                    "Dimensions": [
+                        {"Name": "EndpointName", "Value": endpoint_name},
+                        {"Name": "VariantName", "Value": variant_name}
+                    ]
+                },
+                "Period": period,
+                "Stat": stat
+            }
+        }
+        for key, metric_name, stat in variant_metrics
+    ]
+    response = cloudwatch_client.get_metric_data(
+        MetricDataQueries=queries,
+        StartTime=start_time,
+        EndTime=end_time
+    )
+    values = {result["Id"]: result["Values"][0] if result["Values"] else None for result in response["MetricDataResults"]}
+
+    invocations = values["invocations"] or 0
+    errors = (values["errors_4xx"] or 0) + (values["errors_5xx"] or 0)
+    return {
+        "invocations": int(invocations),
+        "error_rate": errors / invocations if invocations > 0 else None,
+        **{
+            key.replace("latency", "latency_ms"): values[key] / 1000 if values[key] is not None else None
+            for key in ("model_latency_avg", "model_latency_p99", "overhead_latency_avg")
+        }
+    }
+
+
+def compare_variants(primary, candidate, max_latency_increase, max_error_rate_increase, min_invocations):
+    """Returns list of reasons why candidate variant should not receive more traffic, empty if it performs well."""
+    failures = []
+    for name, metrics in (("primary", primary), ("candidate", candidate)):
+        if metrics["invocations"] < min_invocations:
+            failures.append(f"{name} variant has {metrics['invocations']} invocations, at least {min_invocations} required")
+    if failures:
+        return failures
+
+    if candidate["error_rate"] - primary["error_rate"] > max_error_rate_increase:
+        failures.append(
+            f"candidate error rate {candidate['error_rate']:.4f} exceeds primary error rate "
+            f"{primary['error_rate']:.4f} by more than {max_error_rate_increase}"
+        )
+    for key in ("model_latency_ms_avg", "model_latency_ms_p99"):
+        if primary[key] is None or candidate[key] is None:
+            continue
+        if candidate[key] > primary[key] * (1 + max_latency_increase):
+            failures.append(
+                f"candidate {key} {candidate[key]:.2f} exceeds primary {key} {primary[key]:.2f} "
+                f"by more than {max_latency_increase:.0%}"
+            )
+    return failures
+
+
+def print_comparison(primary, candidate):
+    print(f"{'Metric':<24} {'Primary':>14} {'Candidate':>14}")
+    for key in primary:
+        values = [
+            "-" if metrics[key] is None else f"{metrics[key]:.4f}" if isinstance(metrics[key], float) else str(metrics[key])
+            for metrics in (primary, candidate)
+        ]
+        print(f"{key:<24} {values[0]:>14} {values[1]:>14}")
+
+
+def main():
+    parser = argparse.ArgumentParser("compare_variants")
+    parser.add_argument(
+        "--endpoint-name",
+        type=str,
+        dest="endpoint_name",
+        default="crayon-showcase-endpoint",
+        help="Name of deployed endpoint."
+    ),
+    parser.add_argument(
+        "--primary-variant",
+        type=str,
+        dest="primary_variant",
+        default="AllTraffic",
+        help="Name of variant serving currently approved model."
+    ),
+    parser.add_argument(
+        "--candidate-variant",
+        type=str,
+        dest="candidate_variant",
+        default="Candidate",
+        help="Name of weighted or shadow variant serving newly approved model."
+    ),
+    parser.add_argument(
+        "--hours",
+        type=float,
+        dest="hours",
+        default=1.0,
+        help="Length of time window up to now, over which metrics are compared."
+    ),
+    parser.add_argument(
+        "--max-latency-increase",
+        type=float,
+        dest="max_latency_increase",
+        default=0.1,
+        help="Maximum relative increase of candidate model latency over primary model latency."
+    ),
+    parser.add_argument(
+        "--max-error-rate-increase",
+        type=float,
+        dest="max_error_rate_increase",
+        default=0.01,
+        help="Maximum absolute increase of candidate error rate over primary error rate."
+    ),
+    parser.add_argument(
+        "--min-invocations",
+        type=int,
+        dest="min_invocations",
+        default=100,
+        help="Minimum number of invocations of each variant required for comparison."
+    ),
+    parser.add_argument(
+        "--output-file",
+        type=str,
+        dest="output_file",
+        default=None,
+        help="Location of JSON file with metrics of both variants and comparison result."
+    ),
+    parser.add_argument(
+        "--log-level",
+        type=str,
+        dest="log_level",
+        default="INFO",
+        help="Logging level, possible options 'DEBUG', 'INFO', 'WARN', 'ERROR', 'CRITICAL'"
+    )
+    args = parser.parse_args()
+
+    log_format = "%(levelname)s: [%(filename)s:%(lineno)s] %(message)s"
+    logging.basicConfig(
+        format=log_format,
+        level=args.log_level
+    )
+
+    cloudwatch_client = boto3.client("cloudwatch")
+    end_time = datetime.datetime.now(datetime.timezone.utc)
+    start_time = end_time - datetime.timedelta(hours=args.hours)
+    primary, candidate = [
+        get_variant_metrics(cloudwatch_client, args.endpoint_name, variant, start_time, end_time)
+        for variant in (args.primary_variant, args.candidate_variant)
+    ]
+    failures = compare_variants(
+        primary, candidate, args.max_latency_increase, args.max_error_rate_increase, args.min_invocations
+    )
+
+    print_comparison(primary, candidate)
+    if args.output_file:
+        with open(args.output_file, "w") as f:
+            json.dump({"primary": primary, "candidate": candidate, "failures": failures}, f, indent=4)
+
+    if failures:
+        for failure in failures:
+            logger.error(failure)
+        sys.exit(1)
+    logger.info("Candidate variant performs within limits, traffic can be shifted to it.")
+
+
+if __name__ == "__main__":
+    main()
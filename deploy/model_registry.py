@@ -0,0 +1,147 @@
+import json
+import logging
+import operator
+import os
+import re
+from urllib.parse import urlparse
+
+import boto3
+from botocore.config import Config
+
+logger = logging.getLogger(__name__)
+
+default_cache_dir = os.path.join(os.path.expanduser("~"), ".cache", "crayon-showcase", "model-packages")
+
+# Adaptive retry mode backs off on throttling errors, in addition to standard retries
+client_config = Config(retries={"max_attempts": 10, "mode": "adaptive"})
+
+threshold_operators = {
+    "<=": operator.le,
+    ">=": operator.ge,
+    "<": operator.lt,
+    ">": operator.gt,
+}
+
+
+def parse_metric_threshold(threshold):
+    """Parses metric threshold in form `<metric><operator><value>`, e.g. `mse<=7.0`."""
+    match = re.fullmatch(r"\s*(\w+)\s*(<=|>=|<|>)\s*([-+0-9.eE]+)\s*", threshold)
+    if match is None:
+        raise Exception(f"Invalid metric threshold {threshold}, expected e.g. 'mse<=7.0'")
+    name, operator_name, value = match.groups()
+    return name, operator_name, float(value)
+
+
+class ModelRegistry:
+    """Looks up model packages in model registry, with descriptions and metrics cached locally by ARN.
+
+    Registered model packages are immutable apart from their approval status, which is always
+    taken from listing of model packages instead of cached description.
+    """
+
+    def __init__(self, sagemaker_client=None, s3_client=None, cache_dir=default_cache_dir):
+        self.sagemaker_client = sagemaker_client or boto3.client("sagemaker", config=client_config)
+        self.s3_client = s3_client or boto3.client("s3", config=client_config)
+        self.cache_dir = cache_dir
+
+    def iter_approved_packages(self, model_package_group_name):
+        """Yields summaries of approved model packages in model package group, newest first, page by page."""
+        paginator = self.sagemaker_client.get_paginator("list_model_packages")
+        pages = paginator.paginate(
+            ModelPackageGroupName=model_package_group_name,
+            ModelApprovalStatus="Approved",
+            SortBy="CreationTime",
+            SortOrder="Descending",
+            PaginationConfig={"PageSize": 100}
+        )
+        for page in pages:
+            yield from page["ModelPackageSummaryList"]
+
+    def list_approved_packages(self, model_package_group_name):
+        """Returns summaries of all approved model packages in model package group, newest first."""
+        return list(self.iter_approved_packages(model_package_group_name))
+
+    def get_latest_approved_package(self, model_package_group_name):
+        """Returns description of latest approved model package in model package group, None if there is none."""
+        summary = next(self.iter_approved_packages(model_package_group_name), None)
+        if summary is None:
+            return None
+        return self.describe_package(summary["ModelPackageArn"])
+
+    def _cached(self, kind, model_package_arn, load):
+        if self.cache_dir is None:
+            return load()
+
+        cache_path = os.path.join(self.cache_dir, kind, re.sub(r"[^\w.-]", "_", model_package_arn) + ".json")
+        if os.path.exists(cache_path):
+            logger.debug(f"Loading {kind} of {model_package_arn} from cache {cache_path}")
+            with open(cache_path, "r") as f:
+                return json.load(f)
+
+        # Round trip through JSON, so that cached and fresh results are the same
+        result = json.loads(json.dumps(load(), default=str))
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        with open(f"{cache_path}.tmp", "w") as f:
+            json.dump(result, f)
+        os.replace(f"{cache_path}.tmp", cache_path)
+        return result
+
+    def describe_package(self, model_package_arn):
+        def load():
+            response = self.sagemaker_client.describe_model_package(ModelPackageName=model_package_arn)
+            response.pop("ResponseMetadata", None)
+            return response
+
+        return self._cached("descriptions", model_package_arn, load)
+
+    def get_container_count(self, model_package_arn):
+        """Returns number of inference containers of model package, above 1 for inference pipelines."""
+        return len(self.describe_package(model_package_arn)["InferenceSpecification"]["Containers"])
+
+    def get_model_metrics(self, model_package_arn):
+        """Returns model quality statistics registered with model package, None if there are none."""
+        description = self.describe_package(model_package_arn)
+        statistics = description.get("ModelMetrics", {}).get("ModelQuality", {}).get("Statistics")
+        if statistics is None:
+            return None
+
+        def load():
+            parsed = urlparse(statistics["S3Uri"])
+            body = self.s3_client.get_object(Bucket=parsed.netloc, Key=parsed.path.lstrip("/"))["Body"]
+            return json.load(body)
+
+        return self._cached("metrics", model_package_arn, load)
+
+    def meets_thresholds(self, model_package_arn, metric_thresholds):
+        """Checks regression metrics of model package against list of (metric, operator, value) thresholds."""
+        if not metric_thresholds:
+            return True
+
+        metrics = self.get_model_metrics(model_package_arn)
+        if metrics is None:
+            logger.warning(f"Model package {model_package_arn} has no registered model metrics")
+            return False
+        for name, operator_name, threshold in metric_thresholds:
+            value = metrics.get("regression_metrics", {}).get(name, {}).get("value")
+            if value is None or not threshold_operators[operator_name](value, threshold):
+                logger.info(f"Model package {model_package_arn} {name} is {value}, required {operator_name} {threshold}")
+                return False
+        return True
+
+    def select_approved_packages(self, model_package_group_name, count=1, metric_thresholds=None):
+        """Returns ARNs of count most recently approved model packages meeting metric thresholds, newest first."""
+        selected = []
+        # Further pages are listed only while fewer than count packages meet thresholds
+        for summary in self.iter_approved_packages(model_package_group_name):
+            if self.meets_thresholds(summary["ModelPackageArn"], metric_thresholds):
+                selected.append(summary["ModelPackageArn"])
+                if len(selected) == count:
+                    break
+
+        if len(selected) < count:
+            raise Exception(
+                f"Found {len(selected)} approved ModelPackages meeting metric thresholds for "
+                f"ModelPackageGroup: {model_package_group_name}, {count} required"
+            )
+        logger.info(f"Selected approved model packages: {selected}")
+        return selected
@@ -0,0 +1,198 @@
+import datetime
+import io
+import json
+import tempfile
+import unittest
+
+import botocore.session
+from botocore.response import StreamingBody
+from botocore.stub import Stubber
+
+from model_registry import ModelRegistry, parse_metric_threshold
+
+group_name = "crayonShowcasePackageGroup"
+creation_time = datetime.datetime(2022, 8, 1)
+
+
+def get_arn(version):
+    return f"arn:aws:sagemaker:eu-west-1:111111111111:model-package/{group_name.lower()}/{version}"
+
+
+def get_summary(version):
+    return {
+        "ModelPackageName": group_name,
+        "ModelPackageVersion": version,
+        "ModelPackageArn": get_arn(version),
+        "CreationTime": creation_time,
+        "ModelPackageStatus": "Completed",
+        "ModelApprovalStatus": "Approved",
+    }
+
+
+def get_description(version):
+    return {
+        "ModelPackageName": group_name,
+        "ModelPackageVersion": version,
+        "ModelPackageArn": get_arn(version),
+        "CreationTime": creation_time,
+        "ModelPackageStatus": "Completed",
+        "ModelPackageStatusDetails": {"ValidationStatuses": [], "ImageScanStatuses": []},
+        "ModelApprovalStatus": "Approved",
+        "InferenceSpecification": {
+            "Containers": [{"Image": "preprocessor"}, {"Image": "xgboost"}],
+            "SupportedContentTypes": ["text/csv"],
+            "SupportedResponseMIMETypes": ["text/csv"],
+        },
+        "ModelMetrics": {
+            "ModelQuality": {
+                "Statistics": {"ContentType": "application/json", "S3Uri": f"s3://bucket/evaluation/{version}.json"}
+            }
+        },
+    }
+
+
+def get_list_params(next_token=None):
+    params = {
+        "ModelPackageGroupName": group_name,
+        "ModelApprovalStatus": "Approved",
+        "SortBy": "CreationTime",
+        "SortOrder": "Descending",
+        "MaxResults": 100,
+    }
+    if next_token is not None:
+        params["NextToken"] = next_token
+    return params
+
+
+class ModelRegistryTest(unittest.TestCase):
+    """Model registry lookups against stubbed SageMaker and S3 clients, without AWS access."""
+
+    def setUp(self):
+        session = botocore.session.get_session()
+        session.set_credentials("access-key", "secret-key")
+        self.sagemaker_client = session.create_client("sagemaker", region_name="eu-west-1")
+        self.s3_client = session.create_client("s3", region_name="eu-west-1")
+        self.sagemaker_stubber = Stubber(self.sagemaker_client)
+        self.s3_stubber = Stubber(self.s3_client)
+        self.sagemaker_stubber.activate()
+        self.s3_stubber.activate()
+        self.registry = ModelRegistry(sagemaker_client=self.sagemaker_client, s3_client=self.s3_client, cache_dir=None)
+
+    def tearDown(self):
+        self.sagemaker_stubber.deactivate()
+        self.s3_stubber.deactivate()
+
+    def add_list_page(self, versions, next_token=None, expected_token=None):
+        response = {"ModelPackageSummaryList": [get_summary(version) for version in versions]}
+        if next_token is not None:
+            response["NextToken"] = next_token
+        self.sagemaker_stubber.add_response("list_model_packages", response, get_list_params(expected_token))
+
+    def add_metrics(self, version, mse):
+        self.sagemaker_stubber.add_response(
+            "describe_model_package", get_description(version), {"ModelPackageName": get_arn(version)}
+        )
+        body = json.dumps({"regression_metrics": {"mse": {"value": mse}}}).encode()
+        self.s3_stubber.add_response(
+            "get_object",
+            {"Body": StreamingBody(io.BytesIO(body), len(body))},
+            {"Bucket": "bucket", "Key": f"evaluation/{version}.json"}
+        )
+
+    def test_select_approved_packages_pages_until_enough_meet_thresholds(self):
+        self.add_list_page([5, 4], next_token="page-2")
+        self.add_metrics(5, 9.0)
+        self.add_metrics(4, 6.5)
+        self.add_list_page([3, 2], expected_token="page-2")
+        self.add_metrics(3, 6.9)
+
+        selected = self.registry.select_approved_packages(
+            group_name, count=2, metric_thresholds=[parse_metric_threshold("mse<=7.0")]
+        )
+
+        self.assertEqual(selected, [get_arn(4), get_arn(3)])
+        self.sagemaker_stubber.assert_no_pending_responses()
+        self.s3_stubber.assert_no_pending_responses()
+
+    def test_select_approved_packages_stops_paging_once_enough_meet_thresholds(self):
+        # Second page is not stubbed, so listing it would fail with unstubbed response
+        self.add_list_page([5, 4], next_token="page-2")
+        self.add_metrics(5, 6.0)
+
+        selected = self.registry.select_approved_packages(
+            group_name, count=1, metric_thresholds=[parse_metric_threshold("mse<=7.0")]
+        )
+
+        self.assertEqual(selected, [get_arn(5)])
+        self.sagemaker_stubber.assert_no_pending_responses()
+        self.s3_stubber.assert_no_pending_responses()
+
+    def test_select_approved_packages_fails_when_too_few_meet_thresholds(self):
+        self.add_list_page([2, 1])
+        self.add_metrics(2, 6.0)
+        self.add_metrics(1, 8.0)
+
+        with self.assertRaisesRegex(Exception, "Found 1 approved ModelPackages"):
+            self.registry.select_approved_packages(
+                group_name, count=2, metric_thresholds=[parse_metric_threshold("mse<=7.0")]
+            )
+
+    def test_get_latest_approved_package_reads_first_page_only(self):
+        self.add_list_page([7, 6], next_token="page-2")
+        self.sagemaker_stubber.add_response(
+            "describe_model_package", get_description(7), {"ModelPackageName": get_arn(7)}
+        )
+
+        package = self.registry.get_latest_approved_package(group_name)
+
+        self.assertEqual(package["ModelPackageArn"], get_arn(7))
+        self.sagemaker_stubber.assert_no_pending_responses()
+
+    def test_get_container_count_of_inference_pipeline(self):
+        self.sagemaker_stubber.add_response(
+            "describe_model_package", get_description(7), {"ModelPackageName": get_arn(7)}
+        )
+
+        self.assertEqual(self.registry.get_container_count(get_arn(7)), 2)
+
+    def test_get_latest_approved_package_without_approved_packages(self):
+        self.add_list_page([])
+
+        self.assertIsNone(self.registry.get_latest_approved_package(group_name))
+
+    def test_cached_description_and_metrics_are_loaded_once_per_arn(self):
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        registry = ModelRegistry(sagemaker_client=self.sagemaker_client, s3_client=self.s3_client, cache_dir=cache_dir.name)
+        self.add_metrics(7, 6.5)
+
+        # Responses are stubbed once, so repeated lookups of the same ARN must be served from cache
+        first = registry.get_model_metrics(get_arn(7))
+        self.assertEqual(registry.get_model_metrics(get_arn(7)), first)
+        self.assertEqual(registry.get_container_count(get_arn(7)), 2)
+        self.sagemaker_stubber.assert_no_pending_responses()
+        self.s3_stubber.assert_no_pending_responses()
+
+        # Cache is kept on disk, so that it is shared by registry instances
+        cached_registry = ModelRegistry(
+            sagemaker_client=self.sagemaker_client, s3_client=self.s3_client, cache_dir=cache_dir.name
+        )
+        self.assertEqual(cached_registry.get_model_metrics(get_arn(7)), first)
+        self.assertEqual(first["regression_metrics"]["mse"]["value"], 6.5)
+
+    def test_cache_is_kept_per_arn(self):
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        registry = ModelRegistry(sagemaker_client=self.sagemaker_client, s3_client=self.s3_client, cache_dir=cache_dir.name)
+        self.add_metrics(7, 6.5)
+        self.add_metrics(6, 8.0)
+
+        self.assertEqual(registry.get_model_metrics(get_arn(7))["regression_metrics"]["mse"]["value"], 6.5)
+        self.assertEqual(registry.get_model_metrics(get_arn(6))["regression_metrics"]["mse"]["value"], 8.0)
+        self.assertEqual(registry.get_model_metrics(get_arn(7))["regression_metrics"]["mse"]["value"], 6.5)
+        self.sagemaker_stubber.assert_no_pending_responses()
+        self.s3_stubber.assert_no_pending_responses()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,69 @@
+import argparse
+import ast
+import sys
+import time
+
+
+def print_step_timings(steps):
+    """Prints status and duration of locally executed pipeline steps."""
+    print(f"{'Step':<40} {'Status':<12} {'Duration (s)':>12}")
+    for name, status, duration in steps:
+        print(f"{name:<40} {status:<12} {duration:>12.2f}")
+    print(f"{'Total':<40} {'':<12} {sum(duration for _, _, duration in steps):>12.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser("run_local_pipeline")
+    parser.add_argument(
+        "-n", "--module-name",
+        type=str,
+        dest="module_name",
+        default="showcase.local",
+        help="Module name of the local pipeline runner to import."
+    )
+    parser.add_argument(
+        "-i", "--input-file",
+        type=str,
+        dest="input_file",
+        help="Local CSV file with raw data, used instead of data from DVC remote."
+    )
+    parser.add_argument(
+        "-w", "--work-dir",
+        type=str,
+        dest="work_dir",
+        default=None,
+        help="Directory where processing inputs and outputs of steps are stored, temporary directory by default."
+    )
+    parser.add_argument(
+        "-k", "--kwargs",
+        dest="kwargs",
+        default="{}",
+        help="Dictionary of keyword arguments for the local pipeline runner."
+    )
+    args = parser.parse_args()
+
+    if args.input_file is None:
+        parser.print_help()
+        sys.exit(2)
+
+    module_import = __import__(args.module_name, fromlist=["run_local_pipeline"])
+    kwargs = ast.literal_eval(args.kwargs)
+
+    start = time.perf_counter()
+    steps, register = module_import.run_local_pipeline(
+        input_file=args.input_file,
+        work_dir=args.work_dir,
+        **kwargs
+    )
+    print(f"\n###### Local pipeline run completed in {time.perf_counter() - start:.2f}s. Summary of run steps:")
+    print_step_timings(steps)
+
+    if any(status == "Failed" for _, status, _ in steps):
+        sys.exit(1)
+    if not register:
+        print("Model metrics below requirements, model would not be registered.")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,339 @@
 import argparse
 import ast
+import datetime
 import json
+import os
 import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import boto3
+
+from showcase.common.profiling import print_profile_summary
+
+# Exit codes of watched pipeline execution
+exit_succeeded = 0
+exit_failed = 1
+exit_timeout = 3
+
+exit_statuses = {exit_succeeded: "Succeeded", exit_failed: "Failed", exit_timeout: "TimedOut", None: "Started"}
+
+terminal_execution_statuses = ("Succeeded", "Failed", "Stopped")
+
+# Metadata keys of steps running SageMaker jobs, with their describe call and start time field
+step_jobs = {
+    "ProcessingJob": ("describe_processing_job", "ProcessingJobName", "ProcessingStartTime"),
+    "TrainingJob": ("describe_training_job", "TrainingJobName", "TrainingStartTime"),
+    "TransformJob": ("describe_transform_job", "TransformJobName", "TransformStartTime"),
+}
+
+
+def print_flush(message):
+    # Output of watched executions is followed live, also when stdout is piped e.g. in CI
+    print(message, flush=True)
+
+
+def print_step_cache_summary(steps, log=print_flush):
+    """Prints status of pipeline execution steps, marking steps reused from cache."""
+    cache_hits = 0
+    log(f"{'Step':<40} {'Status':<12} {'Cache hit from execution'}")
+    for step in sorted(steps, key=lambda s: s["StartTime"]):
+        source_execution_arn = step.get("CacheHitResult", {}).get("SourcePipelineExecutionArn", "-")
+        if source_execution_arn != "-":
+            cache_hits += 1
+        log(f"{step['StepName']:<40} {step['StepStatus']:<12} {source_execution_arn}")
+    log(f"{cache_hits} of {len(steps)} steps were cache hits.")
+
+
+def list_execution_steps(sagemaker_client, execution_arn):
+    paginator = sagemaker_client.get_paginator("list_pipeline_execution_steps")
+    return [
+        step
+        for page in paginator.paginate(PipelineExecutionArn=execution_arn, SortOrder="Ascending")
+        for step in page["PipelineExecutionSteps"]
+    ]
+
+
+def get_step_timings(sagemaker_client, steps):
+    """Returns step name, status, queue and run time in seconds of execution steps.
+
+    Queue time lasts from start of step until its job starts running on provisioned instances,
+    run time from then until end of step. Steps without job are not queued.
+    """
+    timings = []
+    for step in sorted(steps, key=lambda s: s["StartTime"]):
+        start = step["StartTime"]
+        end = step.get("EndTime", datetime.datetime.now(start.tzinfo))
+        job_start = start
+        for key, (describe, name_field, start_field) in step_jobs.items():
+            if key in step.get("Metadata", {}):
+                job_name = step["Metadata"][key]["Arn"].split("/")[-1]
+                job = getattr(sagemaker_client, describe)(**{name_field: job_name})
+                job_start = job.get(start_field, end)
+        queue_time = max((job_start - start).total_seconds(), 0.0)
+        timings.append((step["StepName"], step["StepStatus"], queue_time, (end - start).total_seconds() - queue_time))
+    return timings
+
+
+def print_step_timings(timings, log=print_flush):
+    """Prints queue time (waiting for instances) and run time of pipeline execution steps."""
+    log(f"{'Step':<40} {'Status':<12} {'Queue (s)':>10} {'Run (s)':>10}")
+    for name, status, queue_time, run_time in timings:
+        log(f"{name:<40} {status:<12} {queue_time:>10.0f} {run_time:>10.0f}")
+
+
+def watch_execution(
+    sagemaker_client, execution_arn, min_delay=5, max_delay=60, backoff=1.5, timeout=None, log=print_flush
+):
+    """Polls pipeline execution until it completes or any step fails, printing step status transitions.
+
+    Delay between polls grows exponentially while nothing changes and is reset on every transition.
+    Returns exit code of execution.
+    """
+    start = time.monotonic()
+    delay = min_delay
+    statuses = {}
+    while True:
+        execution_status = sagemaker_client.describe_pipeline_execution(
+            PipelineExecutionArn=execution_arn
+        )["PipelineExecutionStatus"]
+        steps = list_execution_steps(sagemaker_client, execution_arn)
+
+        changed = False
+        for step in steps:
+            if statuses.get(step["StepName"]) != step["StepStatus"]:
+                changed = True
+                statuses[step["StepName"]] = step["StepStatus"]
+                log(f"[{time.monotonic() - start:>7.0f}s] {step['StepName']:<40} {step['StepStatus']}")
+                if step["StepStatus"] == "Failed":
+                    log(f"Step {step['StepName']} failed: {step.get('FailureReason', 'no failure reason')}")
+
+        failed = [step for step in steps if step["StepStatus"] == "Failed"]
+        if execution_status in terminal_execution_statuses or failed:
+            log(f"\n###### Pipeline execution {execution_status}. Summary of run steps:")
+            print_step_timings(get_step_timings(sagemaker_client, steps), log)
+            print_step_cache_summary(steps, log)
+            if failed and execution_status not in terminal_execution_statuses:
+                log("Watch stopped at first failed step, pipeline execution is still running remaining steps.")
+            return exit_succeeded if execution_status == "Succeeded" and not failed else exit_failed
+
+        if timeout is not None and time.monotonic() - start > timeout:
+            log(f"Pipeline execution {execution_arn} still {execution_status} after {timeout}s.")
+            return exit_timeout
+
+        delay = min_delay if changed else min(delay * backoff, max_delay)
+        time.sleep(delay)
+
+
+def get_step_profiles(sagemaker_client, s3_client, steps):
+    """Returns profiles written by processing steps to their 'profile' output."""
+    profiles = []
+    for step in steps:
+        if "ProcessingJob" not in step.get("Metadata", {}):
+            continue
+        job = sagemaker_client.describe_processing_job(
+            ProcessingJobName=step["Metadata"]["ProcessingJob"]["Arn"].split("/")[-1]
+        )
+        for output in job.get("ProcessingOutputConfig", {}).get("Outputs", []):
+            if output["OutputName"] != "profile":
+                continue
+            bucket, _, prefix = output["S3Output"]["S3Uri"].replace("s3://", "", 1).partition("/")
+            paginator = s3_client.get_paginator("list_objects_v2")
+            for page in paginator.paginate(Bucket=bucket, Prefix=prefix.rstrip("/") + "/"):
+                for item in page.get("Contents", []):
+                    if item["Key"].endswith("/profile.json"):
+                        body = s3_client.get_object(Bucket=bucket, Key=item["Key"])["Body"]
+                        profiles.append(json.load(body))
+    return profiles
+
+
+def print_execution_profiles(
+    sagemaker_client, s3_client, execution_arn, profile_file=None, baseline_profile_file=None, log=print_flush
+):
+    """Prints profiles of processing steps, compared to baseline profiles of previous execution when given."""
+    profiles = get_step_profiles(sagemaker_client, s3_client, list_execution_steps(sagemaker_client, execution_arn))
+    if not profiles:
+        return
+
+    baseline_profiles = None
+    if baseline_profile_file:
+        with open(baseline_profile_file, "r") as f:
+            baseline_profiles = json.load(f)
+    log("\n###### Profile of processing steps:")
+    print_profile_summary(profiles, baseline_profiles, log)
+    if profile_file:
+        with open(profile_file, "w") as f:
+            json.dump(profiles, f, indent=2)
+
+
+def get_region(execution_arn):
+    # arn:aws:sagemaker:<region>:<account>:pipeline/<pipeline name>/execution/<execution id>
+    return execution_arn.split(":")[3]
+
+
+def add_watch_arguments(parser):
+    parser.add_argument(
+        "--max-delay",
+        type=float,
+        dest="max_delay",
+        default=60,
+        help="Maximum delay in seconds between polls of pipeline execution status."
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        dest="timeout",
+        default=None,
+        help="Seconds after which watching stops with exit code 3, while execution keeps running."
+    )
+    parser.add_argument(
+        "--profile-file",
+        type=str,
+        dest="profile_file",
+        default=None,
+        help="Location of JSON file where profiles of processing steps are stored."
+    )
+    parser.add_argument(
+        "--baseline-profile-file",
+        type=str,
+        dest="baseline_profile_file",
+        default=None,
+        help="Profiles of previous execution stored with --profile-file, to compare phase durations against."
+    )
+
+
+def finish_watch(sagemaker_client, s3_client, execution_arn, exit_code, args):
+    if exit_code != exit_timeout:
+        print_execution_profiles(
+            sagemaker_client, s3_client, execution_arn, args.profile_file, args.baseline_profile_file
+        )
+    sys.exit(exit_code)
+
+
+def load_pipeline_config(path):
+    """Loads JSON file with keyword arguments of pipeline definition, e.g. schema, hyperparameters and thresholds."""
+    with open(path, "r") as f:
+        config = json.load(f)
+    if not isinstance(config, dict):
+        raise Exception(f"Pipeline config {path} must be JSON object of keyword arguments")
+    return config
+
+
+def run_pipeline(module_import, kwargs, args, pipeline_tags, log=print_flush, print_definition=True):
+    """Builds, upserts and starts pipeline, then watches its execution unless detached.
+
+    Returns execution ARN and exit code of execution, which is None when detached.
+    """
+    pipeline = module_import.get_pipeline(**kwargs)
+    pipeline_json = json.loads(pipeline.definition())
+    if print_definition:
+        log("\n###### Pipeline definition being used:")
+        log(json.dumps(obj=pipeline_json, indent=2, sort_keys=True))
+
+    pipeline_upsert = pipeline.upsert(
+        role_arn=args.role_arn,
+        description=args.description,
+        tags=pipeline_tags
+    )
+
+    log("\n###### Created pipeline, following response received:")
+    log(str(pipeline_upsert))
+
+    pipeline_execution = pipeline.start()
+    log(f"\n###### Pipeline {pipeline.name} of module {args.module_name} started with execution Arn "
+        f"{pipeline_execution.arn}")
+    if args.detach:
+        log(f"Follow pipeline execution with: python run_pipeline.py watch {pipeline_execution.arn}")
+        return pipeline_execution.arn, None
+
+    log("\n###### Watching pipeline execution...")
+    sagemaker_client = pipeline.sagemaker_session.sagemaker_client
+    exit_code = watch_execution(
+        sagemaker_client,
+        pipeline_execution.arn,
+        max_delay=args.max_delay,
+        timeout=args.timeout,
+        log=log
+    )
+    if exit_code != exit_timeout:
+        print_execution_profiles(
+            sagemaker_client,
+            pipeline.sagemaker_session.boto_session.client("s3"),
+            pipeline_execution.arn,
+            args.profile_file,
+            args.baseline_profile_file,
+            log=log
+        )
+    return pipeline_execution.arn, exit_code
+
+
+def run_pipelines(module_import, configs, kwargs, args, pipeline_tags):
+    """Runs pipelines of configs concurrently, at most args.max_workers at a time, and prints summary report.
+
+    Output of every pipeline is prefixed with name of its config. Returns exit code of all executions:
+    failed if any pipeline failed, timed out if any watch timed out, succeeded otherwise.
+    """
+    lock = threading.Lock()
+
+    def get_log(name):
+        def log(message):
+            with lock:
+                for line in str(message).split("\n"):
+                    print(f"[{name}] {line}", flush=True)
+        return log
+
+    def run(name, config):
+        start = time.monotonic()
+        try:
+            arn, exit_code = run_pipeline(
+                module_import, merge_two_dicts(kwargs, config), args, pipeline_tags, get_log(name), print_definition=False
+            )
+        except Exception as e:
+            get_log(name)(f"Pipeline run failed: {e!r}")
+            arn, exit_code = None, exit_failed
+        return arn, exit_code, time.monotonic() - start
+
+    results = {}
+    with ThreadPoolExecutor(max_workers=args.max_workers) as executor:
+        futures = {executor.submit(run, name, config): name for name, config in configs.items()}
+        for future in as_completed(futures):
+            results[futures[future]] = future.result()
+
+    print(f"\n###### Summary of {len(results)} pipelines:")
+    print(f"{'Config':<32} {'Status':<10} {'Duration (s)':>12} {'Execution Arn'}")
+    for name, (arn, exit_code, duration) in sorted(results.items()):
+        print(f"{name:<32} {exit_statuses[exit_code]:<10} {duration:>12.0f} {arn or '-'}")
+
+    exit_codes = {exit_code for _, exit_code, _ in results.values()}
+    for exit_code in (exit_failed, exit_timeout):
+        if exit_code in exit_codes:
+            return exit_code
+    return exit_succeeded
+
+
+def merge_two_dicts(x, y):
+    z = x.copy()
+    z.update(y)
+    return z
+
 
 def main():
+    if len(sys.argv) > 1 and sys.argv[1] == "watch":
+        parser = argparse.ArgumentParser("run_pipeline watch")
+        parser.add_argument(
+            "execution_arn",
+            type=str,
+            help="ARN of pipeline execution to watch, as printed when pipeline is started."
+        )
+        add_watch_arguments(parser)
+        args = parser.parse_args(sys.argv[2:])
+
+        region = get_region(args.execution_arn)
+        sagemaker_client = boto3.client("sagemaker", region_name=region)
+        exit_code = watch_execution(sagemaker_client, args.execution_arn, max_delay=args.max_delay, timeout=args.timeout)
+        finish_watch(sagemaker_client, boto3.client("s3", region_name=region), args.execution_arn, exit_code, args)
+
     parser = argparse.ArgumentParser("run_pipeline")
     parser.add_argument(
         "-n", "--module-name",
@@ -35,11 +365,35 @@ def main():
         default=None,
         help="""List of dict strings of '[{"Key": "string", "Value": "string"}, ..]'"""
     )
+    parser.add_argument(
+        "--detach",
+        action="store_true",
+        dest="detach",
+        help="Return right after pipeline execution is started, use 'watch' subcommand to follow it."
+    )
+    parser.add_argument(
+        "-c", "--config",
+        type=str,
+        nargs="+",
+        dest="configs",
+        default=[],
+        help="JSON files with keyword arguments of pipelines, overriding --kwargs; pipelines are run concurrently."
+    )
+    parser.add_argument(
+        "--max-workers",
+        type=int,
+        dest="max_workers",
+        default=4,
+        help="Maximum number of pipelines built, started and watched at the same time."
+    )
+    add_watch_arguments(parser)
     args = parser.parse_args()
 
     if (args.module_name is None) or (args.role_arn is None):
         parser.print_help()
         sys.exit(2)
+    if len(args.configs) > 1 and (args.profile_file or args.baseline_profile_file):
+        parser.error("--profile-file and --baseline-profile-file are supported with single pipeline only")
     
     if args.tags:
         pipeline_tags = ast.literal_eval(args.tags)
@@ -47,28 +401,19 @@ def main():
         pipeline_tags = []
     
     module_import = __import__(args.module_name, fromlist=["get_pipeline"])
-    kwargs = ast.literal_eval(args.kwargs)
-
-    pipeline = module_import.get_pipeline(**kwargs)
-    pipeline_json = json.loads(pipeline.definition())
-    print("\n###### Pipeline definition being used:")
-    print(json.dumps(obj=pipeline_json, indent=2, sort_keys=True))
-
-    pipeline_upsert = pipeline.upsert(
-        role_arn=args.role_arn,
-        description=args.description,
-        tags=pipeline_tags
-    )
+    kwargs = ast.literal_eval(args.kwargs) if args.kwargs else {}
+    configs = {os.path.splitext(os.path.basename(path))[0]: load_pipeline_config(path) for path in args.configs}
+    if len(configs) != len(args.configs):
+        raise Exception(f"Names of config files must be unique, got {args.configs}")
 
-    print("\n###### Created pipeline, following response received:")
-    print(pipeline_upsert)
+    if len(configs) > 1:
+        sys.exit(run_pipelines(module_import, configs, kwargs, args, pipeline_tags))
 
-    pipeline_execution = pipeline.start()
-    print(f"\n###### Pipeline for module {args.module_name} started with execution Arn {pipeline_execution.arn}")
-    print("\n###### Waiting for pipeline execution to finish...")
-    pipeline_execution.wait()
-    print("\n###### Pipeline run completed. Details about run steps:")
-    print(pipeline_execution.list_steps())
+    for config in configs.values():
+        kwargs = merge_two_dicts(kwargs, config)
+    _, exit_code = run_pipeline(module_import, kwargs, args, pipeline_tags)
+    if exit_code is not None:
+        sys.exit(exit_code)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,127 @@
+import sagemaker.session
+from sagemaker.inputs import CreateModelInput, TransformInput
+from sagemaker.model import Model
+from sagemaker.pipeline import PipelineModel
+from sagemaker.transformer import Transformer
+from sagemaker.workflow.execution_variables import ExecutionVariables
+from sagemaker.workflow.functions import Join
+from sagemaker.workflow.parameters import ParameterInteger, ParameterString
+from sagemaker.workflow.pipeline import Pipeline
+from sagemaker.workflow.steps import CreateModelStep, TransformStep
+
+from showcase.pipeline import get_model_registry, get_sagemaker_session
+
+
+def get_pipeline_model(model_package, role, sagemaker_session):
+    """Creates inference pipeline model from containers of registered model package."""
+    models = [
+        Model(
+            image_uri=container["Image"],
+            model_data=container.get("ModelDataUrl"),
+            env=container.get("Environment"),
+            role=role,
+            sagemaker_session=sagemaker_session
+        )
+        for container in model_package["InferenceSpecification"]["Containers"]
+    ]
+    return PipelineModel(models=models, role=role, sagemaker_session=sagemaker_session)
+
+
+def get_pipeline(
+    region,
+    role=None,
+    default_bucket=None,
+    model_package_group_name="crayonShowcasePackageGroup",
+    pipeline_name="crayonShowcaseBatchPipeline",
+    base_job_prefix="crayonShowcase"
+):
+    # Prepare session info
+    sagemaker_session = get_sagemaker_session(
+        region=region,
+        default_bucket=default_bucket
+    )
+    if role is None:
+        role = sagemaker.session.get_execution_role(sagemaker_session=sagemaker_session)
+
+    # Latest approved model is resolved when pipeline is published
+    model_package = get_model_registry(region).get_latest_approved_package(model_package_group_name)
+    if model_package is None:
+        raise Exception(f"No approved ModelPackage found for ModelPackageGroup: {model_package_group_name}")
+    print(f"Scoring with model package {model_package['ModelPackageArn']}")
+
+
+    # Pipeline parameters
+    transform_input_data = ParameterString(
+        name="transformInputData",
+        default_value=f"s3://{sagemaker_session.default_bucket()}/{base_job_prefix}/TransformInput"
+    )
+    transform_output_path = ParameterString(
+        name="transformOutputPath",
+        default_value=f"s3://{sagemaker_session.default_bucket()}/{base_job_prefix}/TransformOutput"
+    )
+    transform_instance_count = ParameterInteger(name="transformInstanceCount", default_value=2)
+    transform_instance_type = ParameterString(name="transformInstanceType", default_value="ml.m5.xlarge")
+    transform_max_concurrent_transforms = ParameterInteger(name="transformMaxConcurrentTransforms", default_value=4)
+    transform_max_payload = ParameterInteger(name="transformMaxPayloadInMB", default_value=6)
+
+
+    # Create model step
+    step_create_model = CreateModelStep(
+        name="createModel",
+        display_name="Create model",
+        description="Create model from latest approved model package",
+        model=get_pipeline_model(model_package, role, sagemaker_session),
+        inputs=CreateModelInput(instance_type=transform_instance_type)
+    )
+
+
+    # Batch transform step
+    transformer = Transformer(
+        model_name=step_create_model.properties.ModelName,
+        instance_count=transform_instance_count,
+        instance_type=transform_instance_type,
+        # Records are batched into requests of up to max payload, each instance sending
+        # up to max concurrent transforms requests in parallel to its containers
+        strategy="MultiRecord",
+        max_payload=transform_max_payload,
+        max_concurrent_transforms=transform_max_concurrent_transforms,
+        assemble_with="Line",
+        accept="text/csv",
+        output_path=Join(on="/", values=[transform_output_path, ExecutionVariables.PIPELINE_EXECUTION_ID]),
+        base_transform_job_name=f"{base_job_prefix}/batch-transform",
+        sagemaker_session=sagemaker_session
+    )
+
+    step_transform = TransformStep(
+        name="batchTransform",
+        display_name="Batch transform",
+        description="Score input data with latest approved model",
+        transformer=transformer,
+        inputs=TransformInput(
+            data=transform_input_data,
+            content_type="text/csv",
+            split_type="Line",
+            # First column of input rows is ID, which is not sent to model but joined to its prediction
+            input_filter="$[1:]",
+            join_source="Input",
+            output_filter="$[0,-1]"
+        )
+    )
+
+
+    # Create pipeline definition
+    pipeline = Pipeline(
+        name=pipeline_name,
+        steps=[step_create_model, step_transform],
+        parameters=[
+            transform_input_data,
+            transform_output_path,
+            transform_instance_count,
+            transform_instance_type,
+            transform_max_concurrent_transforms,
+            transform_max_payload
+        ],
+        sagemaker_session=sagemaker_session
+    )
+
+    return pipeline
@@ -0,0 +1,339 @@
+import argparse
+import base64
+import datetime
+import glob
+import importlib
+import io
+import json
+import logging
+import math
+import os
+import pathlib
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+# Taken before heavy imports, so that startup time of processing job can be tracked
+script_start = time.time()
+
+import numpy as np
+import pandas as pd
+
+sys.path.append("/opt/ml/processing/input")
+from common.features import FeatureSchema
+from common.moments import combine_moments, get_moments
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+logger.addHandler(logging.StreamHandler())
+
+prediction_quantiles = [0.01, 0.05, 0.25, 0.5, 0.75, 0.95, 0.99]
+# Prediction quantiles are approximated from bounded uniform sample, as medians of streaming data preparation are
+prediction_sample_size = 100000
+
+
+def import_pyarrow():
+    """Imports pyarrow, installing it first if processing image does not include it."""
+    try:
+        return importlib.import_module("pyarrow"), importlib.import_module("pyarrow.parquet")
+    except ImportError:
+        logger.info("Installing pyarrow for parquet output.")
+        subprocess.run(["python", "-m", "pip", "install", "pyarrow"], check=True)
+        return importlib.import_module("pyarrow"), importlib.import_module("pyarrow.parquet")
+
+
+def decode_capture(capture):
+    """Returns captured payload as text, data capture stores CSV either as is or base64 encoded."""
+    if capture.get("encoding") == "BASE64":
+        return base64.b64decode(capture["data"]).decode("utf-8")
+    return capture["data"]
+
+
+def get_variant(path, input_dir):
+    """Data capture files are stored under `<endpoint>/<variant>/yyyy/mm/dd/hh/`."""
+    parts = pathlib.Path(os.path.relpath(path, input_dir)).parts
+    return parts[-6] if len(parts) >= 6 else "unknown"
+
+
+def read_capture_files(paths, input_dir, schema):
+    """Parses JSONL data capture files line by line into one row per captured CSV record of schema features.
+
+    Columns of requests are determined as endpoint does, label sent with request as last column is dropped.
+    """
+    event_ids, inference_times, variants, request_rows, inputs, predictions = [], [], [], [], [], []
+    n_events, n_mismatched, n_invalid = 0, 0, 0
+    for path in paths:
+        variant = get_variant(path, input_dir)
+        with open(path, "r") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                event = json.loads(line)
+                n_events += 1
+                capture = event["captureData"]
+                payload = decode_capture(capture["endpointInput"])
+                try:
+                    columns = schema.get_request_columns(payload)
+                except ValueError:
+                    n_invalid += 1
+                    continue
+                input_rows = payload.strip().splitlines()
+                if schema.label_column in columns:
+                    input_rows = [row.rsplit(",", 1)[0] for row in input_rows]
+                output_rows = decode_capture(capture["endpointOutput"]).strip().splitlines()
+                if len(input_rows) != len(output_rows):
+                    n_mismatched += 1
+                    continue
+
+                n_rows = len(input_rows)
+                event_ids.extend([event["eventMetadata"]["eventId"]] * n_rows)
+                inference_times.extend([event["eventMetadata"]["inferenceTime"]] * n_rows)
+                variants.extend([variant] * n_rows)
+                request_rows.extend([n_rows] * n_rows)
+                inputs.extend(input_rows)
+                predictions.extend(output_rows)
+
+    df = pd.read_csv(
+        io.StringIO("\n".join(inputs)),
+        header=None,
+        names=schema.feature_columns_names,
+        dtype=schema.feature_columns_dtype
+    ) if inputs else pd.DataFrame({name: pd.Series(dtype=dtype) for name, dtype in schema.feature_columns_dtype.items()})
+    df.insert(0, "event_id", event_ids)
+    df.insert(1, "inference_time", pd.to_datetime(pd.Series(inference_times, dtype=str), utc=True))
+    df.insert(2, "variant", variants)
+    df.insert(3, "request_rows", np.array(request_rows, dtype=np.int32))
+    df["prediction"] = pd.to_numeric(pd.Series(predictions, dtype=str), errors="coerce")
+    return df, n_events, n_mismatched, n_invalid
+
+
+def column_moments(values):
+    values = values[np.isfinite(values)]
+    count, mean, m2 = get_moments(values[:, np.newaxis])
+    return {
+        "count": int(count[0]),
+        "mean": float(mean[0]),
+        "m2": float(m2[0]),
+        "min": float(np.min(values)) if len(values) else None,
+        "max": float(np.max(values)) if len(values) else None,
+    }
+
+
+def merge_moments(moments):
+    """Merges moments of batches with the same parallel update as streaming statistics of data preparation."""
+    count, mean, m2 = 0, 0.0, 0.0
+    for m in moments:
+        count, mean, m2 = combine_moments((count, mean, m2), (m["count"], m["mean"], m["m2"]))
+    if count == 0:
+        return {"count": 0, "mean": None, "standard_deviation": None, "min": None, "max": None}
+    return {
+        "count": int(count),
+        "mean": float(mean),
+        "standard_deviation": math.sqrt(m2 / count),
+        "min": min(m["min"] for m in moments if m["min"] is not None),
+        "max": max(m["max"] for m in moments if m["max"] is not None),
+    }
+
+
+def sample_values(values, sample_size, keys=None):
+    """Returns uniform sample of finite values with their random keys, keeping sample_size values of lowest keys.
+
+    Samples of batches are merged by sampling their concatenation again, which keeps merged sample uniform.
+    """
+    if keys is None:
+        values = values[np.isfinite(values)]
+        keys = np.random.random_sample(len(values))
+    if len(values) > sample_size:
+        keep = np.argpartition(keys, sample_size)[:sample_size]
+        values, keys = values[keep], keys[keep]
+    return values, keys
+
+
+def process_batch(batch_index, paths, input_dir, output_dir, compression, schema):
+    """Converts batch of capture files to parquet files partitioned by hour of inference.
+
+    Only aggregates are returned, so memory of main process does not grow with amount of traffic.
+    """
+    pa, pq = import_pyarrow()
+    df, n_events, n_mismatched, n_invalid = read_capture_files(paths, input_dir, schema)
+    hours = df["inference_time"].dt.floor("h")
+    for hour, partition in df.groupby(hours):
+        partition_dir = os.path.join(output_dir, f"date={hour:%Y-%m-%d}", f"hour={hour:%H}")
+        pathlib.Path(partition_dir).mkdir(parents=True, exist_ok=True)
+        pq.write_table(
+            pa.Table.from_pandas(partition, preserve_index=False),
+            os.path.join(partition_dir, f"part-{batch_index:05d}.parquet"),
+            compression=compression
+        )
+
+    requests = df.drop_duplicates("event_id")
+    return {
+        "events": n_events,
+        "mismatched_events": n_mismatched,
+        "invalid_events": n_invalid,
+        "rows": int(len(df)),
+        "hourly_requests": {
+            hour.isoformat(): int(count) for hour, count in requests.groupby(requests["inference_time"].dt.floor("h")).size().items()
+        },
+        "variant_requests": {variant: int(count) for variant, count in requests["variant"].value_counts().items()},
+        "prediction": column_moments(df["prediction"].to_numpy(dtype=np.float64)),
+        "prediction_sample": sample_values(df["prediction"].to_numpy(dtype=np.float64), prediction_sample_size),
+        "numeric": {name: column_moments(df[name].to_numpy(dtype=np.float64)) for name in schema.numeric_features},
+        "categorical": {
+            name: {str(category): int(count) for category, count in df[name].fillna("missing").value_counts().items()}
+            for name in schema.categorical_features
+        },
+    }
+
+
+def get_latency_metrics(endpoint_name, variants, start_time, end_time):
+    """Returns hourly model latency of endpoint variants from CloudWatch, data capture does not record latency."""
+    import boto3
+
+    cloudwatch_client = boto3.client("cloudwatch")
+    latency = {}
+    for variant in variants:
+        queries = [
+            {
+                "Id": stat_id,
+                "MetricStat": {
+                    "Metric": {
+                        "Namespace": "AWS/SageMaker",
+                        "MetricName": "ModelLatency",
+                        "Dimensions": [
+                            {"Name": "EndpointName", "Value": endpoint_name},
+                            {"Name": "VariantName", "Value": variant}
+                        ]
+                    },
+                    "Period": 3600,
+                    "Stat": stat
+                }
+            }
+            for stat_id, stat in (("average", "Average"), ("p99", "p99"))
+        ]
+        results = cloudwatch_client.get_metric_data(
+            MetricDataQueries=queries, StartTime=start_time, EndTime=end_time, ScanBy="TimestampAscending"
+        )["MetricDataResults"]
+        # ModelLatency is reported in microseconds
+        series = {
+            result["Id"]: pd.Series([value / 1000 for value in result["Values"]], index=result["Timestamps"], dtype=np.float64)
+            for result in results
+        }
+        latency[variant] = {
+            "hourly_model_latency_ms": [
+                {"hour": hour.isoformat(), **{key: float(value) if np.isfinite(value) else None for key, value in row.items()}}
+                for hour, row in pd.DataFrame(series).sort_index().iterrows()
+            ],
+            "max_p99_model_latency_ms": float(series["p99"].max()) if len(series["p99"]) else None
+        }
+    return latency
+
+
+def get_sampling_recommendation(hourly_requests, sampling_percentage, min_hourly_samples):
+    """Recommends lowest sampling percentage still capturing min_hourly_samples requests in quiet hours."""
+    if len(hourly_requests) == 0:
+        return None
+    # Estimated total traffic of hours with captured requests, 10th percentile stands for quiet hours
+    quiet_hour_requests = np.quantile(np.array(list(hourly_requests.values())) * 100 / sampling_percentage, 0.1)
+    return int(min(100, max(1, math.ceil(100 * min_hourly_samples / quiet_hour_requests))))
+
+
+if __name__ == "__main__":
+    logger.info("Imports completed in %.2f seconds.", time.time() - script_start)
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files-per-batch", type=int, default=200, dest="files_per_batch")
+    parser.add_argument("--workers", type=int, default=None, dest="workers")
+    parser.add_argument("--compression", type=str, default="zstd", dest="compression")
+    parser.add_argument("--sampling-percentage", type=float, default=100, dest="sampling_percentage")
+    parser.add_argument("--min-hourly-samples", type=int, default=1000, dest="min_hourly_samples")
+    parser.add_argument("--endpoint-name", type=str, default=None, dest="endpoint_name")
+    parser.add_argument("--schema-file", type=str, default=None, dest="schema_file")
+    parser.add_argument("--base-dir", type=str, default="/opt/ml/processing", dest="base_dir")
+    args = parser.parse_args()
+
+    # Captured requests are CSV rows of raw features, in order of schema the endpoint model was trained with
+    schema = FeatureSchema.load(args.schema_file)
+    input_dir = f"{args.base_dir}/capture"
+    output_dir = f"{args.base_dir}/output/capture"
+    summary_dir = f"{args.base_dir}/output/summary"
+    paths = sorted(glob.glob(os.path.join(input_dir, "**", "*.jsonl"), recursive=True))
+    if len(paths) == 0:
+        raise Exception(f"No data capture files found in {input_dir}")
+
+    workers = args.workers or os.cpu_count() or 1
+    batches = [paths[i:i + args.files_per_batch] for i in range(0, len(paths), args.files_per_batch)]
+    logger.info("Processing %d data capture files in %d batches with %d workers.", len(paths), len(batches), workers)
+    # Prediction samples are merged as batches complete, so that main process keeps only one sample
+    results = []
+    predictions, prediction_keys = np.empty(0), np.empty(0)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for result in executor.map(
+            process_batch,
+            range(len(batches)),
+            batches,
+            [input_dir] * len(batches),
+            [output_dir] * len(batches),
+            [args.compression] * len(batches),
+            [schema] * len(batches)
+        ):
+            values, keys = result.pop("prediction_sample")
+            predictions, prediction_keys = sample_values(
+                np.concatenate((predictions, values)),
+                prediction_sample_size,
+                np.concatenate((prediction_keys, keys))
+            )
+            results.append(result)
+
+    hourly_requests, variant_requests, categorical = {}, {}, {name: {} for name in schema.categorical_features}
+    for result in results:
+        for hour, count in result["hourly_requests"].items():
+            hourly_requests[hour] = hourly_requests.get(hour, 0) + count
+        for variant, count in result["variant_requests"].items():
+            variant_requests[variant] = variant_requests.get(variant, 0) + count
+        for name, counts in result["categorical"].items():
+            for category, count in counts.items():
+                categorical[name][category] = categorical[name].get(category, 0) + count
+    hourly_requests = dict(sorted(hourly_requests.items()))
+
+    summary = {
+        "events": sum(result["events"] for result in results),
+        "mismatched_events": sum(result["mismatched_events"] for result in results),
+        "invalid_events": sum(result["invalid_events"] for result in results),
+        "rows": sum(result["rows"] for result in results),
+        "variant_requests": variant_requests,
+        "hourly_requests": hourly_requests,
+        "prediction": {
+            **merge_moments([result["prediction"] for result in results]),
+            "quantiles": {
+                str(q): float(value) for q, value in zip(prediction_quantiles, np.quantile(predictions, prediction_quantiles))
+            } if len(predictions) else {}
+        },
+        "numeric_features": {
+            name: merge_moments([result["numeric"][name] for result in results]) for name in schema.numeric_features
+        },
+        "categorical_features": categorical,
+        "sampling": {
+            "sampling_percentage": args.sampling_percentage,
+            "min_hourly_samples": args.min_hourly_samples,
+            "recommended_sampling_percentage": get_sampling_recommendation(
+                hourly_requests, args.sampling_percentage, args.min_hourly_samples
+            )
+        }
+    }
+
+    if args.endpoint_name and hourly_requests:
+        start_time = datetime.datetime.fromisoformat(min(hourly_requests))
+        end_time = datetime.datetime.fromisoformat(max(hourly_requests)) + datetime.timedelta(hours=1)
+        try:
+            summary["latency"] = get_latency_metrics(args.endpoint_name, list(variant_requests), start_time, end_time)
+        except Exception as e:
+            logger.warning("Latency metrics of endpoint %s could not be read: %s", args.endpoint_name, e)
+
+    pathlib.Path(summary_dir).mkdir(parents=True, exist_ok=True)
+    with open(f"{summary_dir}/summary.json", "w") as f:
+        json.dump(summary, f, indent=2)
+    logger.info(
+        "Wrote %d rows of %d captured requests, recommended sampling percentage: %s",
+        summary["rows"], summary["events"], summary["sampling"]["recommended_sampling_percentage"]
+    )
@@ -0,0 +1,232 @@
+import os
+
+import sagemaker.session
+from sagemaker.processing import ProcessingInput, ProcessingOutput, ScriptProcessor
+from sagemaker.sklearn.processing import SKLearnProcessor
+from sagemaker.workflow.conditions import ConditionGreaterThanOrEqualTo, ConditionLessThanOrEqualTo
+from sagemaker.workflow.condition_step import ConditionStep
+from sagemaker.workflow.execution_variables import ExecutionVariables
+from sagemaker.workflow.fail_step import FailStep
+from sagemaker.workflow.functions import Join, JsonGet
+from sagemaker.workflow.parameters import ParameterFloat, ParameterInteger, ParameterString
+from sagemaker.workflow.pipeline import Pipeline
+from sagemaker.workflow.properties import PropertyFile
+from sagemaker.workflow.steps import ProcessingStep
+
+from showcase.common.features import FeatureSchema, default_schema
+from showcase.pipeline import (
+    base_dir,
+    get_common_code_input,
+    get_model_registry,
+    get_schema_input,
+    get_sagemaker_session,
+)
+
+
+def get_baseline_uri(model_package):
+    """Returns S3 URI of baseline profile of training data, registered as model data statistics."""
+    statistics = model_package.get("ModelMetrics", {}).get("ModelDataQuality", {}).get("Statistics")
+    if statistics is None:
+        raise Exception(f"Model package {model_package['ModelPackageArn']} has no registered baseline profile")
+    return statistics["S3Uri"]
+
+
+def get_pipeline(
+    region,
+    role=None,
+    default_bucket=None,
+    endpoint_name="crayon-showcase-endpoint",
+    model_package_group_name="crayonShowcasePackageGroup",
+    pipeline_name="crayonShowcaseCapturePipeline",
+    base_job_prefix="crayonShowcase",
+    processing_image_uri=None,
+    enable_drift_check=True,
+    schema=None
+):
+    schema = default_schema if schema is None else FeatureSchema.from_dict(schema)
+
+    # Prepare session info
+    sagemaker_session = get_sagemaker_session(
+        region=region,
+        default_bucket=default_bucket
+    )
+    if role is None:
+        role = sagemaker.session.get_execution_role(sagemaker_session=sagemaker_session)
+
+    # Captured traffic is compared to training data of latest approved model, resolved when pipeline is published
+    if enable_drift_check:
+        model_package = get_model_registry(region).get_latest_approved_package(model_package_group_name)
+        if model_package is None:
+            raise Exception(f"No approved ModelPackage found for ModelPackageGroup: {model_package_group_name}")
+        baseline_uri = get_baseline_uri(model_package)
+
+
+    # Pipeline parameters
+    capture_input_data = ParameterString(
+        name="captureInputData",
+        default_value=f"s3://{sagemaker_session.default_bucket()}/datacapture-{endpoint_name}/{endpoint_name}"
+    )
+    capture_output_path = ParameterString(
+        name="captureOutputPath",
+        default_value=f"s3://{sagemaker_session.default_bucket()}/{base_job_prefix}/CaptureAnalytics"
+    )
+    capture_instance_type = ParameterString(name="captureInstanceType", default_value="ml.m5.xlarge")
+    capture_files_per_batch = ParameterInteger(name="captureFilesPerBatch", default_value=200)
+    capture_sampling_percentage = ParameterInteger(name="captureSamplingPercentage", default_value=100)
+    capture_min_hourly_samples = ParameterInteger(name="captureMinHourlySamples", default_value=1000)
+    drift_psi_threshold = ParameterFloat(name="driftPsiThreshold", default_value=0.2)
+    drift_ks_threshold = ParameterFloat(name="driftKsThreshold", default_value=0.1)
+    drift_p_value_threshold = ParameterFloat(name="driftPValueThreshold", default_value=0.0)
+
+
+    # Capture analytics step
+    if processing_image_uri is None:
+        capture_processor = SKLearnProcessor(
+            framework_version="0.23-1",
+            role=role,
+            instance_type=capture_instance_type,
+            instance_count=1,
+            base_job_name=f"{base_job_prefix}/sklearn-capture-analytics",
+            sagemaker_session=sagemaker_session,
+        )
+    else:
+        capture_processor = ScriptProcessor(
+            image_uri=processing_image_uri,
+            role=role,
+            command=["python3"],
+            instance_type=capture_instance_type,
+            instance_count=1,
+            base_job_name=f"{base_job_prefix}/capture-analytics",
+            sagemaker_session=sagemaker_session,
+        )
+
+    capture_output_prefix = [capture_output_path, ExecutionVariables.PIPELINE_EXECUTION_ID]
+    step_capture = ProcessingStep(
+        name="analyseCapture",
+        display_name="Analyse data capture",
+        description="Convert captured endpoint traffic to partitioned parquet files and summary statistics",
+        code=os.path.join(base_dir, "capture.py"),
+        job_arguments=[
+            "--files-per-batch", capture_files_per_batch.to_string(),
+            "--sampling-percentage", capture_sampling_percentage.to_string(),
+            "--min-hourly-samples", capture_min_hourly_samples.to_string(),
+            "--endpoint-name", endpoint_name,
+            "--schema-file", "/opt/ml/processing/input/schema/schema.json"
+        ],
+        processor=capture_processor,
+        inputs=[
+            ProcessingInput(
+                input_name="capture",
+                source=capture_input_data,
+                destination="/opt/ml/processing/capture"
+            ),
+            get_common_code_input(),
+            get_schema_input(schema)
+        ],
+        outputs=[
+            ProcessingOutput(
+                output_name="capture",
+                source="/opt/ml/processing/output/capture",
+                destination=Join(on="/", values=capture_output_prefix + ["capture"])
+            ),
+            ProcessingOutput(
+                output_name="summary",
+                source="/opt/ml/processing/output/summary",
+                destination=Join(on="/", values=capture_output_prefix + ["summary"])
+            )
+        ]
+    )
+
+
+    steps = [step_capture]
+    if enable_drift_check:
+        # Drift check step
+        drift_prop_file = PropertyFile(
+            name="driftReport",
+            output_name="drift_report",
+            path="drift.json"
+        )
+
+        step_drift = ProcessingStep(
+            name="checkDrift",
+            display_name="Check data drift",
+            description="Compare captured features to baseline profile of training data",
+            code=os.path.join(base_dir, "drift.py"),
+            job_arguments=[
+                "--psi-threshold", drift_psi_threshold.to_string(),
+                "--ks-threshold", drift_ks_threshold.to_string(),
+                "--p-value-threshold", drift_p_value_threshold.to_string()
+            ],
+            processor=capture_processor,
+            inputs=[
+                ProcessingInput(
+                    source=step_capture.properties.ProcessingOutputConfig.Outputs["capture"].S3Output.S3Uri,
+                    destination="/opt/ml/processing/capture"
+                ),
+                ProcessingInput(
+                    source=baseline_uri,
+                    destination="/opt/ml/processing/baseline"
+                ),
+                get_common_code_input()
+            ],
+            outputs=[
+                ProcessingOutput(
+                    output_name="drift_report",
+                    source="/opt/ml/processing/drift",
+                    destination=Join(on="/", values=capture_output_prefix + ["drift"])
+                )
+            ],
+            property_files=[drift_prop_file]
+        )
+
+        conditions_drift = [
+            ConditionLessThanOrEqualTo(
+                left=JsonGet(step_name=step_drift.name, property_file=drift_prop_file, json_path="summary.max_psi"),
+                right=drift_psi_threshold
+            ),
+            ConditionLessThanOrEqualTo(
+                left=JsonGet(step_name=step_drift.name, property_file=drift_prop_file, json_path="summary.max_ks"),
+                right=drift_ks_threshold
+            ),
+            ConditionGreaterThanOrEqualTo(
+                left=JsonGet(step_name=step_drift.name, property_file=drift_prop_file, json_path="summary.min_chi_square_p_value"),
+                right=drift_p_value_threshold
+            )
+        ]
+
+        step_fail = FailStep(
+            name="failDataDrift",
+            display_name="Data drift detected",
+            error_message="Fail pipeline due to captured traffic drifting from training data."
+        )
+
+        step_condition = ConditionStep(
+            name="reviewDrift",
+            display_name="Review data drift",
+            description="Review drift scores of captured traffic and fail pipeline when drift is detected",
+            conditions=conditions_drift,
+            if_steps=[],
+            else_steps=[step_fail]
+        )
+        steps += [step_drift, step_condition]
+
+
+    # Create pipeline definition
+    pipeline = Pipeline(
+        name=pipeline_name,
+        steps=steps,
+        parameters=[
+            capture_input_data,
+            capture_output_path,
+            capture_instance_type,
+            capture_files_per_batch,
+            capture_sampling_percentage,
+            capture_min_hourly_samples,
+            drift_psi_threshold,
+            drift_ks_threshold,
+            drift_p_value_threshold
+        ],
+        sagemaker_session=sagemaker_session
+    )
+
+    return pipeline
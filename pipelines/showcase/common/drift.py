@@ -0,0 +1,168 @@
+import json
+
+import numpy as np
+
+
+# Lower bound of bin proportions, so that empty bins do not make PSI infinite
+min_proportion = 1e-4
+
+
+class BaselineProfileBuilder:
+    """Accumulates baseline profile of raw feature rows chunk by chunk.
+
+    Quantiles are computed from a bounded uniform sample of non-null values of each
+    numeric feature, missing values and category frequencies are counted exactly.
+    """
+
+    def __init__(self, numeric_features, categorical_features, sample_size=100000):
+        self.numeric_features = numeric_features
+        self.categorical_features = categorical_features
+        self.sample_size = sample_size
+        self.count = 0
+        self.missing = np.zeros(len(numeric_features))
+        self.samples = [np.empty(0) for _ in numeric_features]
+        self.sample_keys = [np.empty(0) for _ in numeric_features]
+        self.categories = {name: {} for name in categorical_features}
+
+    def update(self, df):
+        values = df[self.numeric_features].to_numpy(dtype=np.float64)
+        nan_mask = np.isnan(values)
+        self.count += len(df)
+        self.missing += nan_mask.sum(axis=0)
+
+        for i in range(len(self.numeric_features)):
+            column = values[~nan_mask[:, i], i]
+            samples = np.concatenate((self.samples[i], column))
+            keys = np.concatenate((self.sample_keys[i], np.random.random_sample(len(column))))
+            if len(samples) > self.sample_size:
+                keep = np.argpartition(keys, self.sample_size)[:self.sample_size]
+                samples, keys = samples[keep], keys[keep]
+            self.samples[i], self.sample_keys[i] = samples, keys
+
+        for name in self.categorical_features:
+            for category, count in df[name].fillna("missing").value_counts().items():
+                self.categories[name][str(category)] = self.categories[name].get(str(category), 0) + int(count)
+
+    def finalize(self, metadata=None):
+        numeric = {}
+        for i, name in enumerate(self.numeric_features):
+            sample = self.samples[i]
+            quantiles = np.quantile(sample, np.linspace(0, 1, 101)) if len(sample) else np.zeros(101)
+            edges = np.unique(quantiles[1:-1])
+            counts = np.bincount(np.searchsorted(edges, sample, side="right"), minlength=len(edges) + 1)
+            numeric[name] = {
+                "missing_fraction": float(self.missing[i] / self.count) if self.count else 0.0,
+                "quantiles": quantiles.tolist(),
+                "proportions": (counts / max(len(sample), 1)).tolist(),
+            }
+
+        categorical = {
+            name: {category: count / self.count for category, count in sorted(categories.items())}
+            for name, categories in self.categories.items()
+        }
+        return BaselineProfile(numeric, categorical, metadata=metadata)
+
+
+class BaselineProfile:
+    """Distributions of raw features in training data, used as reference for drift detection.
+
+    Numeric features are described by percentiles (quantile sketch) and proportions of
+    values falling in bins between distinct percentiles, categorical features by
+    category frequencies, with missing values counted as category 'missing'.
+    """
+
+    format_version = 1
+
+    def __init__(self, numeric, categorical, metadata=None):
+        self.numeric = numeric
+        self.categorical = categorical
+        self.metadata = metadata or {}
+
+        self._edges = {name: np.unique(np.array(profile["quantiles"][1:-1])) for name, profile in numeric.items()}
+        # Decile bins used for PSI are unions of neighbouring percentile bins
+        self._coarse_bins = {}
+        for name, profile in numeric.items():
+            coarse_edges = np.unique(np.array(profile["quantiles"][10:100:10]))
+            lower_edges = self._edges[name]
+            self._coarse_bins[name] = np.concatenate(([0], np.searchsorted(coarse_edges, lower_edges, side="right")))
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "r") as f:
+            params = json.load(f)
+        if params.get("format_version") != cls.format_version:
+            raise Exception(f"Unsupported baseline profile format version {params.get('format_version')}")
+
+        return cls(params["numeric"], params["categorical"], params.get("metadata"))
+
+    def save(self, path):
+        with open(path, "w") as f:
+            json.dump(
+                {
+                    "format_version": self.format_version,
+                    "numeric": self.numeric,
+                    "categorical": self.categorical,
+                    "metadata": self.metadata,
+                },
+                f
+            )
+
+    def bin_counts(self, name, values):
+        """Counts non-null values of numeric feature in percentile bins, in single vectorized pass."""
+        values = values[~np.isnan(values)]
+        edges = self._edges[name]
+        return np.bincount(np.searchsorted(edges, values, side="right"), minlength=len(edges) + 1)
+
+    def numeric_drift(self, name, counts, missing):
+        """Returns PSI over decile bins and KS statistic over percentile bins of numeric feature."""
+        expected = np.array(self.numeric[name]["proportions"])
+        total = counts.sum()
+        actual = counts / total if total else np.zeros_like(expected)
+        coarse_bins = self._coarse_bins[name]
+        n_coarse = coarse_bins.max() + 1
+        return {
+            "psi": psi(
+                np.bincount(coarse_bins, weights=expected, minlength=n_coarse),
+                np.bincount(coarse_bins, weights=actual, minlength=n_coarse)
+            ),
+            # Maximum distance of cumulative distributions, evaluated at percentile bin edges
+            "ks": float(np.max(np.abs(np.cumsum(actual) - np.cumsum(expected)))) if total else None,
+            "missing_fraction": float(missing / (total + missing)) if total + missing else None,
+            "baseline_missing_fraction": self.numeric[name]["missing_fraction"],
+        }
+
+    def categorical_drift(self, name, counts):
+        """Returns PSI and chi-square test of captured category counts against baseline frequencies."""
+        baseline = self.categorical[name]
+        categories = sorted(set(baseline) | set(counts))
+        expected = np.array([baseline.get(category, 0.0) for category in categories])
+        observed = np.array([counts.get(category, 0) for category in categories], dtype=np.float64)
+        total = observed.sum()
+        if total == 0:
+            return {"psi": None, "chi_square": None, "p_value": None, "unseen_categories": []}
+
+        expected_counts = np.maximum(expected, min_proportion) * total
+        chi_square = float(np.sum((observed - expected_counts) ** 2 / expected_counts))
+        return {
+            "psi": psi(expected, observed / total),
+            "chi_square": chi_square,
+            "p_value": chi_square_p_value(chi_square, len(categories) - 1),
+            "unseen_categories": [category for category in categories if category not in baseline],
+        }
+
+
+def psi(expected, actual):
+    """Population stability index of two distributions over the same bins."""
+    expected = np.maximum(expected, min_proportion)
+    actual = np.maximum(actual, min_proportion)
+    return float(np.sum((actual - expected) * np.log(actual / expected)))
+
+
+def chi_square_p_value(chi_square, degrees_of_freedom):
+    if degrees_of_freedom < 1:
+        return 1.0
+    try:
+        from scipy.stats import chi2
+    except ImportError:
+        return None
+    return float(chi2.sf(chi_square, degrees_of_freedom))
@@ -0,0 +1,183 @@
+import json
+
+import numpy as np
+
+
+feature_columns_names = [
+    "sex",
+    "length",
+    "diameter",
+    "height",
+    "whole_weight",
+    "shucked_weight",
+    "viscera_weight",
+    "shell_weight",
+]
+label_column = "rings"
+
+feature_columns_dtype = {
+    "sex": str,
+    "length": np.float64,
+    "diameter": np.float64,
+    "height": np.float64,
+    "whole_weight": np.float64,
+    "shucked_weight": np.float64,
+    "viscera_weight": np.float64,
+    "shell_weight": np.float64,
+}
+label_column_dtype = {"rings": np.float64}
+
+categorical_features = ["sex"]
+numeric_features = [name for name in feature_columns_names if name not in categorical_features]
+
+# Dtypes of raw columns supported in schema, features of dtype str are categorical
+schema_dtypes = {"str": str, "float64": np.float64, "float32": np.float32, "int64": np.int64}
+
+
+class FeatureSchema:
+    """Raw feature columns in order of raw data, their dtypes and label column.
+
+    Schema is stored as JSON of the form
+    `{"features": {"sex": "str", "length": "float64", ...}, "label": {"rings": "float64"}}`,
+    default schema describes abalone dataset.
+    """
+
+    def __init__(self, features, label):
+        for name, dtype in list(features.items()) + list(label.items()):
+            if dtype not in schema_dtypes:
+                raise Exception(f"Unsupported dtype {dtype} of column {name}, supported: {list(schema_dtypes)}")
+        if len(label) != 1:
+            raise Exception(f"Schema must have exactly one label column, got {list(label)}")
+        self.features = dict(features)
+        self.label = dict(label)
+
+        self.feature_columns_names = list(features)
+        self.feature_columns_dtype = {name: schema_dtypes[dtype] for name, dtype in features.items()}
+        self.label_column = list(label)[0]
+        self.label_column_dtype = {self.label_column: schema_dtypes[label[self.label_column]]}
+        self.categorical_features = [name for name, dtype in features.items() if dtype == "str"]
+        self.numeric_features = [name for name, dtype in features.items() if dtype != "str"]
+
+    @classmethod
+    def from_dict(cls, params):
+        return cls(params["features"], params["label"])
+
+    @classmethod
+    def load(cls, path=None):
+        """Loads schema from JSON file, or returns default schema when no path is given."""
+        if path is None:
+            return default_schema
+        with open(path, "r") as f:
+            return cls.from_dict(json.load(f))
+
+    def to_dict(self):
+        return {"features": self.features, "label": self.label}
+
+    def get_request_columns(self, payload):
+        """Returns columns of CSV request payload, whose rows may optionally include label as last column."""
+        n_columns = payload.lstrip().split("\n", 1)[0].count(",") + 1
+        if n_columns == len(self.feature_columns_names) + 1:
+            return self.feature_columns_names + [self.label_column]
+        if n_columns == len(self.feature_columns_names):
+            return self.feature_columns_names
+        raise ValueError(f"Expected {len(self.feature_columns_names)} feature columns, received {n_columns}.")
+
+    def save(self, path):
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, indent=4)
+
+
+default_schema = FeatureSchema(
+    {name: "str" if name in categorical_features else "float64" for name in feature_columns_names},
+    {label_column: "float64"}
+)
+
+
+class FeatureTransformer:
+    """Fitted preprocessing parameters applied with vectorized NumPy operations.
+
+    Output matches layout of fitted preprocessing ColumnTransformer: numeric
+    features imputed with median and standard scaled, followed by one-hot
+    encoded categorical features with missing values encoded as 'missing'
+    and unknown categories ignored.
+    """
+
+    format_version = 1
+
+    def __init__(self, numeric, categorical, metadata=None):
+        self.numeric = {
+            name: {key: float(value) for key, value in stats.items()}
+            for name, stats in numeric.items()
+        }
+        self.categorical = {name: [str(c) for c in categories] for name, categories in categorical.items()}
+        self.metadata = metadata or {}
+
+        self._medians = np.array([stats["median"] for stats in self.numeric.values()])
+        self._means = np.array([stats["mean"] for stats in self.numeric.values()])
+        self._scales = np.array([stats["scale"] for stats in self.numeric.values()])
+        self._categories = {name: np.array(categories) for name, categories in self.categorical.items()}
+
+    @classmethod
+    def from_column_transformer(cls, column_transformer, metadata=None):
+        """Extracts parameters from fitted ColumnTransformer with 'num' and 'cat' pipelines."""
+        num_pipeline = column_transformer.named_transformers_["num"]
+        cat_pipeline = column_transformer.named_transformers_["cat"]
+        columns = {name: columns for name, _, columns in column_transformer.transformers_}
+        imputer = num_pipeline.named_steps["imputer"]
+        scaler = num_pipeline.named_steps["scaler"]
+        encoder = cat_pipeline.named_steps["onehot"]
+
+        numeric = {
+            name: {"median": imputer.statistics_[i], "mean": scaler.mean_[i], "scale": scaler.scale_[i]}
+            for i, name in enumerate(columns["num"])
+        }
+        categorical = {name: list(encoder.categories_[i]) for i, name in enumerate(columns["cat"])}
+        return cls(numeric, categorical, metadata)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "r") as f:
+            params = json.load(f)
+        if params.get("format_version") != cls.format_version:
+            raise Exception(f"Unsupported preprocessor format version {params.get('format_version')}")
+
+        return cls(params["numeric"], params["categorical"], params.get("metadata"))
+
+    def save(self, path):
+        with open(path, "w") as f:
+            json.dump(
+                {
+                    "format_version": self.format_version,
+                    "numeric": self.numeric,
+                    "categorical": self.categorical,
+                    "metadata": self.metadata,
+                },
+                f,
+                indent=4
+            )
+
+    @property
+    def schema(self):
+        """Schema of raw data transformer was fitted on, as recorded in its metadata."""
+        if "schema" not in self.metadata:
+            return default_schema
+        return FeatureSchema.from_dict(self.metadata["schema"])
+
+    @property
+    def feature_names(self):
+        names = list(self.numeric)
+        for name, categories in self.categorical.items():
+            names.extend(f"{name}_{category}" for category in categories)
+        return names
+
+    def transform(self, df, dtype=np.float64):
+        """Transforms DataFrame with raw feature columns into 2D array of dtype, scaling in float64."""
+        values = df[list(self.numeric)].to_numpy(dtype=np.float64)
+        values = (np.where(np.isnan(values), self._medians, values) - self._means) / self._scales
+
+        encoded = [values.astype(dtype, copy=False)]
+        for name, categories in self._categories.items():
+            column = df[name].fillna("missing").to_numpy(dtype=str)
+            encoded.append((column[:, None] == categories[None, :]).astype(dtype))
+
+        return np.concatenate(encoded, axis=1)
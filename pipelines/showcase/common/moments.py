@@ -0,0 +1,24 @@
+import numpy as np
+
+
+def get_moments(values):
+    """Returns count, mean and sum of squared deviations from mean of non-null values in every column of 2D values."""
+    nan_mask = np.isnan(values)
+    count = (~nan_mask).sum(axis=0)
+    total = np.where(nan_mask, 0.0, values).sum(axis=0)
+    mean = np.divide(total, count, out=np.zeros_like(total), where=count > 0)
+    m2 = np.where(nan_mask, 0.0, (values - mean) ** 2).sum(axis=0)
+    return count, mean, m2
+
+
+def combine_moments(moments, other):
+    """Chan et al. parallel update of (count, mean, sum of squared deviations) with moments of other values.
+
+    Unlike sums of squares, it does not lose precision when mean is large relative to spread of values.
+    """
+    count, mean, m2 = moments
+    other_count, other_mean, other_m2 = other
+    total = np.add(count, other_count, dtype=np.float64)
+    delta = np.subtract(other_mean, mean)
+    ratio = np.divide(other_count, total, out=np.zeros_like(total), where=total > 0)
+    return total, mean + delta * ratio, m2 + other_m2 + delta ** 2 * count * ratio
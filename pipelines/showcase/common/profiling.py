@@ -0,0 +1,144 @@
+import contextlib
+import cProfile
+import io
+import json
+import os
+import pstats
+import resource
+import socket
+import time
+import tracemalloc
+
+profiler_modes = ["none", "cprofile", "tracemalloc"]
+
+
+def get_current_host(resource_config_path="/opt/ml/config/resourceconfig.json"):
+    """Returns host name within processing cluster (e.g. algo-1), which is stable between runs."""
+    if not os.path.exists(resource_config_path):
+        return socket.gethostname()
+    with open(resource_config_path, "r") as f:
+        return json.load(f)["current_host"]
+
+
+def peak_rss_mb(who=resource.RUSAGE_SELF):
+    # ru_maxrss is reported in kilobytes on Linux
+    return resource.getrusage(who).ru_maxrss / 1024
+
+
+class Profiler:
+    """Lightweight instrumentation of processing scripts.
+
+    Phase timers record wall and CPU time and peak RSS at the end of each phase, phases
+    with the same name are accumulated. With mode 'cprofile' or 'tracemalloc', the whole
+    run is additionally profiled by cProfile or traced by tracemalloc, both of which slow
+    down the script and are therefore disabled by default.
+    """
+
+    def __init__(self, script, mode="none", metadata=None, started=None):
+        if mode not in profiler_modes:
+            raise Exception(f"Unsupported profiler mode {mode}, supported: {profiler_modes}")
+        self.script = script
+        self.mode = mode
+        self.metadata = metadata or {}
+        self.phases = {}
+        # Total time is measured from given start, e.g. script start before heavy imports
+        self.started = started or time.time()
+        self.cprofile = None
+        if mode == "cprofile":
+            self.cprofile = cProfile.Profile()
+            self.cprofile.enable()
+        elif mode == "tracemalloc":
+            tracemalloc.start()
+
+    def record(self, name, seconds, cpu_seconds=0.0):
+        phase = self.phases.setdefault(name, {"seconds": 0.0, "cpu_seconds": 0.0, "calls": 0})
+        phase["seconds"] += seconds
+        phase["cpu_seconds"] += cpu_seconds
+        phase["calls"] += 1
+        phase["peak_rss_mb"] = peak_rss_mb()
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        start, cpu_start = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start, time.process_time() - cpu_start)
+
+    def iterate(self, name, iterable):
+        """Yields items of iterable, recording time spent producing them as phase, e.g. reading input chunks."""
+        iterator = iter(iterable)
+        while True:
+            start, cpu_start = time.perf_counter(), time.process_time()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                self.record(name, time.perf_counter() - start, time.process_time() - cpu_start)
+            yield item
+
+    def report(self):
+        report = {
+            "script": self.script,
+            "host": get_current_host(),
+            "mode": self.mode,
+            "seconds": time.time() - self.started,
+            "peak_rss_mb": peak_rss_mb(),
+            # Worker processes, e.g. of process pools, are accounted separately
+            "peak_rss_children_mb": peak_rss_mb(resource.RUSAGE_CHILDREN),
+            "phases": self.phases,
+            "metadata": self.metadata,
+        }
+        if self.mode == "tracemalloc":
+            current, peak = tracemalloc.get_traced_memory()
+            report["tracemalloc"] = {
+                "current_mb": current / 1024 ** 2,
+                "peak_mb": peak / 1024 ** 2,
+                "top": [
+                    {"location": str(stat.traceback), "size_mb": stat.size / 1024 ** 2, "count": stat.count}
+                    for stat in tracemalloc.take_snapshot().statistics("lineno")[:20]
+                ],
+            }
+        return report
+
+    def save(self, output_dir):
+        """Writes profile.json to output_dir, with cProfile stats next to it when enabled."""
+        os.makedirs(output_dir, exist_ok=True)
+        if self.cprofile is not None:
+            self.cprofile.disable()
+            self.cprofile.dump_stats(os.path.join(output_dir, "cprofile.prof"))
+            stream = io.StringIO()
+            pstats.Stats(self.cprofile, stream=stream).sort_stats("cumulative").print_stats(30)
+            with open(os.path.join(output_dir, "cprofile.txt"), "w") as f:
+                f.write(stream.getvalue())
+
+        report = self.report()
+        if self.mode == "tracemalloc":
+            tracemalloc.stop()
+        with open(os.path.join(output_dir, "profile.json"), "w") as f:
+            json.dump(report, f, indent=2)
+        return report
+
+
+def summarize_profiles(profiles, baseline_profiles=None):
+    """Returns rows of script, host, phase, seconds, peak RSS and change of seconds against baseline profiles."""
+    baseline_seconds = {
+        (profile["script"], profile["host"], phase): values["seconds"]
+        for profile in baseline_profiles or []
+        for phase, values in list(profile["phases"].items()) + [("total", profile)]
+    }
+    rows = []
+    for profile in sorted(profiles, key=lambda p: (p["script"], p["host"])):
+        for phase, values in list(profile["phases"].items()) + [("total", profile)]:
+            baseline = baseline_seconds.get((profile["script"], profile["host"], phase))
+            change = (values["seconds"] - baseline) / baseline if baseline else None
+            rows.append((profile["script"], profile["host"], phase, values["seconds"], values["peak_rss_mb"], change))
+    return rows
+
+
+def print_profile_summary(profiles, baseline_profiles=None, log=print):
+    log(f"{'Script':<12} {'Host':<16} {'Phase':<24} {'Seconds':>10} {'Peak RSS (MB)':>14} {'Change':>8}")
+    for script, host, phase, seconds, rss, change in summarize_profiles(profiles, baseline_profiles):
+        change = "" if change is None else f"{change:+.0%}"
+        log(f"{script:<12} {host[:16]:<16} {phase:<24} {seconds:>10.2f} {rss:>14.0f} {change:>8}")
@@ -0,0 +1,154 @@
+import configparser
+import hashlib
+import json
+import logging
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+from boto3.s3.transfer import TransferConfig
+from botocore.exceptions import ClientError
+
+logger = logging.getLogger(__name__)
+
+base_dir = os.path.dirname(os.path.realpath(__file__))
+repo_dir = os.path.dirname(os.path.dirname(base_dir))
+
+default_local_cache_dir = os.path.join(os.path.expanduser("~"), ".cache", "crayon-showcase", "datasets")
+
+
+def split_s3_uri(uri):
+    parsed = urlparse(uri)
+    return parsed.netloc, parsed.path.lstrip("/")
+
+
+def get_dvc_remote_url(remote="abalone", dvc_config=os.path.join(repo_dir, ".dvc", "config")):
+    config = configparser.ConfigParser()
+    config.read(dvc_config)
+    # DVC writes section names of remotes quoted, e.g. ['remote "abalone"']
+    for section in (f'remote "{remote}"', f"'remote \"{remote}\"'"):
+        if section in config:
+            return config[section]["url"].rstrip("/")
+    raise Exception(f"DVC remote {remote} not found in {dvc_config}")
+
+
+def get_dvc_out(data_path, dvc_file=os.path.join(repo_dir, "data.dvc")):
+    """Returns md5 hash of DVC tracked output and path of data_path within it, as recorded in DVC file."""
+    out = {}
+    with open(dvc_file, "r") as f:
+        for line in f:
+            key, _, value = line.strip().lstrip("- ").partition(":")
+            if key in ("md5", "path"):
+                out[key] = value.strip()
+
+    if "md5" not in out or not (data_path == out.get("path") or data_path.startswith(f"{out.get('path')}/")):
+        raise Exception(f"No DVC output containing {data_path} found in {dvc_file}")
+    return out["md5"], os.path.relpath(data_path, out["path"])
+
+
+def get_remote_key(prefix, md5):
+    """DVC 2.x remote layout, object stored under first two characters of its md5 hash."""
+    return f"{prefix}/{md5[:2]}/{md5[2:]}" if prefix else f"{md5[:2]}/{md5[2:]}"
+
+
+def file_md5(path, dos2unix=False):
+    md5 = hashlib.md5()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            md5.update(block.replace(b"\r\n", b"\n") if dos2unix else block)
+    return md5.hexdigest()
+
+
+def verify_md5(path, md5):
+    # DVC 2.x hashes text files with normalized line endings
+    if file_md5(path) != md5 and file_md5(path, dos2unix=True) != md5:
+        raise Exception(f"Content of {path} does not match md5 hash {md5}")
+
+
+def s3_object_exists(s3_client, bucket, key):
+    try:
+        s3_client.head_object(Bucket=bucket, Key=key)
+        return True
+    except ClientError as e:
+        if e.response["Error"]["Code"] in ("404", "NoSuchKey", "NotFound"):
+            return False
+        raise
+
+
+def download_object(s3_client, bucket, key, path, part_size=8 * 1024 * 1024, workers=8):
+    """Downloads S3 object with parallel ranged GETs, each part written directly to its offset in file."""
+    size = s3_client.head_object(Bucket=bucket, Key=key)["ContentLength"]
+    with open(path, "wb") as f:
+        f.truncate(size)
+
+    def download_part(start):
+        end = min(start + part_size, size) - 1
+        body = s3_client.get_object(Bucket=bucket, Key=key, Range=f"bytes={start}-{end}")["Body"]
+        with open(path, "r+b") as f:
+            f.seek(start)
+            for block in iter(lambda: body.read(1024 * 1024), b""):
+                f.write(block)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        # Consume results, so that failure of any part is raised
+        list(executor.map(download_part, range(0, size, part_size)))
+
+
+def fetch_dataset(
+    s3_client,
+    data_path,
+    s3_cache_prefix,
+    local_cache_dir=default_local_cache_dir,
+    remote="abalone",
+    workers=8
+):
+    """Returns S3 URI of dataset file tracked by DVC, cached under prefix keyed on DVC content hash.
+
+    Dataset is looked up in S3 cache first, then in local cache, and only then downloaded
+    from DVC remote. Downloaded file is verified against its md5 hash before it is cached.
+    """
+    out_md5, relpath = get_dvc_out(data_path)
+    file_name = os.path.basename(data_path) if relpath == "." else relpath
+    cache_path = f"{out_md5.replace('.dir', '')}/{file_name}"
+
+    cache_bucket, cache_prefix = split_s3_uri(s3_cache_prefix)
+    cache_key = f"{cache_prefix.rstrip('/')}/{cache_path}"
+    cache_uri = f"s3://{cache_bucket}/{cache_key}"
+    if s3_object_exists(s3_client, cache_bucket, cache_key):
+        logger.info("Dataset %s found in S3 cache %s", data_path, cache_uri)
+        return cache_uri
+
+    local_path = os.path.join(local_cache_dir, *cache_path.split("/"))
+    if not os.path.exists(local_path):
+        remote_bucket, remote_prefix = split_s3_uri(get_dvc_remote_url(remote))
+        if out_md5.endswith(".dir"):
+            # Directory listing maps paths of files in tracked directory to their md5 hashes
+            listing = s3_client.get_object(Bucket=remote_bucket, Key=get_remote_key(remote_prefix, out_md5))
+            md5 = {entry["relpath"]: entry["md5"] for entry in json.load(listing["Body"])}.get(relpath)
+            if md5 is None:
+                raise Exception(f"File {relpath} not found in DVC directory {out_md5}")
+        else:
+            md5 = out_md5
+
+        logger.info("Downloading dataset %s from DVC remote %s", data_path, remote)
+        os.makedirs(os.path.dirname(local_path), exist_ok=True)
+        # Pipelines may be defined concurrently, so each download goes to its own file, which is moved to cache
+        # only once verified. Cached file is replaced atomically, possibly by identical file of another download.
+        fd, part_path = tempfile.mkstemp(
+            dir=os.path.dirname(local_path), prefix=f"{os.path.basename(local_path)}.", suffix=".part"
+        )
+        os.close(fd)
+        try:
+            download_object(s3_client, remote_bucket, get_remote_key(remote_prefix, md5), part_path, workers=workers)
+            verify_md5(part_path, md5)
+            os.replace(part_path, local_path)
+        except Exception:
+            os.remove(part_path)
+            raise
+
+    logger.info("Uploading dataset %s to S3 cache %s", data_path, cache_uri)
+    s3_client.upload_file(
+        local_path, cache_bucket, cache_key, Config=TransferConfig(max_concurrency=workers)
+    )
+    return cache_uri
@@ -0,0 +1,126 @@
+import argparse
+import glob
+import importlib
+import json
+import logging
+import os
+import pathlib
+import subprocess
+import sys
+import time
+
+# Taken before heavy imports, so that startup time of processing job can be tracked
+script_start = time.time()
+
+import numpy as np
+
+sys.path.append("/opt/ml/processing/input")
+from common.drift import BaselineProfile
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+logger.addHandler(logging.StreamHandler())
+
+
+def import_pyarrow_parquet():
+    """Imports pyarrow parquet module, installing pyarrow first if processing image does not include it."""
+    try:
+        return importlib.import_module("pyarrow.parquet")
+    except ImportError:
+        logger.info("Installing pyarrow for reading parquet input.")
+        subprocess.run(["python", "-m", "pip", "install", "pyarrow"], check=True)
+        return importlib.import_module("pyarrow.parquet")
+
+
+class DriftAccumulator:
+    """Accumulates bin and category counts of captured features batch by batch, memory bound by batch size."""
+
+    def __init__(self, profile):
+        self.profile = profile
+        self.n_rows = 0
+        self.counts = {name: 0 for name in profile.numeric}
+        self.missing = {name: 0 for name in profile.numeric}
+        self.categories = {name: {} for name in profile.categorical}
+
+    def update(self, df):
+        self.n_rows += len(df)
+        for name in self.profile.numeric:
+            values = df[name].to_numpy(dtype=np.float64)
+            self.counts[name] = self.counts[name] + self.profile.bin_counts(name, values)
+            self.missing[name] += int(np.isnan(values).sum())
+        for name in self.profile.categorical:
+            for category, count in df[name].fillna("missing").value_counts().items():
+                self.categories[name][str(category)] = self.categories[name].get(str(category), 0) + int(count)
+
+    def report(self, psi_threshold, ks_threshold, p_value_threshold):
+        features = {
+            **{
+                name: self.profile.numeric_drift(name, np.asarray(self.counts[name]), self.missing[name])
+                for name in self.profile.numeric
+            },
+            **{name: self.profile.categorical_drift(name, self.categories[name]) for name in self.profile.categorical},
+        }
+
+        def values(key):
+            return [scores[key] for scores in features.values() if scores.get(key) is not None]
+
+        drifted = [
+            name for name, scores in features.items()
+            if (scores.get("psi") or 0.0) > psi_threshold
+            or (scores.get("ks") or 0.0) > ks_threshold
+            or (scores.get("p_value") is not None and scores["p_value"] < p_value_threshold)
+        ]
+        return {
+            "features": features,
+            "summary": {
+                "n_rows": self.n_rows,
+                "max_psi": max(values("psi"), default=0.0),
+                "max_ks": max(values("ks"), default=0.0),
+                "min_chi_square_p_value": min(values("p_value"), default=1.0),
+                "drifted_features": drifted,
+                "drift_detected": len(drifted) > 0,
+            },
+        }
+
+
+if __name__ == "__main__":
+    logger.info("Imports completed in %.2f seconds.", time.time() - script_start)
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--psi-threshold", type=float, default=0.2, dest="psi_threshold")
+    parser.add_argument("--ks-threshold", type=float, default=0.1, dest="ks_threshold")
+    # On millions of rows chi-square test rejects negligible differences, so it is disabled by default
+    parser.add_argument("--p-value-threshold", type=float, default=0.0, dest="p_value_threshold")
+    parser.add_argument("--batch-size", type=int, default=1000000, dest="batch_size")
+    parser.add_argument("--base-dir", type=str, default="/opt/ml/processing", dest="base_dir")
+    args = parser.parse_args()
+
+    profile = BaselineProfile.load(f"{args.base_dir}/baseline/baseline.json")
+    accumulator = DriftAccumulator(profile)
+    columns = list(profile.numeric) + list(profile.categorical)
+
+    paths = sorted(glob.glob(os.path.join(args.base_dir, "capture", "**", "*.parquet"), recursive=True))
+    if len(paths) == 0:
+        raise Exception(f"No captured parquet files found in {args.base_dir}/capture")
+
+    pq = import_pyarrow_parquet()
+    logger.info("Comparing %d captured parquet files to baseline in batches of %d rows.", len(paths), args.batch_size)
+    for path in paths:
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=args.batch_size, columns=columns):
+            accumulator.update(batch.to_pandas())
+
+    report = accumulator.report(args.psi_threshold, args.ks_threshold, args.p_value_threshold)
+    report["metadata"] = {
+        "baseline": profile.metadata,
+        "psi_threshold": args.psi_threshold,
+        "ks_threshold": args.ks_threshold,
+        "p_value_threshold": args.p_value_threshold,
+    }
+
+    output_dir = f"{args.base_dir}/drift"
+    pathlib.Path(output_dir).mkdir(parents=True, exist_ok=True)
+    logger.info(
+        "Writing out drift report of %d rows, drifted features: %s",
+        accumulator.n_rows, report["summary"]["drifted_features"]
+    )
+    with open(f"{output_dir}/drift.json", "w") as f:
+        json.dump(report, f, indent=2)
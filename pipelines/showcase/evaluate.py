@@ -1,58 +1,228 @@
+import argparse
+import glob
 import json
 import logging
+import os
 import pathlib
 import pickle
+import sys
 import tarfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+# Taken before heavy imports, so that startup time of processing job can be tracked
+script_start = time.time()
 
 import numpy as np
 import pandas as pd
 import xgboost
 
-from sklearn.metrics import mean_squared_error
+sys.path.append("/opt/ml/processing/input")
+from common.features import FeatureTransformer
+from common.profiling import Profiler, profiler_modes
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 logger.addHandler(logging.StreamHandler())
 
+residual_quantiles = [0.01, 0.05, 0.25, 0.5, 0.75, 0.95, 0.99]
+
+
+def iterate_dataset(data_dir, batch_size):
+    """Yields batches of CSV or parquet files written by data preparation step in data_dir as 2D arrays."""
+    paths = sorted(path for path in glob.glob(os.path.join(data_dir, "*")) if path.endswith((".csv", ".parquet")))
+    if len(paths) == 0:
+        raise Exception(f"No CSV or parquet data files found in {data_dir}")
+
+    for path in paths:
+        if path.endswith(".parquet"):
+            import pyarrow.parquet as pq
+            for batch in pq.ParquetFile(path).iter_batches(batch_size=batch_size):
+                yield batch.to_pandas().to_numpy(dtype=np.float64)
+        else:
+            for chunk in pd.read_csv(path, header=None, chunksize=batch_size):
+                yield chunk.to_numpy(dtype=np.float64)
+
+
+def load_model(model_dir):
+    """Loads booster saved in XGBoost format, or pickled booster saved by built-in algorithm container."""
+    model_path = os.path.join(model_dir, "xgboost-model")
+    with open(model_path, "rb") as f:
+        # Pickle protocol 2 and higher starts with PROTO opcode
+        if f.read(1) == pickle.PROTO:
+            f.seek(0)
+            return pickle.load(f)
+
+    model = xgboost.Booster()
+    model.load_model(model_path)
+    return model
+
+
+def finite_or_none(value):
+    return value if np.isfinite(value) else None
+
+
+def regression_metrics(y, predictions):
+    """Computes metrics over last axis, so rows of 2D arrays are evaluated independently."""
+    residuals = y - predictions
+    mse = np.mean(residuals ** 2, axis=-1)
+    total = np.sum((y - np.mean(y, axis=-1, keepdims=True)) ** 2, axis=-1)
+    return {
+        "mse": mse,
+        "rmse": np.sqrt(mse),
+        "mae": np.mean(np.abs(residuals), axis=-1),
+        "r2": 1.0 - np.sum(residuals ** 2, axis=-1) / np.where(total > 0, total, np.nan),
+    }
+
+
+def bootstrap_metrics(y, predictions, n_resamples, seed, max_batch_elements=10 ** 7):
+    """Computes regression metrics of n_resamples bootstrap resamples, vectorized over batches of resamples."""
+    random_state = np.random.RandomState(seed)
+    batch_size = max(1, max_batch_elements // len(y))
+    results = []
+    for start in range(0, n_resamples, batch_size):
+        indices = random_state.randint(0, len(y), size=(min(batch_size, n_resamples - start), len(y)))
+        results.append(regression_metrics(y[indices], predictions[indices]))
+    return {name: np.concatenate([result[name] for result in results]) for name in results[0]}
+
+
+def parallel_bootstrap_metrics(y, predictions, n_resamples, workers, seed):
+    """Splits bootstrap resamples across process pool, each worker with its own random seed."""
+    splits = [n_resamples // workers + (1 if i < n_resamples % workers else 0) for i in range(workers)]
+    splits = [n for n in splits if n > 0]
+    with ProcessPoolExecutor(max_workers=len(splits)) as executor:
+        futures = [
+            executor.submit(bootstrap_metrics, y, predictions, n, seed + i)
+            for i, n in enumerate(splits)
+        ]
+        results = [future.result() for future in futures]
+    return {name: np.concatenate([result[name] for result in results]) for name in results[0]}
+
+
+def get_metrics_report(y, predictions, n_resamples, confidence_level, workers, seed):
+    """Returns metrics in model quality report layout, with bootstrap standard deviation and confidence interval."""
+    metrics = regression_metrics(y, predictions)
+    report = {name: {"value": finite_or_none(float(value))} for name, value in metrics.items()}
+    if n_resamples > 0 and len(y) > 1:
+        resampled = parallel_bootstrap_metrics(y, predictions, n_resamples, workers, seed)
+        alpha = (1.0 - confidence_level) / 2
+        for name, values in resampled.items():
+            values = values[np.isfinite(values)]
+            if len(values) == 0:
+                continue
+            lower, upper = np.quantile(values, [alpha, 1.0 - alpha])
+            report[name]["standard_deviation"] = float(np.std(values))
+            report[name]["confidence_interval"] = {
+                "level": confidence_level,
+                "lower": float(lower),
+                "upper": float(upper)
+            }
+    return report
+
+
+def get_slice_columns(feature_transformer):
+    """Returns categorical feature name, category and index of its one-hot encoded column in features."""
+    feature_names = feature_transformer.feature_names
+    return [
+        (name, category, feature_names.index(f"{name}_{category}"))
+        for name, categories in feature_transformer.categorical.items()
+        for category in categories
+    ]
 
 
 if __name__ == "__main__":
+    logger.info("Imports completed in %.2f seconds.", time.time() - script_start)
     logger.debug("Starting evaluation.")
-    model_path = "/opt/ml/processing/model/model.tar.gz"
-    with tarfile.open(model_path) as tar:
-        tar.extractall(path=".")
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--data-version", type=str, default=None, dest="data_version")
+    parser.add_argument("--code-version", type=str, default=None, dest="code_version")
+    parser.add_argument("--batch-size", type=int, default=100000, dest="batch_size")
+    parser.add_argument("--bootstrap-samples", type=int, default=1000, dest="bootstrap_samples")
+    parser.add_argument("--confidence-level", type=float, default=0.95, dest="confidence_level")
+    parser.add_argument("--seed", type=int, default=42, dest="seed")
+    parser.add_argument("--base-dir", type=str, default="/opt/ml/processing", dest="base_dir")
+    parser.add_argument("--profiler", type=str, default="none", choices=profiler_modes, dest="profiler")
+    args = parser.parse_args()
 
-    logger.debug("Loading xgboost model.")
-    model = pickle.load(open("xgboost-model", "rb"))
+    n_threads = os.cpu_count() or 1
+    profiler = Profiler(
+        "evaluate", mode=args.profiler, metadata={"data_version": args.data_version}, started=script_start
+    )
+    profiler.record("imports", time.time() - script_start)
 
-    logger.debug("Reading test data.")
-    test_path = "/opt/ml/processing/test/test.csv"
-    df = pd.read_csv(test_path, header=None)
+    with profiler.phase("load_model"):
+        model_path = f"{args.base_dir}/model/model.tar.gz"
+        with tarfile.open(model_path) as tar:
+            tar.extractall(path=".")
 
-    logger.debug("Reading test data.")
-    y_test = df.iloc[:, 0].to_numpy()
-    df.drop(df.columns[0], axis=1, inplace=True)
-    X_test = xgboost.DMatrix(df.values)
+        logger.debug("Loading xgboost model.")
+        model = load_model(".")
 
-    logger.info("Performing predictions against test data.")
-    predictions = model.predict(X_test)
+        logger.debug("Loading preprocessor.")
+        feature_transformer = FeatureTransformer.load(f"{args.base_dir}/preprocessor/preprocessor.json")
+
+    logger.info("Performing predictions against test data in batches of %d rows.", args.batch_size)
+    test_path = f"{args.base_dir}/test"
+    slice_columns = get_slice_columns(feature_transformer)
+    # Label is first column of prepared datasets, followed by features
+    slice_index = [index + 1 for _, _, index in slice_columns]
+    labels, predictions, encoded_categories = [], [], []
+    for batch in profiler.iterate("read_test", iterate_dataset(test_path, args.batch_size)):
+        labels.append(batch[:, 0])
+        with profiler.phase("predict"):
+            predictions.append(model.predict(xgboost.DMatrix(batch[:, 1:], nthread=n_threads)))
+        encoded_categories.append(batch[:, slice_index] > 0.5)
+    y_test = np.concatenate(labels)
+    predictions = np.concatenate(predictions).astype(np.float64)
+    encoded_categories = np.concatenate(encoded_categories)
+    logger.info("Predicted %d test rows.", len(y_test))
+
+    logger.debug("Calculating metrics with %d bootstrap resamples.", args.bootstrap_samples)
+    with profiler.phase("metrics"):
+        metrics = get_metrics_report(
+            y_test, predictions, args.bootstrap_samples, args.confidence_level, n_threads, args.seed
+        )
+
+    residuals = y_test - predictions
+    residual_report = {
+        "mean": float(np.mean(residuals)),
+        "standard_deviation": float(np.std(residuals)),
+        "quantiles": {
+            str(q): float(value) for q, value in zip(residual_quantiles, np.quantile(residuals, residual_quantiles))
+        }
+    }
+
+    logger.debug("Calculating metrics of categorical feature slices.")
+    slice_report = {}
+    with profiler.phase("slice_metrics"):
+        for i, (name, category, _) in enumerate(slice_columns):
+            indices = np.flatnonzero(encoded_categories[:, i])
+            if len(indices) == 0:
+                continue
+            slice_metrics = regression_metrics(y_test[indices], predictions[indices])
+            slice_report.setdefault(name, {})[category] = {
+                "count": int(len(indices)),
+                **{metric: {"value": finite_or_none(float(value))} for metric, value in slice_metrics.items()}
+            }
 
-    logger.debug("Calculating mean squared error.")
-    mse = mean_squared_error(y_test, predictions)
-    std = np.std(y_test - predictions)
     report_dict = {
-        "regression_metrics": {
-            "mse": {
-                "value": mse,
-                "standard_deviation": std
-            },
-        },
+        "regression_metrics": metrics,
+        "residuals": residual_report,
+        "slice_metrics": slice_report,
+        "metadata": {
+            "data_version": args.data_version,
+            "code_version": args.code_version,
+            "n_rows": int(len(y_test)),
+            "bootstrap_samples": args.bootstrap_samples
+        }
     }
 
-    output_dir = "/opt/ml/processing/evaluation"
+    output_dir = f"{args.base_dir}/evaluation"
     pathlib.Path(output_dir).mkdir(parents=True, exist_ok=True)
 
-    logger.info("Writing out evaluation report with mse: %f", mse)
+    logger.info("Writing out evaluation report with mse: %f", metrics["mse"]["value"])
     evaluation_path = f"{output_dir}/evaluation.json"
     with open(evaluation_path, "w") as f:
-        f.write(json.dumps(report_dict))
\ No newline at end of file
+        f.write(json.dumps(report_dict))
+
+    profiler.save(f"{args.base_dir}/profile")
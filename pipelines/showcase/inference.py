@@ -0,0 +1,50 @@
+import io
+import os
+
+import numpy as np
+import pandas as pd
+
+from common.features import FeatureTransformer, default_schema
+
+
+def model_fn(model_dir):
+    return FeatureTransformer.load(os.path.join(model_dir, "preprocessor.json"))
+
+
+def input_fn(input_data, content_type, schema=default_schema):
+    """Parses whole CSV request payload at once into DataFrame with raw feature columns.
+
+    Payload rows may optionally include label as last column, as in raw dataset.
+    """
+    if content_type != "text/csv":
+        raise ValueError(f"Content type {content_type} is not supported, only text/csv is.")
+    if isinstance(input_data, bytes):
+        input_data = input_data.decode("utf-8")
+
+    df = pd.read_csv(
+        io.StringIO(input_data),
+        header=None,
+        names=schema.get_request_columns(input_data),
+        dtype={**schema.feature_columns_dtype, **schema.label_column_dtype},
+    )
+    df.drop(columns=[schema.label_column], errors="ignore", inplace=True)
+    return df
+
+
+def predict_fn(input_data, model):
+    return model.transform(input_data)
+
+
+def output_fn(prediction, accept):
+    if accept not in ("text/csv", "*/*"):
+        raise ValueError(f"Accept type {accept} is not supported, only text/csv is.")
+
+    buffer = io.StringIO()
+    np.savetxt(buffer, prediction, delimiter=",", fmt="%.10g")
+    return buffer.getvalue(), "text/csv"
+
+
+def transform_fn(model, input_data, content_type, accept):
+    """Parses request with schema recorded in preprocessor, as input_fn is not given the model."""
+    prediction = predict_fn(input_fn(input_data, content_type, model.schema), model)
+    return output_fn(prediction, accept)
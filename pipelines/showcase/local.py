@@ -0,0 +1,261 @@
+import glob
+import json
+import os
+import subprocess
+import sys
+import tarfile
+import tempfile
+import time
+
+import xgboost
+
+from showcase.common.profiling import print_profile_summary
+from showcase.pipeline import (
+    algorithm_data_formats,
+    base_dir,
+    eval_metric_conditions,
+    get_eval_job_arguments,
+    get_prep_data_job_arguments,
+    merge_two_dicts,
+    prep_data_parameter_defaults,
+    training_modes,
+    xgb_hyperparameters,
+)
+from showcase.common.features import FeatureSchema, default_schema
+from showcase import train as train_script
+from sagemaker.workflow.conditions import ConditionGreaterThanOrEqualTo, ConditionLessThanOrEqualTo
+
+# Local counterparts of condition types used by registration condition step
+condition_operators = {
+    ConditionLessThanOrEqualTo: lambda value, threshold: value <= threshold,
+    ConditionGreaterThanOrEqualTo: lambda value, threshold: value >= threshold,
+}
+
+
+def run_script(script, arguments, work_dir, env=None):
+    """Runs processing script in subprocess, with shared modules importable as in processing job."""
+    env = merge_two_dicts(os.environ, env or {})
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [base_dir, env.get("PYTHONPATH")]))
+    subprocess.run(
+        [sys.executable, os.path.join(base_dir, script)] + arguments,
+        cwd=work_dir,
+        env=env,
+        check=True
+    )
+
+
+class SpotInterruption(Exception):
+    """Simulated reclaim of spot instance during training."""
+
+
+class SpotInterruptionCallback(xgboost.callback.TrainingCallback):
+    """Raises SpotInterruption once model has interrupt_round boosted rounds, checkpoint of that round included."""
+
+    def __init__(self, interrupt_round):
+        self.interrupt_round = interrupt_round
+
+    def after_iteration(self, model, epoch, evals_log):
+        if model.num_boosted_rounds() == self.interrupt_round:
+            raise SpotInterruption(f"Spot instance reclaimed after round {self.interrupt_round}")
+        return False
+
+
+def train_model(train_dir, validation_dir, model_dir, hyperparameters, checkpoint_dir=None, interrupt_round=None):
+    """Trains model in-process with functions of training script train.py, without its hist tree method defaults.
+
+    Model is pickled as `xgboost-model` in `model.tar.gz`, same as built-in algorithm output.
+    With checkpoint_dir, training resumes from its latest checkpoint and saves checkpoint after every round.
+    """
+    splits = []
+    for data_dir in (train_dir, validation_dir):
+        split = train_script.read_split(data_dir)
+        if split is None:
+            raise Exception(f"No CSV or parquet data files found in {data_dir}")
+        splits.append(xgboost.DMatrix(split[0], label=split[1]))
+
+    if checkpoint_dir is not None:
+        os.makedirs(checkpoint_dir, exist_ok=True)
+    train_script.train(
+        params={name: value for name, value in hyperparameters.items() if name not in ("num_round", "early_stopping_rounds")},
+        dtrain=splits[0],
+        dvalidation=splits[1],
+        num_round=int(hyperparameters["num_round"]),
+        early_stopping_rounds=hyperparameters.get("early_stopping_rounds"),
+        model_dir=model_dir,
+        checkpoint_dir=checkpoint_dir,
+        base_model=None,
+        callbacks=[SpotInterruptionCallback(interrupt_round)] if interrupt_round is not None else None
+    )
+    with tarfile.open(os.path.join(model_dir, "model.tar.gz"), "w:gz") as tar:
+        tar.add(os.path.join(model_dir, "xgboost-model"), arcname="xgboost-model")
+
+
+def run_training_script(train_dir, validation_dir, model_dir, hyperparameters, checkpoint_dir=None):
+    """Runs training script train.py on single host, the way XGBoost framework container does.
+
+    Hyperparameters are passed as command line arguments and channels in SageMaker environment variables.
+    Model saved by script is packed into `model.tar.gz`, as SageMaker packs model directory.
+    """
+    arguments = [argument for name, value in hyperparameters.items() for argument in (f"--{name}", str(value))]
+    if checkpoint_dir is not None:
+        os.makedirs(checkpoint_dir, exist_ok=True)
+        arguments += ["--checkpoint_dir", checkpoint_dir]
+    os.makedirs(model_dir, exist_ok=True)
+    run_script(
+        "train.py",
+        arguments,
+        model_dir,
+        env={
+            "SM_CHANNEL_TRAIN": train_dir,
+            "SM_CHANNEL_VALIDATION": validation_dir,
+            "SM_MODEL_DIR": model_dir,
+            "SM_HOSTS": json.dumps(["algo-1"]),
+            "SM_CURRENT_HOST": "algo-1",
+            "SM_NUM_CPUS": str(os.cpu_count())
+        }
+    )
+    with tarfile.open(os.path.join(model_dir, "model.tar.gz"), "w:gz") as tar:
+        tar.add(os.path.join(model_dir, "xgboost-model"), arcname="xgboost-model")
+
+
+def run_local_pipeline(
+    input_file,
+    work_dir=None,
+    repo_data_branch="main",
+    repo_data_path="data/abalone-dataset.csv",
+    data_format="csv",
+    prep_data_mode=prep_data_parameter_defaults["mode"],
+    prep_data_chunk_size=prep_data_parameter_defaults["chunk_size"],
+    prep_data_split_seed=prep_data_parameter_defaults["split_seed"],
+    prep_data_stratify_bins=prep_data_parameter_defaults["stratify_bins"],
+    prep_data_dtype=prep_data_parameter_defaults["dtype"],
+    hyperparameters=None,
+    eval_metric_name="mse",
+    eval_metric_threshold=7.0,
+    profiler="none",
+    schema=None,
+    use_spot_instances=False,
+    interrupt_round=None,
+    training_mode="algorithm"
+):
+    """Runs steps of training pipeline locally, in order of pipeline DAG, with local input file instead of DVC.
+
+    Processing paths under `/opt/ml/processing` are mapped to work_dir (temporary directory by default).
+    Job arguments of processing steps are built by the same functions as in pipeline definition.
+    Returns list of step name, status and duration in seconds, and whether model would be registered.
+    Steps after failed step are not run. With use_spot_instances, training saves checkpoints, and with
+    interrupt_round, it is interrupted after that round and restarted from latest checkpoint, as managed
+    spot training is when spot instance is reclaimed. With training_mode 'script', model is trained by
+    training script train.py instead, which does not support interrupt_round.
+    """
+    if eval_metric_name not in eval_metric_conditions:
+        raise Exception(f"Unsupported evaluation metric {eval_metric_name}, supported: {list(eval_metric_conditions)}")
+    if training_mode not in training_modes:
+        raise Exception(f"Unsupported training mode {training_mode}, supported: {training_modes}")
+    if training_mode == "algorithm" and data_format not in algorithm_data_formats:
+        raise Exception(f"Data format {data_format} requires training mode script, built-in algorithm supports: {algorithm_data_formats}")
+    if training_mode == "script" and interrupt_round is not None:
+        raise Exception("Spot interruption can be simulated only with training mode algorithm")
+    hyperparameters = merge_two_dicts(xgb_hyperparameters, hyperparameters or {})
+    schema = default_schema if schema is None else FeatureSchema.from_dict(schema)
+    if work_dir is None:
+        work_dir = tempfile.mkdtemp(prefix="showcase-local-")
+    input_file = os.path.abspath(input_file)
+    print(f"Running local pipeline in {work_dir}")
+
+    prep_dir = os.path.join(work_dir, "dataPreparation")
+    eval_dir = os.path.join(work_dir, "evaluateModel")
+    model_dir = os.path.join(work_dir, "trainModel")
+    for split in ("train", "validation", "test"):
+        os.makedirs(os.path.join(prep_dir, split), exist_ok=True)
+    schema_file = os.path.join(work_dir, "schema.json")
+    schema.save(schema_file)
+
+    def prepare_data():
+        run_script(
+            "preprocess.py",
+            get_prep_data_job_arguments(
+                input_data=repo_data_path,
+                repo_branch=repo_data_branch,
+                mode=prep_data_mode,
+                chunk_size=prep_data_chunk_size,
+                data_format=data_format,
+                profiler=profiler,
+                split_seed=prep_data_split_seed,
+                stratify_bins=prep_data_stratify_bins,
+                dtype=prep_data_dtype,
+                schema_file=schema_file
+            ) + ["--input-file", input_file, "--base-dir", prep_dir],
+            prep_dir
+        )
+
+    def train():
+        train_dirs = (os.path.join(prep_dir, "train"), os.path.join(prep_dir, "validation"), model_dir, hyperparameters)
+        if training_mode == "script":
+            run_training_script(*train_dirs, checkpoint_dir=os.path.join(work_dir, "checkpoints") if use_spot_instances else None)
+            return
+        if not use_spot_instances:
+            train_model(*train_dirs)
+            return
+
+        checkpoint_dir = os.path.join(work_dir, "checkpoints")
+        try:
+            train_model(*train_dirs, checkpoint_dir=checkpoint_dir, interrupt_round=interrupt_round)
+        except SpotInterruption as e:
+            print(f"{e}, restarting training job")
+            train_model(*train_dirs, checkpoint_dir=checkpoint_dir)
+
+    def evaluate():
+        for name, source in (
+            ("model", model_dir),
+            ("test", os.path.join(prep_dir, "test")),
+            ("preprocessor", os.path.join(prep_dir, "preprocessor"))
+        ):
+            target = os.path.join(eval_dir, name)
+            if not os.path.exists(target):
+                os.makedirs(eval_dir, exist_ok=True)
+                os.symlink(source, target)
+        run_script(
+            "evaluate.py",
+            get_eval_job_arguments(profiler) + ["--base-dir", eval_dir],
+            eval_dir
+        )
+
+    results = {}
+
+    def review_metrics():
+        with open(os.path.join(eval_dir, "evaluation", "evaluation.json"), "r") as f:
+            report = json.load(f)
+        value = report["regression_metrics"][eval_metric_name]["value"]
+        condition = condition_operators[eval_metric_conditions[eval_metric_name]]
+        results["register"] = value is not None and condition(value, eval_metric_threshold)
+        print(f"Model {eval_metric_name} is {value}, threshold {eval_metric_threshold}: "
+              f"{'registerModel' if results['register'] else 'failModelBadMetric'}")
+
+    steps = []
+    for name, run in (
+        ("dataPreparation", prepare_data),
+        ("trainModel", train),
+        ("evaluateModel", evaluate),
+        ("reviewModelMetrics", review_metrics)
+    ):
+        start = time.perf_counter()
+        try:
+            run()
+            status = "Succeeded"
+        except Exception as e:
+            print(f"Step {name} failed: {e}")
+            status = "Failed"
+        steps.append((name, status, time.perf_counter() - start))
+        if status == "Failed":
+            break
+
+    profiles = []
+    for path in sorted(glob.glob(os.path.join(work_dir, "*", "profile", "**", "profile.json"), recursive=True)):
+        with open(path, "r") as f:
+            profiles.append(json.load(f))
+    if profiles:
+        print("\nProfile of processing scripts:")
+        print_profile_summary(profiles)
+
+    return steps, results.get("register", False)
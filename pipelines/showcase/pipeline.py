@@ -1,23 +1,253 @@
 import boto3
+import glob
+import hashlib
+import json
 import os
+import shutil
+import subprocess
+import sys
+import tempfile
 import sagemaker.session
 from sagemaker.estimator import Estimator
 from sagemaker.inputs import TrainingInput
 from sagemaker.model import Model
 from sagemaker.model_metrics import MetricsSource, ModelMetrics
+from sagemaker.parameter import ContinuousParameter, IntegerParameter
+from sagemaker.pipeline import PipelineModel
 from sagemaker.processing import ProcessingInput, ProcessingOutput, ScriptProcessor
+from sagemaker.sklearn.model import SKLearnModel
 from sagemaker.sklearn.processing import SKLearnProcessor
-from sagemaker.workflow.conditions import ConditionLessThanOrEqualTo
+from sagemaker.tuner import HyperparameterTuner
+from sagemaker.workflow.conditions import ConditionGreaterThanOrEqualTo, ConditionLessThanOrEqualTo
 from sagemaker.workflow.condition_step import ConditionStep
+from sagemaker.workflow.entities import PipelineVariable
 from sagemaker.workflow.fail_step import FailStep
 from sagemaker.workflow.functions import Join, JsonGet
 from sagemaker.workflow.parameters import ParameterInteger, ParameterString
 from sagemaker.workflow.pipeline import Pipeline
+from sagemaker.workflow.pipeline_context import PipelineSession
 from sagemaker.workflow.properties import PropertyFile
-from sagemaker.workflow.steps import ProcessingStep, TrainingStep
+from sagemaker.workflow.steps import CacheConfig, ProcessingStep, TrainingStep, TuningStep
 from sagemaker.workflow.step_collections import RegisterModel
+from sagemaker.xgboost.estimator import XGBoost
+
+from showcase.common.features import FeatureSchema, default_schema
+from showcase.dataset import fetch_dataset
 
 base_dir = os.path.dirname(os.path.realpath(__file__))
+repo_dir = os.path.dirname(os.path.dirname(base_dir))
+
+# Model registry client is shared with deployment scripts in deploy folder
+sys.path.append(os.path.join(repo_dir, "deploy"))
+from model_registry import ModelRegistry, client_config as model_registry_client_config
+
+data_content_types = {
+    "csv": "text/csv",
+    "parquet": "application/x-parquet",
+}
+
+# Built-in XGBoost algorithm, or training script train.py run in XGBoost framework container of the same image
+training_modes = ["algorithm", "script"]
+
+# Built-in XGBoost algorithm of pinned version 1.0-1 does not read parquet input, which requires version 1.2-1 or later
+algorithm_data_formats = ["csv"]
+
+# Metrics logged by training script, built-in algorithm defines the same ones itself
+xgb_script_metric_definitions = [
+    {"Name": "train:rmse", "Regex": r"train-rmse:([0-9\.]+)"},
+    {"Name": "validation:rmse", "Regex": r"validation-rmse:([0-9\.]+)"},
+]
+
+# Default values of data preparation pipeline parameters, shared with local pipeline runner
+prep_data_parameter_defaults = {
+    "mode": "memory",
+    "chunk_size": 100000,
+    "split_seed": 42,
+    "stratify_bins": 0,
+    "dtype": "float64",
+}
+
+# Conditions of model metrics in evaluation report required for model to be registered
+eval_metric_conditions = {
+    "mse": ConditionLessThanOrEqualTo,
+    "rmse": ConditionLessThanOrEqualTo,
+    "mae": ConditionLessThanOrEqualTo,
+    "r2": ConditionGreaterThanOrEqualTo,
+}
+
+xgb_hyperparameters = {
+    "objective": "reg:linear",
+    "num_round": 20,
+    "max_depth": 3,
+    "eta": 0.3,
+    "gamma": 3,
+    "min_child_weight": 5,
+    "subsample": 0.8,
+    "silent": 0
+}
+
+# Tuned hyperparameters override fixed ones above, number of rounds is bounded by early stopping instead
+xgb_tuning_hyperparameters = {
+    "num_round": 500,
+    "early_stopping_rounds": 10,
+    "eval_metric": "rmse"
+}
+
+xgb_tuning_hyperparameter_ranges = {
+    "eta": ContinuousParameter(0.01, 0.5, scaling_type="Logarithmic"),
+    "max_depth": IntegerParameter(2, 10),
+    "gamma": ContinuousParameter(0, 5),
+    "min_child_weight": ContinuousParameter(1, 10),
+    "subsample": ContinuousParameter(0.5, 1.0),
+    "colsample_bytree": ContinuousParameter(0.5, 1.0),
+    "lambda": ContinuousParameter(0.1, 10, scaling_type="Logarithmic")
+}
+
+def get_common_code_input():
+    """Shared modules used by processing scripts, placed next to code input of processing job."""
+    return ProcessingInput(
+        input_name="common",
+        source=os.path.join(base_dir, "common"),
+        destination="/opt/ml/processing/input/common"
+    )
+
+def get_schema_input(schema):
+    """Schema of raw data provided to data preparation as separate input, stored in directory keyed by its hash."""
+    schema_dir = os.path.join(tempfile.gettempdir(), "crayon-showcase-schema", get_schema_version(schema))
+    os.makedirs(schema_dir, exist_ok=True)
+    schema.save(os.path.join(schema_dir, "schema.json"))
+    return ProcessingInput(
+        input_name="schema",
+        source=schema_dir,
+        destination="/opt/ml/processing/input/schema"
+    )
+
+def get_serving_dir():
+    """Source directory of preprocessor model with inference script and shared modules only, keyed by their hash.
+
+    SageMaker SDK packs whole source directory into model and writes its repack script into it.
+    """
+    serving_dir = os.path.join(
+        tempfile.gettempdir(),
+        "crayon-showcase-serving",
+        get_code_version(os.path.join(base_dir, "inference.py"), os.path.join(base_dir, "common"))
+    )
+    if not os.path.exists(serving_dir):
+        # Pipelines may be defined concurrently, so directory is built apart and then moved into place
+        os.makedirs(os.path.dirname(serving_dir), exist_ok=True)
+        build_dir = tempfile.mkdtemp(dir=os.path.dirname(serving_dir))
+        shutil.copy(os.path.join(base_dir, "inference.py"), build_dir)
+        shutil.copytree(
+            os.path.join(base_dir, "common"),
+            os.path.join(build_dir, "common"),
+            ignore=shutil.ignore_patterns("__pycache__", "*.pyc")
+        )
+        try:
+            os.rename(build_dir, serving_dir)
+        except OSError:
+            # Moved into place by another definition in the meantime, with the same content
+            shutil.rmtree(build_dir)
+    return serving_dir
+
+def get_schema_version(schema):
+    """Returns short sha256 hash of schema, so that datasets prepared with different schemas are kept apart."""
+    return hashlib.sha256(json.dumps(schema.to_dict(), sort_keys=True).encode()).hexdigest()[:16]
+
+def get_data_version(dvc_file=os.path.join(repo_dir, "data.dvc")):
+    """Returns md5 hash of DVC tracked data, as recorded in DVC file of checked out revision."""
+    with open(dvc_file, "r") as f:
+        for line in f:
+            key, _, value = line.strip().lstrip("- ").partition(":")
+            if key == "md5":
+                return value.strip().replace(".dir", "")
+    raise Exception(f"No md5 hash found in DVC file {dvc_file}")
+
+def get_checked_out_revision():
+    """Returns checked out branch of repository, commit hash if HEAD is detached, None if it is not git checkout."""
+    try:
+        branch = subprocess.run(
+            ["git", "rev-parse", "--abbrev-ref", "HEAD"], cwd=repo_dir, capture_output=True, text=True, check=True
+        ).stdout.strip()
+        if branch != "HEAD":
+            return branch
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=repo_dir, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def get_code_version(*paths):
+    """Returns short sha256 hash of content of given files and Python files in given directories."""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(glob.glob(os.path.join(path, "**", "*.py"), recursive=True)))
+        else:
+            files.append(path)
+
+    code_hash = hashlib.sha256()
+    for file in files:
+        code_hash.update(os.path.relpath(file, base_dir).encode())
+        with open(file, "rb") as f:
+            code_hash.update(f.read())
+    return code_hash.hexdigest()[:16]
+
+def get_script_code_version(script):
+    """Returns code version of processing script, including shared modules it imports."""
+    return get_code_version(os.path.join(base_dir, script), os.path.join(base_dir, "common"))
+
+def to_job_argument(value):
+    """Pipeline variables are converted to string when pipeline is executed, plain values of local runs right away."""
+    return value.to_string() if isinstance(value, PipelineVariable) else str(value)
+
+def get_prep_data_job_arguments(input_data, repo_branch, mode, chunk_size, data_format, profiler, split_seed,
+                                stratify_bins, dtype, schema_file):
+    """Job arguments of data preparation step, shared by pipeline definition and local pipeline runner.
+
+    Values are pipeline parameters in pipeline definition, and their plain values in local runs.
+    """
+    return [
+        "--input-data", to_job_argument(input_data),
+        "--repo-branch", to_job_argument(repo_branch),
+        "--mode", to_job_argument(mode),
+        "--chunk-size", to_job_argument(chunk_size),
+        "--output-format", data_format,
+        "--data-version", get_data_version(),
+        "--code-version", get_script_code_version("preprocess.py"),
+        "--profiler", profiler,
+        "--split-seed", to_job_argument(split_seed),
+        "--stratify-bins", to_job_argument(stratify_bins),
+        "--dtype", to_job_argument(dtype),
+        "--schema-file", schema_file
+    ]
+
+def get_eval_job_arguments(profiler):
+    """Job arguments of evaluation step, shared by pipeline definition and local pipeline runner."""
+    return [
+        "--data-version", get_data_version(),
+        "--code-version", get_script_code_version("evaluate.py"),
+        "--profiler", profiler
+    ]
+
+def merge_two_dicts(x, y):
+    z = x.copy()
+    z.update(y)
+    return z
+
+def parse_hyperparameter_range(value):
+    """Creates hyperparameter range from JSON friendly list, e.g. ["continuous", 0.01, 0.5, "Logarithmic"]."""
+    range_types = {"continuous": ContinuousParameter, "integer": IntegerParameter}
+    if value[0] not in range_types:
+        raise Exception(f"Unsupported hyperparameter range type {value[0]}, supported: {list(range_types)}")
+    return range_types[value[0]](*value[1:])
+
+def get_model_registry(region):
+    """Model registry client with retries and cached model package descriptions, shared with deployment scripts."""
+    boto_session = boto3.Session(region_name=region)
+    return ModelRegistry(
+        sagemaker_client=boto_session.client("sagemaker", config=model_registry_client_config),
+        s3_client=boto_session.client("s3", config=model_registry_client_config)
+    )
 
 def get_sagemaker_client(region):
     boto_session = boto3.Session(region_name=region)
@@ -25,6 +255,16 @@ def get_sagemaker_client(region):
     
     return sagemaker_client
 
+def get_pipeline_session(region, default_bucket):
+    """Session under which estimator and tuner calls return step arguments instead of starting jobs."""
+    boto_session = boto3.Session(region_name=region)
+
+    return PipelineSession(
+        boto_session=boto_session,
+        sagemaker_client=boto_session.client(service_name="sagemaker"),
+        default_bucket=default_bucket
+    )
+
 def get_sagemaker_session(region, default_bucket):
     boto_session = boto3.Session(region_name=region)
     sagemaker_client = boto_session.client(service_name="sagemaker")
@@ -42,13 +282,68 @@ def get_pipeline(
     region,
     role=None,
     default_bucket=None,
-    repo_data_branch="main",
+    repo_data_branch=None,
     repo_data_path="data/abalone-dataset.csv",
     model_name="crayonShowcase",
     model_package_group_name="crayonShowcasePackageGroup",
     pipeline_name="crayonShowcasePipeline",
-    base_job_prefix="crayonShowcase"
+    base_job_prefix="crayonShowcase",
+    data_format="csv",
+    enable_caching=True,
+    cache_expire_after="P30D",
+    enable_tuning=False,
+    tuning_hyperparameter_ranges=None,
+    eval_metric_name="mse",
+    eval_metric_threshold=7.0,
+    processing_image_uri=None,
+    dataset_cache=True,
+    dataset_local_cache_dir=None,
+    incremental_training=False,
+    profiler="none",
+    schema=None,
+    hyperparameters=None,
+    use_spot_instances=False,
+    max_run=86400,
+    max_wait=None,
+    training_mode="algorithm"
 ):
+    if data_format not in data_content_types:
+        raise Exception(f"Unsupported data format {data_format}, supported: {list(data_content_types)}")
+    if eval_metric_name not in eval_metric_conditions:
+        raise Exception(f"Unsupported evaluation metric {eval_metric_name}, supported: {list(eval_metric_conditions)}")
+    if training_mode not in training_modes:
+        raise Exception(f"Unsupported training mode {training_mode}, supported: {training_modes}")
+    if training_mode == "algorithm" and data_format not in algorithm_data_formats:
+        raise Exception(f"Data format {data_format} requires training mode script, built-in algorithm supports: {algorithm_data_formats}")
+    if incremental_training and enable_tuning:
+        raise Exception("Incremental training is not supported together with hyperparameter tuning")
+    if use_spot_instances:
+        # Time spent waiting for spot capacity and interrupted counts against max_wait
+        max_wait = max_run if max_wait is None else max_wait
+        if max_wait < max_run:
+            raise Exception(f"Spot training max_wait {max_wait} must be greater than or equal to max_run {max_run}")
+    else:
+        max_wait = None
+    if dataset_cache:
+        # Cached dataset is resolved from checked out revision, other branch would be silently ignored
+        checked_out_revision = get_checked_out_revision()
+        if repo_data_branch is not None and checked_out_revision is not None and repo_data_branch != checked_out_revision:
+            raise Exception(
+                f"Dataset cache reads data of checked out revision {checked_out_revision}, not of branch "
+                f"{repo_data_branch}, check out branch or disable dataset_cache"
+            )
+        repo_data_branch = checked_out_revision or repo_data_branch or "main"
+    elif repo_data_branch is None:
+        repo_data_branch = "main"
+    schema = default_schema if schema is None else FeatureSchema.from_dict(schema)
+    hyperparameters = merge_two_dicts(xgb_hyperparameters, hyperparameters or {})
+    if tuning_hyperparameter_ranges is None:
+        tuning_hyperparameter_ranges = xgb_tuning_hyperparameter_ranges
+    else:
+        tuning_hyperparameter_ranges = {
+            name: parse_hyperparameter_range(value) for name, value in tuning_hyperparameter_ranges.items()
+        }
+
     # Prepare session info
     sagemaker_session = get_sagemaker_session(
         region=region,
@@ -61,51 +356,193 @@ def get_pipeline(
     # Pipeline parameters
     eval_instance_count = ParameterInteger(name="evalInstanceCount", default_value=1)
     eval_instance_type = ParameterString(name="evalInstanceType", default_value="ml.m5.large")
-    prep_data_input_data = ParameterString(name="dataPrepInputData", default_value=repo_data_path)
-    prep_data_input_repo_branch = ParameterString(name="dataPrepInputRepoBranch", default_value=repo_data_branch)
+    if dataset_cache:
+        # Dataset is fetched when pipeline is defined, so its path and branch are fixed by definition
+        # instead of being parameters, which executions could override without effect on data read
+        prep_data_input_data = repo_data_path
+        prep_data_input_repo_branch = repo_data_branch
+        prep_data_input_parameters = []
+    else:
+        prep_data_input_data = ParameterString(name="dataPrepInputData", default_value=repo_data_path)
+        prep_data_input_repo_branch = ParameterString(name="dataPrepInputRepoBranch", default_value=repo_data_branch)
+        prep_data_input_parameters = [prep_data_input_data, prep_data_input_repo_branch]
+    prep_data_chunk_size = ParameterInteger(name="dataPrepChunkSize", default_value=prep_data_parameter_defaults["chunk_size"])
     prep_data_instance_count = ParameterInteger(name="dataPrepInstanceCount", default_value=1)
     prep_data_instance_type = ParameterString(name="dataPrepInstanceType", default_value="ml.m5.xlarge")
+    prep_data_mode = ParameterString(name="dataPrepMode", default_value=prep_data_parameter_defaults["mode"])
+    prep_data_split_seed = ParameterInteger(name="dataPrepSplitSeed", default_value=prep_data_parameter_defaults["split_seed"])
+    prep_data_stratify_bins = ParameterInteger(
+        name="dataPrepStratifyBins", default_value=prep_data_parameter_defaults["stratify_bins"]
+    )
+    prep_data_dtype = ParameterString(name="dataPrepDtype", default_value=prep_data_parameter_defaults["dtype"])
     register_inference_instance_type = ParameterString(name="registerInferenceInstanceType", default_value="ml.m5.large")
     register_transform_instance_type = ParameterString(name="registerTransformInstanceType", default_value="ml.m5.large")
     train_instance_count = ParameterInteger(name="trainInstanceCount", default_value=1)
     train_instance_type = ParameterString(name="trainInstanceType", default_value="ml.m5.xlarge")
     train_output_path= ParameterString(name="trainOutputPath", default_value=f"s3://{sagemaker_session.default_bucket()}/{base_job_prefix}/Model")
+    tuning_max_jobs = ParameterInteger(name="tuningMaxJobs", default_value=20)
+    tuning_max_parallel_jobs = ParameterInteger(name="tuningMaxParallelJobs", default_value=4)
 
 
-    # Data processing step
-    prep_data_processor = SKLearnProcessor(
-        framework_version="0.23-1",
-        role=role,
-        instance_type=prep_data_instance_type,
-        instance_count=prep_data_instance_count,
-        base_job_name=f"{base_job_prefix}/sklearn-prep-data",
-        sagemaker_session=sagemaker_session,
+    # Step caching, keyed on data version and code version passed to steps as job arguments
+    cache_config = CacheConfig(enable_caching=enable_caching, expire_after=cache_expire_after)
+    data_version = get_data_version()
+    prep_code_version = get_script_code_version("preprocess.py")
+    eval_code_version = get_script_code_version("evaluate.py")
+
+    # Prepared datasets are content addressed, so training reruns only when their content may change
+    prep_data_output_prefix = [
+        "s3:/",
+        sagemaker_session.default_bucket(),
+        base_job_prefix,
+        "Data",
+        data_version,
+        prep_code_version,
+        get_schema_version(schema),
+        data_format,
+        prep_data_input_repo_branch,
+        prep_data_input_data,
+        prep_data_mode,
+        prep_data_chunk_size.to_string(),
+        prep_data_instance_count.to_string(),
+        prep_data_split_seed.to_string(),
+        prep_data_stratify_bins.to_string(),
+        prep_data_dtype
+    ]
+
+    # Incremental training continues boosting model of latest approved package on rows added since,
+    # transformed by its preprocessor; full training is used if no package is approved yet
+    base_package = None
+    if incremental_training:
+        base_package = get_model_registry(region).get_latest_approved_package(model_package_group_name)
+        if base_package is None:
+            print(f"No approved model package in {model_package_group_name}, model is trained on all data.")
+    if base_package is not None:
+        base_containers = base_package["InferenceSpecification"]["Containers"]
+        base_preprocessor_data = base_containers[0]["ModelDataUrl"]
+        base_model_data = base_containers[-1]["ModelDataUrl"]
+        print(f"Training incrementally from model package {base_package['ModelPackageArn']}")
+        prep_data_output_prefix.append(f"incremental-{base_package['ModelPackageVersion']}")
+
+
+    # Dataset is fetched once per DVC content hash and provided to data preparation as input,
+    # instead of being read from DVC remote by every data preparation job
+    prep_data_inputs = [get_common_code_input(), get_schema_input(schema)]
+    prep_data_job_arguments = get_prep_data_job_arguments(
+        input_data=prep_data_input_data,
+        repo_branch=prep_data_input_repo_branch,
+        mode=prep_data_mode,
+        chunk_size=prep_data_chunk_size,
+        data_format=data_format,
+        profiler=profiler,
+        split_seed=prep_data_split_seed,
+        stratify_bins=prep_data_stratify_bins,
+        dtype=prep_data_dtype,
+        schema_file="/opt/ml/processing/input/schema/schema.json"
     )
+    if dataset_cache:
+        dataset_uri = fetch_dataset(
+            s3_client=sagemaker_session.boto_session.client("s3"),
+            data_path=repo_data_path,
+            s3_cache_prefix=f"s3://{sagemaker_session.default_bucket()}/{base_job_prefix}/Datasets",
+            **({"local_cache_dir": dataset_local_cache_dir} if dataset_local_cache_dir else {})
+        )
+        prep_data_inputs.append(
+            ProcessingInput(
+                input_name="dataset",
+                source=dataset_uri,
+                destination="/opt/ml/processing/input/data"
+            )
+        )
+        prep_data_job_arguments += ["--input-file", f"/opt/ml/processing/input/data/{os.path.basename(repo_data_path)}"]
+    if base_package is not None:
+        prep_data_inputs.append(
+            ProcessingInput(
+                input_name="base_preprocessor",
+                source=base_preprocessor_data,
+                destination="/opt/ml/processing/input/base_preprocessor"
+            )
+        )
+        prep_data_job_arguments += [
+            "--base-preprocessor", f"/opt/ml/processing/input/base_preprocessor/{os.path.basename(base_preprocessor_data)}"
+        ]
+
+
+    # Train dataset is sharded by S3 key with at least one file per data preparation instance, so every
+    # training instance receives data only when there are no more training instances than preparation instances
+    step_fail_instance_counts = FailStep(
+        name="failInstanceCounts",
+        display_name="Bad instance counts",
+        error_message="Fail pipeline due to trainInstanceCount greater than dataPrepInstanceCount."
+    )
+
+    step_check_instance_counts = ConditionStep(
+        name="checkInstanceCounts",
+        display_name="Check instance counts",
+        description="Check that every training instance receives shard of train dataset",
+        conditions=[ConditionLessThanOrEqualTo(left=train_instance_count, right=prep_data_instance_count)],
+        else_steps=[step_fail_instance_counts]
+    )
+
+
+    # Data processing step, prebuilt processing image (see container folder) has dependencies preinstalled
+    if processing_image_uri is None:
+        prep_data_processor = SKLearnProcessor(
+            framework_version="0.23-1",
+            role=role,
+            instance_type=prep_data_instance_type,
+            instance_count=prep_data_instance_count,
+            base_job_name=f"{base_job_prefix}/sklearn-prep-data",
+            sagemaker_session=sagemaker_session,
+        )
+    else:
+        prep_data_processor = ScriptProcessor(
+            image_uri=processing_image_uri,
+            role=role,
+            command=["python3"],
+            instance_type=prep_data_instance_type,
+            instance_count=prep_data_instance_count,
+            base_job_name=f"{base_job_prefix}/prep-data",
+            sagemaker_session=sagemaker_session,
+        )
 
     step_prepare = ProcessingStep(
         name="dataPreparation",
         display_name="Data preparation",
         description="Split data to train, test and validation datasets.",
         code=os.path.join(base_dir, "preprocess.py"),
-        job_arguments=[
-            "--input-data", prep_data_input_data,
-            "--repo-branch", prep_data_input_repo_branch
-        ],
+        job_arguments=prep_data_job_arguments,
         processor=prep_data_processor,
+        inputs=prep_data_inputs,
+        depends_on=[step_check_instance_counts],
         outputs=[
             ProcessingOutput(
                 output_name="train",
-                source="/opt/ml/processing/train"
+                source="/opt/ml/processing/train",
+                destination=Join(on="/", values=prep_data_output_prefix + ["train"])
             ),
             ProcessingOutput(
                 output_name="validation",
-                source="/opt/ml/processing/validation"
+                source="/opt/ml/processing/validation",
+                destination=Join(on="/", values=prep_data_output_prefix + ["validation"])
             ),
             ProcessingOutput(
                 output_name="test",
-                source="/opt/ml/processing/test"
+                source="/opt/ml/processing/test",
+                destination=Join(on="/", values=prep_data_output_prefix + ["test"])
+            ),
+            ProcessingOutput(
+                output_name="preprocessor",
+                source="/opt/ml/processing/preprocessor",
+                destination=Join(on="/", values=prep_data_output_prefix + ["preprocessor"])
+            ),
+            ProcessingOutput(
+                output_name="profile",
+                source="/opt/ml/processing/profile",
+                destination=Join(on="/", values=prep_data_output_prefix + ["profile"])
             )
-        ]
+        ],
+        cache_config=cache_config
     )
 
     
@@ -118,42 +555,128 @@ def get_pipeline(
         instance_type=train_instance_type
     )
 
-    xgb_estimator = Estimator(
+    # Built-in XGBoost algorithm saves checkpoint after every round and resumes from the latest one,
+    # so that training interrupted by reclaimed spot instance continues instead of starting over.
+    # Checkpoints are content addressed like prepared datasets, so that step caching is kept and only
+    # training of the same data with the same hyperparameters resumes from them. Tuning jobs train in
+    # parallel and are restarted from scratch instead.
+    checkpoint_s3_uri = None
+    if use_spot_instances and not enable_tuning:
+        checkpoint_s3_uri = Join(
+            on="/",
+            values=[
+                "s3:/",
+                sagemaker_session.default_bucket(),
+                base_job_prefix,
+                "Checkpoints"
+            ] + (
+                # Checkpoints of training script are stored apart from those of built-in algorithm
+                ["script"] if training_mode == "script" else []
+            ) + [
+                hashlib.sha256(json.dumps(hyperparameters, sort_keys=True).encode()).hexdigest()[:16]
+            ] + prep_data_output_prefix[4:]
+        )
+
+    estimator_args = dict(
         image_uri=xgb_image_url,
         role=role,
         instance_count=train_instance_count,
         instance_type=train_instance_type,
         output_path=train_output_path,
-        base_job_name=f"{base_job_prefix}/xgb-train",
-        sagemaker_session=sagemaker_session
-    )
-    xgb_estimator.set_hyperparameters(
-        objective="reg:linear",
-        num_round=20,
-        max_depth=3,
-        eta=0.3,
-        gamma=3,
-        min_child_weight=5,
-        subsample=0.8,
-        silent=0
+        sagemaker_session=sagemaker_session,
+        use_spot_instances=use_spot_instances,
+        max_run=max_run,
+        max_wait=max_wait,
+        checkpoint_s3_uri=checkpoint_s3_uri,
+        # Default profiler rule includes timestamp, which would cause training step cache misses
+        disable_profiler=True,
+        # Built-in XGBoost algorithm and training script continue training of model provided in model channel
+        model_uri=base_model_data if base_package is not None else None,
+        model_channel_name="model"
     )
+    if training_mode == "script":
+        # Training script uses hist tree method on all cores and trains across instances with Rabit. Its
+        # estimator runs under pipeline session, so that tuning step arguments are built by tuner fit.
+        xgb_estimator = XGBoost(
+            entry_point=os.path.join(base_dir, "train.py"),
+            framework_version="1.0-1",
+            py_version="py3",
+            base_job_name=f"{base_job_prefix}/xgb-script-train",
+            code_location=f"s3://{sagemaker_session.default_bucket()}",
+            metric_definitions=xgb_script_metric_definitions,
+            **merge_two_dicts(
+                estimator_args, {"sagemaker_session": get_pipeline_session(region, sagemaker_session.default_bucket())}
+            )
+        )
+    else:
+        xgb_estimator = Estimator(base_job_name=f"{base_job_prefix}/xgb-train", **estimator_args)
+    train_inputs = {
+        "train": TrainingInput(
+            s3_data=step_prepare.properties.ProcessingOutputConfig.Outputs["train"].S3Output.S3Uri,
+            content_type=data_content_types[data_format],
+            distribution="ShardedByS3Key"
+        ),
+        "validation": TrainingInput(
+            s3_data=step_prepare.properties.ProcessingOutputConfig.Outputs["validation"].S3Output.S3Uri,
+            content_type=data_content_types[data_format]
+        )
+    }
 
-    step_train = TrainingStep(
-        name="trainModel",
-        display_name="Train new model",
-        description="Train model and store it on S3",
-        estimator=xgb_estimator,
-        inputs={
-            "train": TrainingInput(
-                s3_data=step_prepare.properties.ProcessingOutputConfig.Outputs["train"].S3Output.S3Uri,
-                content_type="text/csv"
-            ),
-            "validation": TrainingInput(
-                s3_data=step_prepare.properties.ProcessingOutputConfig.Outputs["validation"].S3Output.S3Uri,
-                content_type="text/csv"
+    if enable_tuning:
+        xgb_estimator.set_hyperparameters(**{
+            name: value for name, value in merge_two_dicts(hyperparameters, xgb_tuning_hyperparameters).items()
+            if name not in tuning_hyperparameter_ranges
+        })
+
+        # Bayesian search over parallel training jobs, poorly performing jobs are stopped early
+        xgb_tuner = HyperparameterTuner(
+            estimator=xgb_estimator,
+            objective_metric_name="validation:rmse",
+            objective_type="Minimize",
+            hyperparameter_ranges=tuning_hyperparameter_ranges,
+            strategy="Bayesian",
+            max_jobs=tuning_max_jobs,
+            max_parallel_jobs=tuning_max_parallel_jobs,
+            early_stopping_type="Auto",
+            # Built-in algorithm defines its metrics, training script metrics are parsed from its logs
+            metric_definitions=xgb_script_metric_definitions if training_mode == "script" else None
+        )
+
+        if training_mode == "script":
+            # Training job name ends up in code upload path and static hyperparameters of training script.
+            # Tuning step would generate it with timestamp, changing step arguments and missing step cache,
+            # so it is given to tuner fit instead, keyed on content of training script.
+            tuning_args = dict(
+                step_args=xgb_tuner.fit(
+                    inputs=train_inputs,
+                    job_name=f"{base_job_prefix}/xgb-script-train-{get_code_version(os.path.join(base_dir, 'train.py'))}"
+                )
             )
-        }
-    )
+        else:
+            tuning_args = dict(tuner=xgb_tuner, inputs=train_inputs)
+
+        step_train = TuningStep(
+            name="tuneModel",
+            display_name="Tune new model",
+            description="Train models with different hyperparameters and store them on S3",
+            cache_config=cache_config,
+            **tuning_args
+        )
+        train_job_name = step_train.properties.BestTrainingJob.TrainingJobName
+        model_data = Join(on="/", values=[train_output_path, train_job_name, "output/model.tar.gz"])
+    else:
+        xgb_estimator.set_hyperparameters(**hyperparameters)
+
+        step_train = TrainingStep(
+            name="trainModel",
+            display_name="Train new model",
+            description="Train model and store it on S3",
+            estimator=xgb_estimator,
+            inputs=train_inputs,
+            cache_config=cache_config
+        )
+        train_job_name = step_train.properties.TrainingJobName
+        model_data = step_train.properties.ModelArtifacts.S3ModelArtifacts
 
 
     # Evaluation step
@@ -178,33 +701,86 @@ def get_pipeline(
         display_name="Evaluate new model",
         description="Evaluate performance of newly trained model",
         code=os.path.join(base_dir, "evaluate.py"),
+        job_arguments=get_eval_job_arguments(profiler),
         processor=eval_processor,
         inputs=[
             ProcessingInput(
-                source=step_train.properties.ModelArtifacts.S3ModelArtifacts,
+                source=model_data,
                 destination="/opt/ml/processing/model"
             ),
             ProcessingInput(
                 source=step_prepare.properties.ProcessingOutputConfig.Outputs["test"].S3Output.S3Uri,
                 destination="/opt/ml/processing/test"
-            )
+            ),
+            ProcessingInput(
+                source=step_prepare.properties.ProcessingOutputConfig.Outputs["preprocessor"].S3Output.S3Uri,
+                destination="/opt/ml/processing/preprocessor"
+            ),
+            get_common_code_input()
         ],
         outputs=[
             ProcessingOutput(
                 output_name="eval_report",
-                source="/opt/ml/processing/evaluation"
+                source="/opt/ml/processing/evaluation",
+                destination=Join(
+                    on="/",
+                    values=[
+                        "s3:/",
+                        sagemaker_session.default_bucket(),
+                        base_job_prefix,
+                        "Evaluation",
+                        eval_code_version,
+                        train_job_name
+                    ]
+                )
+            ),
+            ProcessingOutput(
+                output_name="profile",
+                source="/opt/ml/processing/profile",
+                destination=Join(
+                    on="/",
+                    values=[
+                        "s3:/",
+                        sagemaker_session.default_bucket(),
+                        base_job_prefix,
+                        "EvaluationProfile",
+                        eval_code_version,
+                        train_job_name
+                    ]
+                )
             )
         ],
-        property_files=[eval_prop_file]
+        property_files=[eval_prop_file],
+        cache_config=cache_config
     )
 
 
     # Register new model step
-    model = Model(
-        name=model_name,
+    preprocessor_model = SKLearnModel(
+        name=f"{model_name}Preprocessor",
+        model_data=Join(
+            on="/",
+            values=[step_prepare.properties.ProcessingOutputConfig.Outputs["preprocessor"].S3Output.S3Uri, "model.tar.gz"]
+        ),
+        entry_point="inference.py",
+        source_dir=get_serving_dir(),
+        framework_version="0.23-1",
+        py_version="py3",
+        role=role,
+        sagemaker_session=sagemaker_session
+    )
+
+    xgb_model = Model(
         image_uri=xgb_image_url,
         role=role,
-        model_data=step_train.properties.ModelArtifacts.S3ModelArtifacts,
+        model_data=model_data,
+        sagemaker_session=sagemaker_session
+    )
+
+    model = PipelineModel(
+        name=model_name,
+        models=[preprocessor_model, xgb_model],
+        role=role,
         sagemaker_session=sagemaker_session
     )
 
@@ -213,6 +789,12 @@ def get_pipeline(
             s3_uri=Join(
                 on="/", values=[step_eval.properties.ProcessingOutputConfig.Outputs["eval_report"].S3Output.S3Uri, "evaluation.json"]),
             content_type="application/json"
+        ),
+        # Baseline profile of raw training features, reference of drift detection on captured traffic
+        model_data_statistics=MetricsSource(
+            s3_uri=Join(
+                on="/", values=[step_prepare.properties.ProcessingOutputConfig.Outputs["preprocessor"].S3Output.S3Uri, "baseline.json"]),
+            content_type="application/json"
         )
     )
 
@@ -222,7 +804,7 @@ def get_pipeline(
         description="Register newly trained model in model registry",
         estimator=xgb_estimator,
         model=model,
-        model_data=step_train.properties.ModelArtifacts.S3ModelArtifacts,
+        model_data=model_data,
         content_types=["text/csv"],
         response_types=["text/csv"],
         inference_instances=[register_inference_instance_type],
@@ -234,13 +816,13 @@ def get_pipeline(
 
 
     # Check evaluation step
-    condition_eval = ConditionLessThanOrEqualTo(
+    condition_eval = eval_metric_conditions[eval_metric_name](
         left=JsonGet(
             step_name=step_eval.name,
             property_file=eval_prop_file,
-            json_path="regression_metrics.mse.value"
+            json_path=f"regression_metrics.{eval_metric_name}.value"
         ),
-        right=7.0
+        right=eval_metric_threshold
     )
 
     step_fail = FailStep(
@@ -262,19 +844,25 @@ def get_pipeline(
     # Create pipeline definition
     pipeline = Pipeline(
         name=pipeline_name,
-        steps=[step_prepare, step_train, step_eval, step_condition],
+        steps=[step_check_instance_counts, step_prepare, step_train, step_eval, step_condition],
         parameters=[
             eval_instance_count,
-            eval_instance_type,
-            prep_data_input_data,
-            prep_data_input_repo_branch,
+            eval_instance_type
+        ] + prep_data_input_parameters + [
+            prep_data_chunk_size,
             prep_data_instance_count,
             prep_data_instance_type,
+            prep_data_mode,
+            prep_data_split_seed,
+            prep_data_stratify_bins,
+            prep_data_dtype,
             register_inference_instance_type,
             register_transform_instance_type,
             train_instance_count,
             train_instance_type,
-            train_output_path
+            train_output_path,
+            tuning_max_jobs,
+            tuning_max_parallel_jobs
         ],
         sagemaker_session=sagemaker_session
     )
@@ -1,49 +1,32 @@
+import argparse
+import importlib
+import json
+import logging
+import os
 import subprocess
+import sys
+import tarfile
+import tempfile
+import time
 
-subprocess.run(["python", "-m", "pip", "install", "dvc", "dvc[s3]"])
+# Taken before heavy imports, so that startup time of processing job can be tracked
+script_start = time.time()
 
-
-import argparse
-import dvc.api
-import logging
 import numpy as np
 import pandas as pd
 
-from sklearn.compose import ColumnTransformer
-from sklearn.impute import SimpleImputer
-from sklearn.pipeline import Pipeline
-from sklearn.preprocessing import StandardScaler, OneHotEncoder
+# Shared modules are provided to processing job as separate input next to code
+sys.path.append("/opt/ml/processing/input")
+from common.drift import BaselineProfileBuilder
+from common.profiling import Profiler, profiler_modes
+from common.features import FeatureSchema, FeatureTransformer
+from common.moments import combine_moments, get_moments
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 logger.addHandler(logging.StreamHandler())
 
 
-feature_columns_names = [
-    "sex",
-    "length",
-    "diameter",
-    "height",
-    "whole_weight",
-    "shucked_weight",
-    "viscera_weight",
-    "shell_weight",
-]
-label_column = "rings"
-
-feature_columns_dtype = {
-    "sex": str,
-    "length": np.float64,
-    "diameter": np.float64,
-    "height": np.float64,
-    "whole_weight": np.float64,
-    "shucked_weight": np.float64,
-    "viscera_weight": np.float64,
-    "shell_weight": np.float64,
-}
-label_column_dtype = {"rings": np.float64}
-
-
 def merge_two_dicts(x, y):
     """Merges two dicts, returning a new copy."""
     z = x.copy()
@@ -51,37 +34,296 @@ def merge_two_dicts(x, y):
     return z
 
 
-if __name__ == "__main__":
-    logger.debug("Starting preprocessing.")
-    parser = argparse.ArgumentParser()
-    parser.add_argument("--input-data", type=str, required=True, dest="input_data")
-    parser.add_argument("--repo-branch", type=str, required=True, dest="repo_branch")
-    args = parser.parse_args()
+def get_host_shard(resource_config_path="/opt/ml/config/resourceconfig.json"):
+    """Returns name of current host, its shard index and number of shards in processing cluster."""
+    if not os.path.exists(resource_config_path):
+        return "algo-1", 0, 1
 
-    base_dir = "/opt/ml/processing"
+    with open(resource_config_path, "r") as f:
+        resource_config = json.load(f)
+    hosts = sorted(resource_config["hosts"])
+    current_host = resource_config["current_host"]
+    return current_host, hosts.index(current_host), len(hosts)
 
-    logger.debug("Reading downloaded data.")
-    with dvc.api.open(
-        args.input_data,
-        repo="https://github.com/crayon/aws-sagemaker-pipelines.git",
-        rev=args.repo_branch,
-        remote="abalone"
-    ) as f:
-        df = pd.read_csv(
-            f,
-            header=None,
-            names=feature_columns_names + [label_column],
-            dtype=merge_two_dicts(feature_columns_dtype, label_column_dtype),
+
+def import_dvc_api():
+    """Imports DVC API, installing DVC first if processing image does not include it."""
+    try:
+        return importlib.import_module("dvc.api")
+    except ImportError:
+        logger.info("Installing DVC for reading input data.")
+        subprocess.run(["python", "-m", "pip", "install", "dvc", "dvc[s3]"], check=True)
+        return importlib.import_module("dvc.api")
+
+
+def open_input(args):
+    """Opens input data file from DVC remote, or local input file when one is given."""
+    if args.input_file:
+        f = open(args.input_file, "r")
+    else:
+        f = import_dvc_api().open(
+            args.input_data,
+            repo="https://github.com/crayon/aws-sagemaker-pipelines.git",
+            rev=args.repo_branch,
+            remote="abalone"
+        )
+    logger.info("Input data opened %.2f seconds after script start.", time.time() - script_start)
+    return f
+
+
+def read_input(f, schema, chunk_size=None):
+    return pd.read_csv(
+        f,
+        header=None,
+        names=schema.feature_columns_names + [schema.label_column],
+        dtype=merge_two_dicts(schema.feature_columns_dtype, schema.label_column_dtype),
+        chunksize=chunk_size
+    )
+
+
+def iterate_input_chunks(args, schema, chunk_size):
+    """Yields input data in chunks of chunk_size rows, keeping memory bound by chunk size."""
+    with open_input(args) as f:
+        for chunk in read_input(f, schema, chunk_size=chunk_size):
+            yield chunk
+
+
+class StreamingStatistics:
+    """Accumulates statistics needed by preprocessing transformers chunk by chunk.
+
+    Mirrors the in-memory ColumnTransformer: numeric features are imputed with
+    median and standard scaled, categorical features are imputed with constant
+    'missing' and one-hot encoded. Medians are approximated from a bounded
+    uniform sample of non-null values, means and variances are exact.
+    """
+
+    def __init__(self, numeric_features, categorical_features, sample_size=100000):
+        self.numeric_features = numeric_features
+        self.categorical_features = categorical_features
+        self.sample_size = sample_size
+        self.count = np.zeros(len(numeric_features))
+        self.missing = np.zeros(len(numeric_features))
+        self.mean = np.zeros(len(numeric_features))
+        self.m2 = np.zeros(len(numeric_features))
+        self.samples = [np.empty(0) for _ in numeric_features]
+        self.sample_keys = [np.empty(0) for _ in numeric_features]
+        self.categories = {name: set() for name in categorical_features}
+
+    def update(self, chunk):
+        values = chunk[self.numeric_features].to_numpy(dtype=np.float64)
+        nan_mask = np.isnan(values)
+        self.count, self.mean, self.m2 = combine_moments((self.count, self.mean, self.m2), get_moments(values))
+        self.missing += nan_mask.sum(axis=0)
+
+        for i in range(len(self.numeric_features)):
+            column = values[~nan_mask[:, i], i]
+            samples = np.concatenate((self.samples[i], column))
+            keys = np.concatenate((self.sample_keys[i], np.random.random_sample(len(column))))
+            if len(samples) > self.sample_size:
+                keep = np.argpartition(keys, self.sample_size)[:self.sample_size]
+                samples, keys = samples[keep], keys[keep]
+            self.samples[i], self.sample_keys[i] = samples, keys
+
+        for name in self.categorical_features:
+            column = chunk[name]
+            self.categories[name].update(column.dropna().unique())
+            if column.isna().any():
+                self.categories[name].add("missing")
+
+    def finalize(self):
+        """Returns fitted transformer parameters, including imputed values in mean and variance."""
+        medians = np.array([np.median(s) if len(s) else 0.0 for s in self.samples])
+        # Imputed values are missing count of values equal to median
+        total, mean, m2 = combine_moments((self.count, self.mean, self.m2), (self.missing, medians, 0.0))
+        variance = np.divide(m2, total, out=np.zeros_like(m2), where=total > 0)
+        scale = np.sqrt(variance)
+        scale[scale == 0.0] = 1.0
+
+        return {
+            "numeric": {
+                name: {"median": medians[i], "mean": mean[i], "scale": scale[i]}
+                for i, name in enumerate(self.numeric_features)
+            },
+            "categorical": {
+                name: sorted(self.categories[name]) for name in self.categorical_features
+            }
+        }
+
+
+def import_pyarrow():
+    """Imports pyarrow, installing it first if processing image does not include it."""
+    try:
+        return importlib.import_module("pyarrow"), importlib.import_module("pyarrow.parquet")
+    except ImportError:
+        logger.info("Installing pyarrow for parquet output.")
+        subprocess.run(["python", "-m", "pip", "install", "pyarrow"], check=True)
+        return importlib.import_module("pyarrow"), importlib.import_module("pyarrow.parquet")
+
+
+class CsvSplitWriter:
+    """Appends dataset rows to a headerless CSV file, label in first column."""
+
+    def __init__(self, path):
+        self.path = f"{path}.csv"
+        self.f = open(self.path, "w")
+
+    def write(self, data):
+        pd.DataFrame(data).to_csv(self.f, header=False, index=False)
+
+    def close(self):
+        self.f.close()
+
+
+class ParquetSplitWriter:
+    """Appends dataset rows as row groups of a parquet file, label in first column."""
+
+    def __init__(self, path):
+        self.path = f"{path}.parquet"
+        self.pa, self.pq = import_pyarrow()
+        self.writer = None
+
+    def write(self, data):
+        if len(data) == 0:
+            return
+        table = self.pa.Table.from_arrays(
+            [self.pa.array(data[:, i]) for i in range(data.shape[1])],
+            names=[str(i) for i in range(data.shape[1])]
         )
+        if self.writer is None:
+            self.writer = self.pq.ParquetWriter(self.path, table.schema)
+        self.writer.write_table(table)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+split_writers = {
+    "csv": CsvSplitWriter,
+    "parquet": ParquetSplitWriter,
+}
+
+
+def open_split_writers(base_dir, output_format, shard_name):
+    """Opens writers for train, validation and test datasets in requested format.
+
+    Every host of processing cluster uploads to the same S3 prefix, so file names
+    include shard name to keep them apart.
+    """
+    writer_class = split_writers[output_format]
+    return [
+        writer_class(f"{base_dir}/{split}/{split}-{shard_name}")
+        for split in ("train", "validation", "test")
+    ]
+
+
+def get_split_rng(seed, shard_index):
+    """Returns random generator of dataset split, seeded per shard so that shards are split independently."""
+    return np.random.default_rng([seed, shard_index])
+
+
+def get_label_strata(y, bins):
+    """Assigns rows to label quantile bins, so that stratified split keeps label distribution in every split."""
+    edges = np.unique(np.quantile(y, np.linspace(0, 1, bins + 1)[1:-1]))
+    return np.searchsorted(edges, y, side="right")
+
+
+def split_indices(n_rows, rng, strata=None):
+    """Returns shuffled row indices of train, validation and test splits in 70/15/15 ratio.
+
+    Only index is permuted, rows are never moved. With strata, every stratum is split
+    in the same ratio and rows of strata are shuffled together within each split.
+    """
+    permutation = rng.permutation(n_rows)
+    if strata is None:
+        return np.split(permutation, [int(0.7 * n_rows), int(0.85 * n_rows)])
+
+    # Stable sort groups rows by stratum, keeping them in shuffled order within stratum
+    order = permutation[np.argsort(strata[permutation], kind="stable")]
+    _, starts, sizes = np.unique(strata[order], return_index=True, return_counts=True)
+    rank = np.arange(n_rows) - np.repeat(starts, sizes)
+    size = np.repeat(sizes, sizes)
+    split = (rank >= (0.7 * size).astype(int)).astype(int) + (rank >= (0.85 * size).astype(int))
+    return [rng.permutation(order[split == i]) for i in range(3)]
+
+
+def write_split(writer, transformer, df, y, indices, block_size, dtype, profiler):
+    """Transforms and writes rows of split selected by indices in blocks, so that only one block is copied at a time."""
+    for start in range(0, len(indices), block_size):
+        block = indices[start:start + block_size]
+        with profiler.phase("transform"):
+            X = np.concatenate((y[block, None].astype(dtype), transformer.transform(df.iloc[block], dtype)), axis=1)
+        with profiler.phase("write_output"):
+            writer.write(X)
+    writer.close()
+
+
+def save_preprocessor(transformer, output_dir):
+    """Stores fitted transformer as model artifact for inference pipeline."""
+    os.makedirs(output_dir, exist_ok=True)
+    params_path = os.path.join(output_dir, "preprocessor.json")
+    transformer.save(params_path)
+    with tarfile.open(os.path.join(output_dir, "model.tar.gz"), "w:gz") as tar:
+        tar.add(params_path, arcname="preprocessor.json")
+
+
+def save_baseline_profile(builder, output_dir, metadata):
+    """Stores profile of raw training features next to preprocessor, as reference for drift detection."""
+    os.makedirs(output_dir, exist_ok=True)
+    builder.finalize(metadata=metadata).save(os.path.join(output_dir, "baseline.json"))
+
+
+def get_preprocessor_metadata(args, schema, n_rows):
+    return {
+        "input_data": args.input_data,
+        "repo_branch": args.repo_branch,
+        "data_version": args.data_version,
+        "code_version": args.code_version,
+        "mode": args.mode,
+        "n_rows": int(n_rows),
+        # Inference container parses request rows according to schema of raw data
+        "schema": schema.to_dict(),
+    }
+
+
+def load_base_preprocessor(path):
+    """Loads preprocessor from model artifact of inference pipeline base model, for incremental training."""
+    with tarfile.open(path) as tar:
+        members = [member for member in tar.getmembers() if os.path.normpath(member.name) == "preprocessor.json"]
+        if len(members) == 0:
+            raise Exception(f"No preprocessor.json found in base preprocessor artifact {path}")
+        output_dir = tempfile.mkdtemp()
+        tar.extract(members[0], path=output_dir)
+    return FeatureTransformer.load(os.path.join(output_dir, members[0].name))
+
+
+def get_incremental_transformer(args, schema, base_transformer, n_rows):
+    """Returns base model transformer with metadata of current data, which extends data base model was fitted on.
+
+    Input data is assumed to be append-only, so first rows are the ones base model was trained on.
+    """
+    if base_transformer.schema.to_dict() != schema.to_dict():
+        raise Exception(f"Schema of base preprocessor {base_transformer.schema.to_dict()} differs from {schema.to_dict()}")
+    n_rows_base = int(base_transformer.metadata.get("n_rows", 0))
+    if n_rows <= n_rows_base:
+        raise Exception(f"No new rows of data since base model, which was trained on {n_rows_base} rows")
+
+    metadata = merge_two_dicts(get_preprocessor_metadata(args, schema, n_rows), {"base_n_rows": n_rows_base})
+    return FeatureTransformer(base_transformer.numeric, base_transformer.categorical, metadata=metadata)
+
+
+def fit_transformer(df, schema, metadata):
+    # Imported only when fitting in memory, streaming mode does not depend on scikit-learn
+    from sklearn.compose import ColumnTransformer
+    from sklearn.impute import SimpleImputer
+    from sklearn.pipeline import Pipeline
+    from sklearn.preprocessing import StandardScaler, OneHotEncoder
 
     logger.debug("Defining transformers.")
-    numeric_features = list(feature_columns_names)
-    numeric_features.remove("sex")
     numeric_transformer = Pipeline(
         steps=[("imputer", SimpleImputer(strategy="median")), ("scaler", StandardScaler())]
     )
 
-    categorical_features = ["sex"]
     categorical_transformer = Pipeline(
         steps=[
             ("imputer", SimpleImputer(strategy="constant", fill_value="missing")),
@@ -91,25 +333,173 @@ if __name__ == "__main__":
 
     preprocess = ColumnTransformer(
         transformers=[
-            ("num", numeric_transformer, numeric_features),
-            ("cat", categorical_transformer, categorical_features),
+            ("num", numeric_transformer, schema.numeric_features),
+            ("cat", categorical_transformer, schema.categorical_features),
         ]
     )
 
-    logger.info("Applying transforms.")
-    y = df.pop("rings")
-    X_pre = preprocess.fit_transform(df)
-    y_pre = y.to_numpy().reshape(len(y), 1)
+    logger.info("Fitting transforms.")
+    preprocess.fit(df)
+    return FeatureTransformer.from_column_transformer(preprocess, metadata=metadata)
+
+
+def process_in_memory(args, schema, base_dir, shard, profiler):
+    logger.debug("Reading downloaded data.")
+    with profiler.phase("read_input"), open_input(args) as f:
+        df = read_input(f, schema)
 
-    X = np.concatenate((y_pre, X_pre), axis=1)
+    # Every host fits on all data, so shards share the same transformation
+    shard_name, shard_index, shard_count = shard
+    y = df.pop(schema.label_column)
+    if args.base_preprocessor:
+        transformer = get_incremental_transformer(args, schema, load_base_preprocessor(args.base_preprocessor), len(df))
+        n_rows_base = transformer.metadata["base_n_rows"]
+        logger.info("Reusing base model transforms, keeping %d new rows of data.", len(df) - n_rows_base)
+        df = df.iloc[n_rows_base:]
+        y = y.iloc[n_rows_base:]
+    else:
+        with profiler.phase("fit"):
+            transformer = fit_transformer(df, schema, get_preprocessor_metadata(args, schema, len(df)))
+    if shard_index == 0:
+        save_preprocessor(transformer, f"{base_dir}/preprocessor")
 
-    logger.info("Splitting %d rows of data into train, validation, test datasets.", len(X))
-    np.random.shuffle(X)
-    train, validation, test = np.split(X, [int(0.7 * len(X)), int(0.85 * len(X))])
+    df = df.iloc[shard_index::shard_count]
+    y = y.iloc[shard_index::shard_count].to_numpy()
 
-    logger.info("Writing out datasets to %s.", base_dir)
-    pd.DataFrame(train).to_csv(f"{base_dir}/train/train.csv", header=False, index=False)
-    pd.DataFrame(validation).to_csv(
-        f"{base_dir}/validation/validation.csv", header=False, index=False
+    logger.info(
+        "Splitting %d rows of shard %d of %d into train, validation, test datasets.",
+        len(df), shard_index + 1, shard_count
     )
-    pd.DataFrame(test).to_csv(f"{base_dir}/test/test.csv", header=False, index=False)
+    with profiler.phase("shuffle_split"):
+        strata = get_label_strata(y, args.stratify_bins) if args.stratify_bins > 1 else None
+        splits = split_indices(len(df), get_split_rng(args.split_seed, shard_index), strata)
+    if shard_index == 0:
+        with profiler.phase("baseline_profile"):
+            builder = BaselineProfileBuilder(schema.numeric_features, schema.categorical_features)
+            for start in range(0, len(splits[0]), args.chunk_size):
+                builder.update(df.iloc[splits[0][start:start + args.chunk_size]])
+            save_baseline_profile(builder, f"{base_dir}/preprocessor", transformer.metadata)
+
+    # Rows are transformed block by block in shuffled order, instead of shuffling transformed copy of all data
+    logger.info("Applying transforms and writing out %s %s datasets to %s.", args.dtype, args.output_format, base_dir)
+    writers = open_split_writers(base_dir, args.output_format, shard_name)
+    for writer, indices in zip(writers, splits):
+        write_split(writer, transformer, df, y, indices, args.chunk_size, args.dtype, profiler)
+
+
+def process_streaming(args, schema, base_dir, shard, profiler):
+    if args.base_preprocessor:
+        transformer = load_base_preprocessor(args.base_preprocessor)
+        n_rows_base = int(transformer.metadata.get("n_rows", 0))
+        logger.info("Reusing base model transforms, skipping %d rows base model was trained on.", n_rows_base)
+    else:
+        logger.info("Computing transformer statistics in chunks of %d rows.", args.chunk_size)
+        statistics = StreamingStatistics(schema.numeric_features, schema.categorical_features)
+        for chunk in profiler.iterate("read_input", iterate_input_chunks(args, schema, args.chunk_size)):
+            with profiler.phase("fit"):
+                statistics.update(chunk)
+        transformer = FeatureTransformer(**statistics.finalize())
+        n_rows_base = 0
+        logger.debug("Fitted transformer parameters: %s", transformer.numeric)
+
+    shard_name, shard_index, shard_count = shard
+    logger.info(
+        "Applying transforms to shard %d of %d and writing out %s datasets to %s.",
+        shard_index + 1, shard_count, args.output_format, base_dir
+    )
+    n_rows = 0
+    n_rows_seen = 0
+    rng = get_split_rng(args.split_seed, shard_index)
+    baseline = BaselineProfileBuilder(schema.numeric_features, schema.categorical_features) if shard_index == 0 else None
+    train, validation, test = open_split_writers(base_dir, args.output_format, shard_name)
+    for chunk in profiler.iterate("read_input", iterate_input_chunks(args, schema, args.chunk_size)):
+        with profiler.phase("transform"):
+            row_numbers = np.arange(n_rows_seen, n_rows_seen + len(chunk))
+            n_rows_seen += len(chunk)
+            chunk = chunk[(row_numbers % shard_count == shard_index) & (row_numbers >= n_rows_base)]
+
+            y = chunk.pop(schema.label_column).to_numpy(dtype=args.dtype).reshape(len(chunk), 1)
+            X = np.concatenate((y, transformer.transform(chunk, args.dtype)), axis=1)
+
+        with profiler.phase("write_output"):
+            # Same 70/15/15 split as in-memory mode, assigned per row as chunks stream by
+            split = rng.random(len(X))
+            for writer, mask in (
+                (train, split < 0.7),
+                (validation, (split >= 0.7) & (split < 0.85)),
+                (test, split >= 0.85)
+            ):
+                writer.write(X[mask])
+        if baseline is not None:
+            with profiler.phase("baseline_profile"):
+                baseline.update(chunk[split < 0.7])
+        n_rows += len(X)
+
+    for writer in (train, validation, test):
+        writer.close()
+
+    logger.info("Wrote %d rows of data into train, validation, test datasets.", n_rows)
+
+    # Number of rows is known only after whole input is read, so transformer is saved last
+    if args.base_preprocessor:
+        transformer = get_incremental_transformer(args, schema, transformer, n_rows_seen)
+    else:
+        transformer.metadata = get_preprocessor_metadata(args, schema, n_rows_seen)
+    if shard_index == 0:
+        save_preprocessor(transformer, f"{base_dir}/preprocessor")
+        save_baseline_profile(baseline, f"{base_dir}/preprocessor", transformer.metadata)
+
+
+if __name__ == "__main__":
+    logger.info("Imports completed in %.2f seconds.", time.time() - script_start)
+    logger.debug("Starting preprocessing.")
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--input-data", type=str, required=True, dest="input_data")
+    parser.add_argument("--repo-branch", type=str, required=True, dest="repo_branch")
+    parser.add_argument(
+        "--mode", type=str, default="memory", choices=["memory", "streaming"], dest="mode"
+    )
+    parser.add_argument("--chunk-size", type=int, default=100000, dest="chunk_size")
+    parser.add_argument(
+        "--output-format", type=str, default="csv", choices=list(split_writers), dest="output_format"
+    )
+    parser.add_argument("--data-version", type=str, default=None, dest="data_version")
+    parser.add_argument("--code-version", type=str, default=None, dest="code_version")
+    parser.add_argument("--input-file", type=str, default=None, dest="input_file")
+    parser.add_argument("--base-dir", type=str, default="/opt/ml/processing", dest="base_dir")
+    parser.add_argument("--base-preprocessor", type=str, default=None, dest="base_preprocessor")
+    parser.add_argument("--profiler", type=str, default="none", choices=profiler_modes, dest="profiler")
+    parser.add_argument("--split-seed", type=int, default=42, dest="split_seed")
+    parser.add_argument("--stratify-bins", type=int, default=0, dest="stratify_bins")
+    parser.add_argument("--dtype", type=str, default="float64", choices=["float64", "float32"], dest="dtype")
+    parser.add_argument("--schema-file", type=str, default=None, dest="schema_file")
+    args = parser.parse_args()
+    if args.stratify_bins > 1 and args.mode == "streaming":
+        raise Exception("Stratified split requires memory mode, streaming mode assigns rows to splits one chunk at a time")
+
+    # Reservoir samples of transformer statistics and baseline profile are drawn from global random state
+    np.random.seed(args.split_seed)
+
+    base_dir = args.base_dir
+    schema = FeatureSchema.load(args.schema_file)
+    shard = get_host_shard()
+    profiler = Profiler(
+        "preprocess",
+        mode=args.profiler,
+        metadata={
+            "mode": args.mode,
+            "output_format": args.output_format,
+            "dtype": args.dtype,
+            "data_version": args.data_version
+        },
+        started=script_start
+    )
+    profiler.record("imports", time.time() - script_start)
+
+    if args.mode == "streaming":
+        process_streaming(args, schema, base_dir, shard, profiler)
+    else:
+        process_in_memory(args, schema, base_dir, shard, profiler)
+
+    # Every host writes its own profile, so that hosts uploading to the same prefix are kept apart
+    profiler.save(f"{base_dir}/profile/{shard[0]}")
@@ -0,0 +1,208 @@
+import argparse
+import ast
+import glob
+import importlib
+import json
+import logging
+import os
+import pickle
+import subprocess
+import tarfile
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+logger.addHandler(logging.StreamHandler())
+
+def import_pyarrow_parquet():
+    """Imports pyarrow parquet module, installing pyarrow first if training image does not include it."""
+    try:
+        return importlib.import_module("pyarrow.parquet")
+    except ImportError:
+        logger.info("Installing pyarrow for reading parquet datasets.")
+        subprocess.run(["python", "-m", "pip", "install", "pyarrow"], check=True)
+        return importlib.import_module("pyarrow.parquet")
+
+
+def read_split(data_dir):
+    """Reads all CSV or parquet files of dataset split in data_dir into float32 features and label.
+
+    Parquet files are read column by column straight into NumPy arrays, without intermediate DataFrame.
+    Returns None when data_dir holds no files, e.g. when there are more training instances than shards.
+    """
+    if data_dir is None:
+        return None
+    blocks = []
+    for path in sorted(glob.glob(os.path.join(data_dir, "*"))):
+        if path.endswith(".parquet"):
+            table = import_pyarrow_parquet().read_table(path)
+            blocks.append(np.column_stack([column.to_numpy().astype(np.float32) for column in table.columns]))
+        elif path.endswith(".csv"):
+            blocks.append(pd.read_csv(path, header=None, dtype=np.float32).to_numpy())
+    if len(blocks) == 0:
+        return None
+
+    # Label is first column of prepared datasets, followed by features
+    data = np.concatenate(blocks) if len(blocks) > 1 else blocks[0]
+    return data[:, 1:], data[:, 0]
+
+
+def get_dmatrix(data_dir, nthread):
+    split = read_split(data_dir)
+    if split is None:
+        return None
+    X, y = split
+    return xgb.DMatrix(X, label=y, nthread=nthread)
+
+
+def parse_hyperparameters(arguments):
+    """Parses '--name value' pairs of remaining hyperparameters into booster parameters with literal values."""
+    params = {}
+    for name, value in zip(arguments[::2], arguments[1::2]):
+        try:
+            params[name.lstrip("-")] = ast.literal_eval(value)
+        except (ValueError, SyntaxError):
+            params[name.lstrip("-")] = value
+    return params
+
+
+def list_checkpoints(checkpoint_dir):
+    """Returns paths and rounds of checkpoints in checkpoint_dir, ordered by round."""
+    checkpoints = []
+    for path in glob.glob(os.path.join(checkpoint_dir, "xgboost-checkpoint.*.json")):
+        checkpoints.append((path, int(os.path.basename(path).split(".")[1])))
+    return sorted(checkpoints, key=lambda checkpoint: checkpoint[1])
+
+
+def get_checkpoint_callback(checkpoint_dir, start_round, keep=5):
+    """Returns callback saving model after every round, keeping the latest checkpoints.
+
+    Function callbacks of XGBoost 1.0 in training container are replaced by callback
+    classes in later versions used locally, so both are supported.
+    """
+    def save(model, completed_round):
+        model.save_model(os.path.join(checkpoint_dir, f"xgboost-checkpoint.{completed_round}.json"))
+        for path, _ in list_checkpoints(checkpoint_dir)[:-keep]:
+            os.remove(path)
+
+    if hasattr(xgb.callback, "TrainingCallback"):
+        class CheckpointCallback(xgb.callback.TrainingCallback):
+            def after_iteration(self, model, epoch, evals_log):
+                save(model, start_round + epoch + 1)
+                return False
+
+        return CheckpointCallback()
+
+    return lambda env: save(env.model, start_round + env.iteration + 1)
+
+
+def load_base_model(model_channel):
+    """Loads model to continue boosting from model channel, which holds model.tar.gz of base model."""
+    paths = glob.glob(os.path.join(model_channel, "*.tar.gz"))
+    if len(paths) == 0:
+        raise Exception(f"No model artifact found in model channel {model_channel}")
+    with tarfile.open(paths[0]) as tar:
+        output_dir = tempfile.mkdtemp()
+        tar.extract("xgboost-model", path=output_dir)
+    with open(os.path.join(output_dir, "xgboost-model"), "rb") as f:
+        return pickle.load(f)
+
+
+def train(params, dtrain, dvalidation, num_round, early_stopping_rounds, model_dir, checkpoint_dir, base_model,
+          is_master=True, callbacks=None):
+    """Trains booster, resuming from latest checkpoint when there is one; only master saves model and checkpoints.
+
+    Given callbacks are called after checkpoint of each round is saved.
+    """
+    start_model, start_round, checkpoint_callbacks = base_model, 0, []
+    if checkpoint_dir is not None:
+        checkpoints = list_checkpoints(checkpoint_dir)
+        if checkpoints:
+            start_model, start_round = checkpoints[-1]
+            logger.info("Resuming training from checkpoint %s, %d of %d rounds done.", start_model, start_round, num_round)
+        if is_master:
+            checkpoint_callbacks.append(get_checkpoint_callback(checkpoint_dir, start_round))
+
+    evals = [(dtrain, "train")] + ([(dvalidation, "validation")] if dvalidation is not None else [])
+    start = time.perf_counter()
+    booster = xgb.train(
+        params,
+        dtrain,
+        num_boost_round=max(num_round - start_round, 0),
+        evals=evals,
+        early_stopping_rounds=early_stopping_rounds,
+        xgb_model=start_model,
+        callbacks=checkpoint_callbacks + (callbacks or [])
+    )
+    seconds = time.perf_counter() - start
+    logger.info(
+        "Trained %d rounds on %d rows in %.2f seconds, %.0f rows per second per round.",
+        num_round - start_round, dtrain.num_row(), seconds, dtrain.num_row() * (num_round - start_round) / seconds
+    )
+
+    if is_master:
+        os.makedirs(model_dir, exist_ok=True)
+        with open(os.path.join(model_dir, "xgboost-model"), "wb") as f:
+            pickle.dump(booster, f)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num_round", type=int, default=20)
+    parser.add_argument("--early_stopping_rounds", type=int, default=None)
+    parser.add_argument("--tree_method", type=str, default="hist")
+    # Threads of all available cores, as reported by SageMaker
+    parser.add_argument("--nthread", type=int, default=int(os.environ.get("SM_NUM_CPUS", os.cpu_count())))
+    parser.add_argument("--checkpoint_dir", type=str, default="/opt/ml/checkpoints")
+    parser.add_argument("--model_dir", type=str, default=os.environ.get("SM_MODEL_DIR", "/opt/ml/model"))
+    parser.add_argument("--train", type=str, default=os.environ.get("SM_CHANNEL_TRAIN"))
+    parser.add_argument("--validation", type=str, default=os.environ.get("SM_CHANNEL_VALIDATION"))
+    parser.add_argument("--model", type=str, default=os.environ.get("SM_CHANNEL_MODEL"))
+    parser.add_argument("--hosts", type=str, default=os.environ.get("SM_HOSTS", '["algo-1"]'))
+    parser.add_argument("--current_host", type=str, default=os.environ.get("SM_CURRENT_HOST", "algo-1"))
+    args, arguments = parser.parse_known_args()
+
+    params = parse_hyperparameters(arguments)
+    params.update({"tree_method": args.tree_method, "nthread": args.nthread})
+    hosts = json.loads(args.hosts)
+
+    # Train split is sharded by S3 key, so every host reads only its own files, validation split is replicated
+    dtrain = get_dmatrix(args.train, args.nthread)
+    dvalidation = get_dmatrix(args.validation, args.nthread)
+    # SageMaker creates checkpoint directory only when checkpoint S3 URI is configured, e.g. with spot training
+    checkpoint_dir = args.checkpoint_dir if os.path.isdir(args.checkpoint_dir) else None
+    base_model = load_base_model(args.model) if args.model else None
+    logger.info("Training with parameters %s on %d hosts.", params, len(hosts))
+
+    train_args = dict(
+        params=params,
+        dtrain=dtrain,
+        dvalidation=dvalidation,
+        num_round=args.num_round,
+        early_stopping_rounds=args.early_stopping_rounds,
+        model_dir=args.model_dir,
+        checkpoint_dir=checkpoint_dir,
+        base_model=base_model
+    )
+    if len(hosts) > 1:
+        # Rabit tracker on first host connects hosts, which then build histograms from their shards together
+        from sagemaker_xgboost_container import distributed
+
+        distributed.wait_hostname_resolution(hosts)
+        distributed.rabit_run(
+            exec_fun=train,
+            args=train_args,
+            include_in_training=dtrain is not None,
+            hosts=hosts,
+            current_host=args.current_host,
+            update_rabit_args=True
+        )
+    elif dtrain is None:
+        raise Exception(f"No training data found in {args.train}")
+    else:
+        train(**train_args)
@@ -0,0 +1,292 @@
+import argparse
+import bisect
+import csv
+import json
+import math
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from botocore.exceptions import ClientError
+
+from predict import get_runtime_client, invoke_endpoint, iterate_payloads, percentile
+
+# Upper bounds of latency histogram buckets in milliseconds, roughly logarithmic
+histogram_buckets_ms = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, float("inf")]
+
+
+def get_invoker(args):
+    """Returns function sending single payload to endpoint, raising on any failed invocation.
+
+    With invocations URL, payload is posted directly following container contract
+    (`POST /invocations`), otherwise through sagemaker-runtime client.
+    """
+    if args.invocations_url:
+        def invoke(payload):
+            request = urllib.request.Request(
+                args.invocations_url,
+                data=payload.encode("utf-8"),
+                headers={"Content-Type": "text/csv", "Accept": "text/csv"}
+            )
+            with urllib.request.urlopen(request, timeout=60) as response:
+                response.read()
+        return invoke
+
+    runtime_client = get_runtime_client(
+        region=args.region,
+        endpoint_url=args.endpoint_url,
+        max_pool_connections=args.concurrency
+    )
+
+    def invoke(payload):
+        invoke_endpoint(runtime_client, args.endpoint_name, payload, max_retries=args.max_retries)
+    return invoke
+
+
+def finite_or_none(value):
+    """Keeps report valid JSON, missing and unbounded values are stored as null."""
+    return value if math.isfinite(value) else None
+
+
+def get_error_code(error):
+    if isinstance(error, ClientError):
+        return error.response["Error"]["Code"]
+    if isinstance(error, urllib.error.HTTPError):
+        return f"HTTP{error.code}"
+    return type(error).__name__
+
+
+class LoadTestRecorder:
+    """Thread-safe collection of request outcomes relative to load test start."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.records = []
+        self.start = time.perf_counter()
+
+    def record(self, sent_at, latency, error_code=None):
+        with self.lock:
+            self.records.append((sent_at - self.start, latency, error_code))
+
+    def report(self, config):
+        records = sorted(self.records)
+        duration = max((sent + latency for sent, latency, _ in records), default=0.0)
+        latencies = sorted(latency * 1000 for _, latency, error in records if error is None)
+        errors = {}
+        for _, _, error in records:
+            if error is not None:
+                errors[error] = errors.get(error, 0) + 1
+
+        histogram = [0] * len(histogram_buckets_ms)
+        for latency in latencies:
+            histogram[bisect.bisect_left(histogram_buckets_ms, latency)] += 1
+
+        windows = {}
+        for sent, latency, error in records:
+            windows.setdefault(int(sent), []).append((latency, error))
+        timeline = []
+        for second in range(int(records[-1][0]) + 1 if records else 0):
+            window = windows.get(second, [])
+            window_latencies = sorted(latency * 1000 for latency, error in window if error is None)
+            timeline.append({
+                "second": second,
+                "requests": len(window),
+                "errors": sum(1 for _, error in window if error is not None),
+                "latency_p50_ms": finite_or_none(percentile(window_latencies, 50)),
+                "latency_p99_ms": finite_or_none(percentile(window_latencies, 99)),
+            })
+
+        return {
+            "config": config,
+            "summary": {
+                "requests": len(records),
+                "errors": sum(errors.values()),
+                "error_rate": sum(errors.values()) / len(records) if records else 0.0,
+                "errors_by_code": errors,
+                "duration_seconds": duration,
+                "throughput_rps": len(latencies) / duration if duration > 0 else 0.0,
+                "latency_ms": {
+                    "mean": sum(latencies) / len(latencies) if latencies else None,
+                    "p50": finite_or_none(percentile(latencies, 50)),
+                    "p90": finite_or_none(percentile(latencies, 90)),
+                    "p99": finite_or_none(percentile(latencies, 99)),
+                    "max": latencies[-1] if latencies else None,
+                },
+            },
+            "histogram": [
+                {"le_ms": finite_or_none(bound), "count": count}
+                for bound, count in zip(histogram_buckets_ms, histogram)
+            ],
+            "timeline": timeline,
+        }
+
+
+def timed_invoke(invoke, recorder, payload, sent_at):
+    """Invokes endpoint, measuring latency from the moment request was due to be sent."""
+    try:
+        invoke(payload)
+        recorder.record(sent_at, time.perf_counter() - sent_at)
+    except Exception as e:
+        recorder.record(sent_at, time.perf_counter() - sent_at, get_error_code(e))
+
+
+def run_fixed_concurrency(invoke, payloads, concurrency, duration):
+    """Closed loop: each of concurrency workers sends next request as soon as previous one finishes."""
+    recorder = LoadTestRecorder()
+    deadline = recorder.start + duration
+    counter = iter(range(2 ** 62))
+    counter_lock = threading.Lock()
+
+    def worker():
+        while time.perf_counter() < deadline:
+            with counter_lock:
+                index = next(counter)
+            timed_invoke(invoke, recorder, payloads[index % len(payloads)], time.perf_counter())
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return recorder
+
+
+def run_fixed_rate(invoke, payloads, rate, duration, concurrency):
+    """Open loop: requests are scheduled at fixed rate regardless of responses.
+
+    Latency is measured from scheduled send time, so queueing caused by slow
+    responses or exhausted concurrency shows up in results instead of lowering load.
+    """
+    recorder = LoadTestRecorder()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for index in range(int(rate * duration)):
+            sent_at = recorder.start + index / rate
+            delay = sent_at - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            executor.submit(timed_invoke, invoke, recorder, payloads[index % len(payloads)], sent_at)
+    return recorder
+
+
+def write_report(report, output_prefix):
+    with open(f"{output_prefix}.json", "w") as f:
+        json.dump(report, f, indent=4, allow_nan=False)
+
+    with open(f"{output_prefix}_timeline.csv", "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(report["timeline"][0]) if report["timeline"] else ["second"])
+        writer.writeheader()
+        writer.writerows(report["timeline"])
+
+
+def main():
+    parser = argparse.ArgumentParser("load_test")
+    parser.add_argument(
+        "-e", "--endpoint-name",
+        type=str,
+        dest="endpoint_name",
+        default="crayon-showcase-endpoint",
+        help="Name of AWS Sagemaker endpoint to load test."
+    ),
+    parser.add_argument(
+        "-f", "--file-path",
+        type=str,
+        dest="file_path",
+        default="sample_data.csv",
+        help="Path to CSV file with payload rows (with header row) replayed during test."
+    ),
+    parser.add_argument(
+        "-r", "--region",
+        type=str,
+        dest="region",
+        default="eu-west-1",
+        help="AWS region where endpoint is deployed."
+    ),
+    parser.add_argument(
+        "--endpoint-url",
+        type=str,
+        dest="endpoint_url",
+        default=None,
+        help="Custom sagemaker-runtime endpoint URL, e.g. local stub endpoint."
+    ),
+    parser.add_argument(
+        "--invocations-url",
+        type=str,
+        dest="invocations_url",
+        default=None,
+        help="URL of container /invocations path to post to directly instead of sagemaker-runtime."
+    ),
+    parser.add_argument(
+        "--rows-per-request",
+        type=int,
+        dest="rows_per_request",
+        default=1,
+        help="Number of payload rows sent in single request."
+    ),
+    parser.add_argument(
+        "--rate",
+        type=float,
+        dest="rate",
+        default=None,
+        help="Requests per second for fixed rate test. Fixed concurrency test is run if not set."
+    ),
+    parser.add_argument(
+        "-c", "--concurrency",
+        type=int,
+        dest="concurrency",
+        default=4,
+        help="Number of concurrent requests, upper limit for fixed rate test."
+    ),
+    parser.add_argument(
+        "-d", "--duration",
+        type=float,
+        dest="duration",
+        default=60,
+        help="Duration of test in seconds."
+    ),
+    parser.add_argument(
+        "--max-retries",
+        type=int,
+        dest="max_retries",
+        default=0,
+        help="Maximum number of retries of throttled request, throttling counts as error by default."
+    ),
+    parser.add_argument(
+        "-o", "--output-prefix",
+        type=str,
+        dest="output_prefix",
+        default="load_test_report",
+        help="Prefix of JSON report and CSV timeline files."
+    )
+    args = parser.parse_args()
+
+    payloads = [payload for payload, _ in iterate_payloads(args.file_path, args.rows_per_request)]
+    invoke = get_invoker(args)
+
+    if args.rate:
+        recorder = run_fixed_rate(invoke, payloads, args.rate, args.duration, args.concurrency)
+    else:
+        recorder = run_fixed_concurrency(invoke, payloads, args.concurrency, args.duration)
+
+    report = recorder.report({
+        "endpoint_name": args.endpoint_name,
+        "mode": "fixed_rate" if args.rate else "fixed_concurrency",
+        "rate": args.rate,
+        "concurrency": args.concurrency,
+        "duration_seconds": args.duration,
+        "rows_per_request": args.rows_per_request,
+    })
+    write_report(report, args.output_prefix)
+
+    summary = report["summary"]
+    print(
+        f"{summary['requests']} requests in {summary['duration_seconds']:.1f}s: "
+        f"{summary['throughput_rps']:.1f} successful requests/s, error rate {summary['error_rate']:.2%}, "
+        f"latency p50 {summary['latency_ms']['p50']} ms, p99 {summary['latency_ms']['p99']} ms"
+    )
+    print(f"Report written to {args.output_prefix}.json and {args.output_prefix}_timeline.csv")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,135 @@
 import argparse
 import boto3
+import collections
 import itertools
+import random
+import time
 import pandas as pd
 import sagemaker.session
+from botocore.config import Config
+from botocore.exceptions import ClientError
+from concurrent.futures import ThreadPoolExecutor
 from sagemaker.predictor import Predictor, CSVSerializer
 
+# Real-time endpoints reject payloads above 6 MB
+max_payload_bytes = 5 * 1024 * 1024
+retryable_error_codes = ("ThrottlingException", "ServiceUnavailable", "InternalFailure")
+
+
+def get_runtime_client(region, endpoint_url=None, max_pool_connections=10):
+    """Creates sagemaker-runtime client with connection pool sized for concurrent requests.
+
+    Retries are handled by invoke_endpoint, so client does not retry on its own.
+    """
+    boto_session = boto3.Session(region_name=region)
+    return boto_session.client(
+        service_name="sagemaker-runtime",
+        endpoint_url=endpoint_url,
+        config=Config(
+            max_pool_connections=max_pool_connections,
+            retries={"max_attempts": 0, "mode": "standard"}
+        )
+    )
+
+
+def invoke_endpoint(runtime_client, endpoint_name, payload, content_type="text/csv", max_retries=5, base_delay=0.1):
+    """Invokes endpoint, retrying throttled requests with exponential backoff and full jitter.
+
+    Returns response body and latency of successful attempt in seconds.
+    """
+    for attempt in itertools.count():
+        start = time.perf_counter()
+        try:
+            response = runtime_client.invoke_endpoint(
+                EndpointName=endpoint_name,
+                ContentType=content_type,
+                Accept=content_type,
+                Body=payload
+            )
+            body = response["Body"].read().decode("utf-8")
+            return body, time.perf_counter() - start
+        except ClientError as e:
+            if attempt >= max_retries or e.response["Error"]["Code"] not in retryable_error_codes:
+                raise
+            time.sleep(random.uniform(0, base_delay * 2 ** attempt))
+
+
+def iterate_payloads(file_path, rows_per_request, skip_header=True):
+    """Yields CSV payloads of up to rows_per_request rows, streaming input file line by line."""
+    with open(file_path, "r") as f:
+        if skip_header:
+            next(f, None)
+
+        lines, size = [], 0
+        for line in f:
+            if not line.strip():
+                continue
+            if lines and (len(lines) >= rows_per_request or size + len(line) > max_payload_bytes):
+                yield "".join(lines), len(lines)
+                lines, size = [], 0
+            if not line.endswith("\n"):
+                line += "\n"
+            lines.append(line)
+            size += len(line)
+        if lines:
+            yield "".join(lines), len(lines)
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return float("nan")
+    return sorted_values[min(len(sorted_values) - 1, int(round(q / 100.0 * (len(sorted_values) - 1))))]
+
+
+def predict_batch(
+    runtime_client,
+    endpoint_name,
+    file_path,
+    output_path,
+    rows_per_request=1000,
+    workers=8,
+    max_retries=5,
+    skip_header=True
+):
+    """Sends input file in chunks through bounded thread pool, writing predictions in input order.
+
+    At most 2 * workers requests are in flight, so memory does not grow with input size.
+    """
+    latencies = []
+    n_rows = 0
+    in_flight = collections.deque()
+    start = time.perf_counter()
+
+    def write_oldest(out):
+        nonlocal n_rows
+        future, payload_rows = in_flight.popleft()
+        body, latency = future.result()
+        out.write(body if body.endswith("\n") else body + "\n")
+        latencies.append(latency)
+        n_rows += payload_rows
+
+    with ThreadPoolExecutor(max_workers=workers) as executor, open(output_path, "w") as out:
+        for payload, payload_rows in iterate_payloads(file_path, rows_per_request, skip_header):
+            future = executor.submit(
+                invoke_endpoint, runtime_client, endpoint_name, payload, max_retries=max_retries
+            )
+            in_flight.append((future, payload_rows))
+            if len(in_flight) >= 2 * workers:
+                write_oldest(out)
+        while in_flight:
+            write_oldest(out)
+
+    duration = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "rows": n_rows,
+        "requests": len(latencies),
+        "duration_seconds": duration,
+        "rows_per_second": n_rows / duration if duration > 0 else float("nan"),
+        "latency_p50_ms": percentile(latencies, 50) * 1000,
+        "latency_p99_ms": percentile(latencies, 99) * 1000,
+    }
+
 
 def main():
     parser = argparse.ArgumentParser("predict")
@@ -28,9 +153,72 @@ def main():
         dest="region",
         default="eu-west-1",
         help="AWS region where endpoint is deployed."
+    ),
+    parser.add_argument(
+        "-b", "--batch",
+        action="store_true",
+        dest="batch",
+        help="Stream file to endpoint in chunks sent concurrently, instead of single request."
+    ),
+    parser.add_argument(
+        "-o", "--output-path",
+        type=str,
+        dest="output_path",
+        default="predictions.csv",
+        help="Path to CSV file where batch mode writes predictions, in order of input rows."
+    ),
+    parser.add_argument(
+        "--rows-per-request",
+        type=int,
+        dest="rows_per_request",
+        default=1000,
+        help="Maximum number of rows sent in single request in batch mode."
+    ),
+    parser.add_argument(
+        "--workers",
+        type=int,
+        dest="workers",
+        default=8,
+        help="Number of concurrent requests in batch mode."
+    ),
+    parser.add_argument(
+        "--max-retries",
+        type=int,
+        dest="max_retries",
+        default=5,
+        help="Maximum number of retries of throttled request in batch mode."
+    ),
+    parser.add_argument(
+        "--endpoint-url",
+        type=str,
+        dest="endpoint_url",
+        default=None,
+        help="Custom sagemaker-runtime endpoint URL in batch mode, e.g. local stub endpoint."
     )
     args = parser.parse_args()
 
+    if args.batch:
+        runtime_client = get_runtime_client(
+            region=args.region,
+            endpoint_url=args.endpoint_url,
+            max_pool_connections=args.workers
+        )
+        stats = predict_batch(
+            runtime_client=runtime_client,
+            endpoint_name=args.endpoint_name,
+            file_path=args.file_path,
+            output_path=args.output_path,
+            rows_per_request=args.rows_per_request,
+            workers=args.workers,
+            max_retries=args.max_retries
+        )
+        print(
+            f"Predicted {stats['rows']} rows in {stats['requests']} requests in {stats['duration_seconds']:.2f}s: "
+            f"{stats['rows_per_second']:.1f} rows/s, latency p50 {stats['latency_p50_ms']:.1f} ms, "
+            f"p99 {stats['latency_p99_ms']:.1f} ms"
+        )
+        return
+
     boto_session = boto3.Session(region_name=args.region)
     sagemaker_client = boto_session.client(service_name="sagemaker")
     sagemaker_runtime_client = boto_session.client(
@@ -48,7 +236,7 @@ def main():
         serializer=CSVSerializer()
     )
 
-    prediction_data = pd.read_csv(args.file_path, header=1)
+    prediction_data = pd.read_csv(args.file_path, header=0)
     print(predictor.predict(prediction_data.values).decode('utf-8'))
 
 
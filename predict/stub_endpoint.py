@@ -0,0 +1,131 @@
+import argparse
+import json
+import random
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubEndpointHandler(BaseHTTPRequestHandler):
+    """Local stand-in for SageMaker endpoint, answering one prediction per CSV row.
+
+    Serves both container contract (`POST /invocations`, `GET /ping`) and
+    SageMaker runtime API path (`POST /endpoints/<name>/invocations`), so it can
+    be targeted directly or through boto3 client with custom endpoint URL.
+    Prediction of each row is sum of its numeric values, which makes row order
+    of responses verifiable.
+    """
+
+    protocol_version = "HTTP/1.1"
+    # Headers and body are written separately, avoid delayed ACK stalls on keep-alive connections
+    disable_nagle_algorithm = True
+    latency_ms = 0.0
+    error_rate = 0.0
+    throttle_rate = 0.0
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_body(self, status, body, content_type="text/csv", headers=None):
+        body = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_error_body(self, status, error_type, message):
+        self.send_body(
+            status,
+            json.dumps({"message": message}),
+            content_type="application/json",
+            headers={"x-amzn-ErrorType": error_type}
+        )
+
+    def do_GET(self):
+        if self.path == "/ping":
+            self.send_body(200, "")
+        else:
+            self.send_error_body(404, "ValidationError", f"Unknown path {self.path}")
+
+    def do_POST(self):
+        payload = self.rfile.read(int(self.headers.get("Content-Length", 0))).decode("utf-8")
+        if not (self.path == "/invocations" or self.path.endswith("/invocations")):
+            self.send_error_body(404, "ValidationError", f"Unknown path {self.path}")
+            return
+
+        if self.latency_ms > 0:
+            time.sleep(self.latency_ms / 1000.0)
+        if random.random() < self.throttle_rate:
+            self.send_error_body(429, "ThrottlingException", "Rate exceeded")
+            return
+        if random.random() < self.error_rate:
+            self.send_error_body(500, "InternalFailure", "Simulated model error")
+            return
+
+        predictions = []
+        for line in payload.splitlines():
+            if not line.strip():
+                continue
+            total = 0.0
+            for value in line.split(","):
+                try:
+                    total += float(value)
+                except ValueError:
+                    pass
+            predictions.append(repr(total))
+        self.send_body(200, "\n".join(predictions) + "\n")
+
+
+def get_server(port, latency_ms=0.0, error_rate=0.0, throttle_rate=0.0):
+    handler = type(
+        "ConfiguredStubEndpointHandler",
+        (StubEndpointHandler,),
+        {"latency_ms": latency_ms, "error_rate": error_rate, "throttle_rate": throttle_rate}
+    )
+    return ThreadingHTTPServer(("127.0.0.1", port), handler)
+
+
+def main():
+    parser = argparse.ArgumentParser("stub_endpoint")
+    parser.add_argument(
+        "-p", "--port",
+        type=int,
+        dest="port",
+        default=8080,
+        help="Local port to listen on."
+    ),
+    parser.add_argument(
+        "--latency-ms",
+        type=float,
+        dest="latency_ms",
+        default=0.0,
+        help="Simulated model latency of each invocation in milliseconds."
+    ),
+    parser.add_argument(
+        "--error-rate",
+        type=float,
+        dest="error_rate",
+        default=0.0,
+        help="Fraction of invocations failing with model error."
+    ),
+    parser.add_argument(
+        "--throttle-rate",
+        type=float,
+        dest="throttle_rate",
+        default=0.0,
+        help="Fraction of invocations rejected with ThrottlingException."
+    )
+    args = parser.parse_args()
+
+    server = get_server(args.port, args.latency_ms, args.error_rate, args.throttle_rate)
+    print(f"Stub endpoint listening on http://127.0.0.1:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()